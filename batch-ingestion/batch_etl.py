@@ -0,0 +1,586 @@
+# batch_etl.py - Les Caves d'Albert
+# Batch ETL SQLite → Snowflake (BATCH_DATA), the Pipeline.ipynb steps as an importable module
+#
+# The sales table is read in rowid ranges by a process pool. Each worker reads its range,
+# joins it with the cleaned inventory and the customers (small dimension tables, read once
+# and shipped to every worker at start-up) and hands the FACT_SALES rows back, to be
+# appended to STG_FACT_SALES while the next ranges are being read: only a few chunks are
+# in memory at any time. Wall time and peak RSS are reported per stage
+# (resource.getrusage, Linux/macOS only).
+#
+# With --incremental, a local state store (batch_state.py) keeps a high-water mark of
+# sales (max rowid or sale date) and row hashes of the dimensions: each run only
+# extracts, transforms and MERGEs the sales after the mark, the changed dimension rows and
+# the sales of the customers / products whose joined columns changed.
+#
+# Usage:
+#   python batch_etl.py --db test_data/wine_data.db
+#   python batch_etl.py --db test_data/wine_data.db --workers 8 --chunk-rows 200000
+#   python batch_etl.py --db test_data/wine_data.db --no-load    # extract + transform only
+#   python batch_etl.py --db test_data/wine_data.db --incremental                # daily runs
+#   python batch_etl.py --db test_data/wine_data.db --incremental --full         # reload, reset the marks
+
+import os
+import sys
+import time
+import logging
+import sqlite3
+import argparse
+import resource
+import multiprocessing
+from pathlib import Path
+from contextlib import closing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import pandas as pd
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, text, bindparam
+from batch_state import BatchState, row_hashes, boundary_hash
+
+try:
+    from snowflake.sqlalchemy import URL
+except ImportError:  # --no-load runs (extraction and transform profiling) work without the connector
+    URL = None
+
+VALID_BOTTLE_SIZES = [0.375, 0.5, 0.75, 1.0, 1.5]
+FACT_TABLE_NAME = 'FACT_SALES'
+STAGING_TABLE_NAME = 'STG_FACT_SALES'
+FACT_COLUMNS = {
+    'ORDER_ID': 'INTEGER',
+    'TXN_DATE': 'DATE',
+    'TXN_TIMESTAMP': 'TIMESTAMP_NTZ',
+    'PRODUCT_ID': 'INTEGER',
+    'CUSTOMER_ID': 'INTEGER',
+    'NET_REVENUE': 'FLOAT',
+    'GROSS_MARGIN': 'FLOAT',
+    'CUSTOMER_CITY': 'VARCHAR',
+    'PRODUCT_CATEGORY': 'VARCHAR',
+    'ACQUISITION_CHANNEL': 'VARCHAR',
+}
+# Staging also keeps the sale's SQLite rowid: the MERGE de-duplication tie-breaker (not loaded into FACT_SALES)
+STAGING_COLUMNS = dict(FACT_COLUMNS, SOURCE_ROWID='INTEGER')
+# Dimension columns the sales join needs: only these are broadcast to the workers
+INVENTORY_JOIN_COLUMNS = ['product_id', 'product_name', 'category', 'unit_price']
+CUSTOMER_JOIN_COLUMNS = ['customer_id', 'city', 'channel']
+# Sales high-water mark: 'rowid' (append-only table) or 'sold_at' (rows may be rewritten;
+# index sales(sold_at) in the source for the lookups to stay cheap)
+WATERMARK_COLUMNS = ('rowid', 'sold_at')
+DIMENSION_KEYS = {'DIM_CUSTOMERS': 'customer_id', 'DIM_INVENTORY': 'product_id'}
+# Dimension keys per re-extraction query of their sales (below SQLite's 999 bound parameters)
+KEY_CHUNK = 500
+
+
+def peak_rss_mb():
+    """High-water mark of this process' resident set size, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024  # bytes on macOS, KB on Linux
+
+
+class StageReport:
+    """
+    Wall time, rows and peak RSS of each pipeline stage. Peak RSS is a process
+    high-water mark: a stage that stays below an earlier peak shows no growth.
+    Stages run by the workers report the summed worker time and the largest worker peak.
+    """
+
+    def __init__(self):
+        self.stages = []  # (name, seconds, rows, peak_rss_mb, rss_growth_mb)
+        self.started = time.perf_counter()
+
+    def add(self, name, seconds, rows, peak_mb, growth_mb=None):
+        self.stages.append((name, seconds, rows, peak_mb, growth_mb))
+
+    def timed(self, name):
+        return _TimedStage(self, name)
+
+    def log(self):
+        logging.info(f"{'stage':<28}{'seconds':>10}{'rows':>12}{'peak RSS MB':>14}{'RSS growth MB':>15}")
+        for name, seconds, rows, peak_mb, growth_mb in self.stages:
+            growth = '' if growth_mb is None else f"{growth_mb:.1f}"
+            logging.info(f"{name:<28}{seconds:>10.2f}{rows:>12,}{peak_mb:>14.1f}{growth:>15}")
+        logging.info(f"{'total (wall)':<28}{time.perf_counter() - self.started:>10.2f}")
+
+
+class _TimedStage:
+    """Context manager timing one stage run in this process; set `rows` before leaving it."""
+
+    def __init__(self, report, name):
+        self.report = report
+        self.name = name
+        self.rows = 0
+
+    def __enter__(self):
+        self._rss_before = peak_rss_mb()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            peak = peak_rss_mb()
+            self.report.add(self.name, time.perf_counter() - self._started, self.rows, peak, peak - self._rss_before)
+        return False
+
+
+# --- EXTRACT ---
+
+def connect_sqlite(db_path):
+    """Read-only connection: several workers read the source at once."""
+    return sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+
+
+def read_table(db_path, table):
+    with closing(connect_sqlite(db_path)) as conn:
+        return pd.read_sql_query(f"SELECT * FROM {table}", conn)
+
+
+def rowid_ranges(db_path, table, chunk_rows, low=None, high=None):
+    """
+    Half-open [low, high) rowid ranges of at most `chunk_rows` rows covering rowids
+    `low` to `high` included (the whole table by default).
+    """
+    if low is None or high is None:
+        with closing(connect_sqlite(db_path)) as conn:
+            first, last = conn.execute(f"SELECT MIN(rowid), MAX(rowid) FROM {table}").fetchone()
+        low = first if low is None else low
+        high = last if high is None else high
+    if low is None or high is None or low > high:
+        return []
+    return [(start, min(start + chunk_rows, high + 1)) for start in range(low, high + 1, chunk_rows)]
+
+
+def read_rowid_range(conn, table, low, high, since_column=None, since=None):
+    # rowid is the table's B-tree key: each range is a direct seek, not a scan of the earlier rows
+    sql, params = f"SELECT rowid AS source_rowid, * FROM {table} WHERE rowid >= ? AND rowid < ?", (low, high)
+    if since_column is not None:
+        sql, params = f"{sql} AND {since_column} >= ?", params + (since,)
+    return pd.read_sql_query(sql, conn, params=params)
+
+
+def read_keyed_sales(conn, table, column, keys):
+    # Index sales(customer_id) / sales(product_id) in the source: each query is then a seek per key
+    placeholders = ", ".join("?" * len(keys))
+    return pd.read_sql_query(f"SELECT rowid AS source_rowid, * FROM {table} WHERE {column} IN ({placeholders})",
+                             conn, params=list(keys))
+
+
+def plan_sales(db_path, mark, column, chunk_rows):
+    """
+    Rowid ranges of the sales to extract given the previous high-water `mark`.
+    Returns (ranges, since, new mark, reason): `since` filters the ranges on the sold_at
+    mark; `reason` says why everything is read again (None for an increment).
+    """
+    with closing(connect_sqlite(db_path)) as conn:
+        low, high = conn.execute("SELECT MIN(rowid), MAX(rowid) FROM sales").fetchone()
+        if high is None:
+            return [], None, mark, None
+        if column == 'rowid':
+            boundary = conn.execute("SELECT * FROM sales WHERE rowid = ?", (high,)).fetchone()
+            new_mark = {'column': 'rowid', 'value': high, 'boundary': boundary_hash(boundary)}
+        else:
+            new_mark = {'column': 'sold_at', 'value': conn.execute("SELECT MAX(sold_at) FROM sales").fetchone()[0]}
+
+        full_reason = None
+        if mark is None:
+            full_reason = "no high-water mark yet"
+        elif mark['column'] != column:
+            full_reason = f"high-water mark was on {mark['column']}"
+        if full_reason is not None:
+            return rowid_ranges(db_path, 'sales', chunk_rows, low, high), None, new_mark, full_reason
+
+        if column == 'rowid':
+            # The generator replaces the table (to_sql if_exists='replace'): rowids start over
+            previous = conn.execute("SELECT * FROM sales WHERE rowid = ?", (mark['value'],)).fetchone()
+            if previous is None or boundary_hash(previous) != mark['boundary']:
+                return (rowid_ranges(db_path, 'sales', chunk_rows, low, high), None, new_mark,
+                        "sales rewritten since the last run (row at the mark changed)")
+            return rowid_ranges(db_path, 'sales', chunk_rows, mark['value'] + 1, high), None, new_mark, None
+
+        # sold_at: rows at the mark itself are read again (same second, inserted later), the MERGE dedups them
+        first = conn.execute("SELECT MIN(rowid) FROM sales WHERE sold_at >= ?", (mark['value'],)).fetchone()[0]
+        if first is None:
+            return [], None, mark, None
+        return rowid_ranges(db_path, 'sales', chunk_rows, first, high), mark['value'], new_mark, None
+
+
+def diff_dimension(previous, loaded, joined, key, join_columns):
+    """
+    Compares a dimension with its state from the previous run.
+
+    `loaded` holds the rows written to the DIM table, `joined` the rows hashed on the
+    columns the sales join reads. Returns (changed rows of `loaded`, removed keys,
+    keys whose joined columns changed, appeared or disappeared, new state). A new key
+    counts as a join change: an earlier sale referencing it was dropped by the inner
+    join and only re-extracting that key's sales picks it up.
+    """
+    rows = row_hashes(loaded, key)
+    joins = row_hashes(joined, key, join_columns)
+    new_state = {'rows': rows, 'join': joins}
+    if previous is None:
+        return loaded, [], [], new_state
+    old_rows, old_joins = dict(map(tuple, previous['rows'])), dict(map(tuple, previous['join']))
+    current_rows, current_joins = dict(rows), dict(joins)
+    changed = loaded[[old_rows.get(k) != h for k, h in rows]]
+    removed = [k for k in old_rows if k not in current_rows]
+    join_changed = [k for k, h in old_joins.items() if current_joins.get(k) != h]
+    join_changed += [k for k in current_joins if k not in old_joins]
+    return changed, removed, join_changed, new_state
+
+
+# --- TRANSFORM ---
+
+def clean_inventory(inventory):
+    """Drops the intentional errors of the generator (negative stock, invalid price or bottle size)."""
+    return inventory[
+        (inventory['stock_quantity'] >= 0)
+        & (inventory['unit_price'] > 0)
+        & inventory['bottle_size_l'].isin(VALID_BOTTLE_SIZES)
+    ].copy()
+
+
+def transform_sales(sales, inventory_clean, customers):
+    """
+    STG_FACT_SALES rows of a sales chunk (read by read_rowid_range, with its rowid):
+    inner joins with the clean inventory and the customers (referential integrity),
+    revenue and margin metrics, Snowflake column names.
+    """
+    fact = sales.merge(inventory_clean[INVENTORY_JOIN_COLUMNS], on='product_id', how='inner',
+                       suffixes=('_sale', '_base'))
+    fact = fact.merge(customers[CUSTOMER_JOIN_COLUMNS], on='customer_id', how='inner')
+
+    total_price = fact['unit_price_sale'] * fact['quantity']
+    net_revenue = total_price - total_price * (fact['discount'] / 100)
+    cost_of_goods = fact['unit_price_base'] * fact['quantity']
+    txn_timestamp = pd.to_datetime(fact['sold_at'])
+
+    return pd.DataFrame({
+        'ORDER_ID': fact['order_id'],
+        'TXN_DATE': txn_timestamp.dt.date,
+        'TXN_TIMESTAMP': txn_timestamp,
+        'PRODUCT_ID': fact['product_id'],
+        'CUSTOMER_ID': fact['customer_id'],
+        'NET_REVENUE': net_revenue,
+        'GROSS_MARGIN': net_revenue - cost_of_goods,
+        'CUSTOMER_CITY': fact['city'],
+        'PRODUCT_CATEGORY': fact['category'],
+        'ACQUISITION_CHANNEL': fact['channel'],
+        'SOURCE_ROWID': fact['source_rowid'],
+    }, columns=list(STAGING_COLUMNS))
+
+
+# --- WORKERS ---
+
+_worker = {}  # per-process state set by _init_worker: SQLite connection and broadcast dimensions
+
+
+def _init_worker(db_path, inventory_clean, customers):
+    _worker['conn'] = connect_sqlite(db_path)
+    _worker['inventory'] = inventory_clean
+    _worker['customers'] = customers
+
+
+def _process_range(low, high, since_column=None, since=None):
+    """Extracts and transforms one rowid range. Returns (fact, rows read, extract s, transform s, peak RSS MB)."""
+    started = time.perf_counter()
+    sales = read_rowid_range(_worker['conn'], 'sales', low, high, since_column, since)
+    extracted = time.perf_counter()
+    fact = transform_sales(sales, _worker['inventory'], _worker['customers'])
+    return fact, len(sales), extracted - started, time.perf_counter() - extracted, peak_rss_mb()
+
+
+def _process_keys(column, keys):
+    """Extracts and transforms the sales whose `column` is one of `keys`. Same result as _process_range."""
+    started = time.perf_counter()
+    sales = read_keyed_sales(_worker['conn'], 'sales', column, keys)
+    extracted = time.perf_counter()
+    fact = transform_sales(sales, _worker['inventory'], _worker['customers'])
+    return fact, len(sales), extracted - started, time.perf_counter() - extracted, peak_rss_mb()
+
+
+def iter_fact_chunks(db_path, inventory_clean, customers, report, workers=None, chunk_rows=100_000,
+                     ranges=None, since_column=None, since=None, keys=None):
+    """
+    Yields the FACT_SALES chunks of the sales rowid `ranges` (the whole table by
+    default), in completion order. With `since_column`, only rows whose column is at
+    or after `since` are kept. `keys` ({sales column: keys}) adds every sale whose
+    column holds one of the keys, whatever its rowid, in chunks of KEY_CHUNK keys.
+
+    At most two ranges per worker are in flight, so memory stays bounded whatever the
+    table size; the caller loads each chunk while the workers read the next ones.
+    Worker extract / transform times are added to `report` once the table is done.
+    """
+    workers = workers or os.cpu_count() or 1
+    ranges = rowid_ranges(db_path, 'sales', chunk_rows) if ranges is None else ranges
+    tasks = iter([(_process_range, (*rng, since_column, since)) for rng in ranges]
+                 + [(_process_keys, (column, values[start:start + KEY_CHUNK]))
+                    for column, values in (keys or {}).items() for start in range(0, len(values), KEY_CHUNK)])
+    totals = {'rows': 0, 'fact_rows': 0, 'extract': 0.0, 'transform': 0.0, 'peak': 0.0}
+    # spawn: workers start clean, without the parent's open Snowflake connection
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker,
+                             initargs=(db_path, inventory_clean[INVENTORY_JOIN_COLUMNS],
+                                       customers[CUSTOMER_JOIN_COLUMNS])) as pool:
+        pending = {pool.submit(task, *args) for _, (task, args) in zip(range(workers * 2), tasks)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                fact, rows, extract_seconds, transform_seconds, worker_peak = future.result()
+                totals['rows'] += rows
+                totals['fact_rows'] += len(fact)
+                totals['extract'] += extract_seconds
+                totals['transform'] += transform_seconds
+                totals['peak'] = max(totals['peak'], worker_peak)
+                next_task = next(tasks, None)
+                if next_task is not None:
+                    pending.add(pool.submit(next_task[0], *next_task[1]))
+                yield fact
+    report.add('extract sales (Σ workers)', totals['extract'], totals['rows'], totals['peak'])
+    report.add('transform sales (Σ workers)', totals['transform'], totals['fact_rows'], totals['peak'])
+
+
+# --- LOAD ---
+
+def snowflake_engine():
+    if URL is None:
+        raise RuntimeError("snowflake-sqlalchemy is not installed (pip install snowflake-sqlalchemy), "
+                           "or run with --no-load")
+    return create_engine(URL(
+        account=os.getenv('SNOWFLAKE_ACCOUNT'),
+        user=os.getenv('SNOWFLAKE_USER'),
+        password=os.getenv('SNOWFLAKE_PASSWORD'),
+        database=os.getenv('SNOWFLAKE_DATABASE'),
+        warehouse=os.getenv('SNOWFLAKE_WAREHOUSE'),
+    ))
+
+
+def prepare_schema(conn, database, schema):
+    conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {database}.{schema};"))
+    conn.execute(text(f"USE SCHEMA {database}.{schema};"))
+
+
+def prepare_staging(conn, schema):
+    for table_name, table_columns, create in ((STAGING_TABLE_NAME, STAGING_COLUMNS, "CREATE OR REPLACE TABLE"),
+                                              (FACT_TABLE_NAME, FACT_COLUMNS, "CREATE TABLE IF NOT EXISTS")):
+        columns = ",\n".join(f"    {name} {sql_type}" for name, sql_type in table_columns.items())
+        conn.execute(text(f"{create} {schema}.{table_name} (\n{columns}\n);"))
+
+
+def append_staging(conn, schema, fact):
+    fact.to_sql(STAGING_TABLE_NAME, con=conn, schema=schema, if_exists='append', index=False, chunksize=16000)
+
+
+def merge_staging(conn, schema, full=False, keys=None):
+    """
+    MERGE STG_FACT_SALES into FACT_SALES. Chunks are appended as they come, so the
+    (ORDER_ID, PRODUCT_ID) de-duplication (latest TXN_TIMESTAMP, then latest SQLite
+    rowid on ties, wins) happens here.
+    With full=True the staging table holds every sale, so the FACT_SALES rows missing
+    from it (e.g. their product left the clean inventory) are deleted first. `keys`
+    ({sales column: keys}) narrows that to the rows of those customers / products,
+    whose sales were all re-extracted into staging.
+    """
+    scopes = {column: list(values) for column, values in (keys or {}).items() if values}
+    if full or scopes:
+        where, params = "", {}
+        if not full:
+            where = "(" + " OR ".join(f"target.{column.upper()} IN :{column}" for column in scopes) + ") AND "
+            params = scopes
+        delete = text(f"""
+            DELETE FROM {schema}.{FACT_TABLE_NAME} AS target
+            WHERE {where}NOT EXISTS (
+                SELECT 1 FROM {schema}.{STAGING_TABLE_NAME} AS staging
+                WHERE staging.ORDER_ID = target.ORDER_ID AND staging.PRODUCT_ID = target.PRODUCT_ID
+            );
+        """).bindparams(*(bindparam(column, expanding=True) for column in params))
+        deleted = conn.execute(delete, params).rowcount
+        logging.info(f"   -> {deleted} {FACT_TABLE_NAME} row(s) no longer in the source removed")
+    conn.execute(text(f"""
+        MERGE INTO {schema}.{FACT_TABLE_NAME} AS target
+        USING (
+            SELECT * FROM {schema}.{STAGING_TABLE_NAME}
+            QUALIFY ROW_NUMBER() OVER (
+                PARTITION BY ORDER_ID, PRODUCT_ID ORDER BY TXN_TIMESTAMP DESC, SOURCE_ROWID DESC
+            ) = 1
+        ) AS staging
+        ON target.ORDER_ID = staging.ORDER_ID AND target.PRODUCT_ID = staging.PRODUCT_ID
+        WHEN MATCHED THEN
+            UPDATE SET
+                target.TXN_DATE = staging.TXN_DATE,
+                target.TXN_TIMESTAMP = staging.TXN_TIMESTAMP,
+                target.CUSTOMER_ID = staging.CUSTOMER_ID,
+                target.NET_REVENUE = staging.NET_REVENUE,
+                target.GROSS_MARGIN = staging.GROSS_MARGIN,
+                target.CUSTOMER_CITY = staging.CUSTOMER_CITY,
+                target.PRODUCT_CATEGORY = staging.PRODUCT_CATEGORY,
+                target.ACQUISITION_CHANNEL = staging.ACQUISITION_CHANNEL
+        WHEN NOT MATCHED THEN
+            INSERT (ORDER_ID, TXN_DATE, TXN_TIMESTAMP, PRODUCT_ID, CUSTOMER_ID, NET_REVENUE,
+                    GROSS_MARGIN, CUSTOMER_CITY, PRODUCT_CATEGORY, ACQUISITION_CHANNEL)
+            VALUES (staging.ORDER_ID, staging.TXN_DATE, staging.TXN_TIMESTAMP, staging.PRODUCT_ID,
+                    staging.CUSTOMER_ID, staging.NET_REVENUE, staging.GROSS_MARGIN, staging.CUSTOMER_CITY,
+                    staging.PRODUCT_CATEGORY, staging.ACQUISITION_CHANNEL);
+    """))
+    conn.execute(text(f"DROP TABLE {schema}.{STAGING_TABLE_NAME};"))
+
+
+def load_dimensions(conn, schema, dimensions):
+    """Drop and create: DIM_CUSTOMERS / DIM_INVENTORY are small and fully re-extracted each run."""
+    for table_name, df in dimensions.items():
+        df = df.rename(columns=str.upper)
+        conn.execute(text(f"DROP TABLE IF EXISTS {schema}.{table_name};"))
+        df.to_sql(table_name, con=conn, schema=schema, if_exists='fail', index=False, chunksize=16000)
+        logging.info(f"   ✅ Table {table_name} loaded ({len(df)} rows)")
+
+
+def merge_dimension(conn, schema, table_name, key, changed, removed_keys):
+    """Upserts the changed rows of a dimension (through STG_<table>) and deletes its removed keys."""
+    df = changed.rename(columns=str.upper)
+    key = key.upper()
+    if not df.empty:
+        staging = f"STG_{table_name}"
+        conn.execute(text(f"DROP TABLE IF EXISTS {schema}.{staging};"))
+        df.to_sql(staging, con=conn, schema=schema, if_exists='fail', index=False, chunksize=16000)
+        columns = list(df.columns)
+        conn.execute(text(f"""
+            MERGE INTO {schema}.{table_name} AS target
+            USING {schema}.{staging} AS staging
+            ON target.{key} = staging.{key}
+            WHEN MATCHED THEN
+                UPDATE SET {", ".join(f"target.{c} = staging.{c}" for c in columns if c != key)}
+            WHEN NOT MATCHED THEN
+                INSERT ({", ".join(columns)})
+                VALUES ({", ".join(f"staging.{c}" for c in columns)});
+        """))
+        conn.execute(text(f"DROP TABLE {schema}.{staging};"))
+    if removed_keys:
+        conn.execute(text(f"DELETE FROM {schema}.{table_name} WHERE {key} IN :keys")
+                     .bindparams(bindparam('keys', expanding=True)), {'keys': list(removed_keys)})
+    logging.info(f"   ✅ Table {table_name}: {len(df)} row(s) upserted, {len(removed_keys)} removed")
+
+
+# --- PIPELINE ---
+
+def run_pipeline(db_path, database=None, schema=None, workers=None, chunk_rows=100_000, load=True,
+                 state=None, watermark='rowid'):
+    """
+    Runs the batch ETL and returns its StageReport. With load=False, nothing is written
+    to Snowflake. With a BatchState, only the sales after its high-water mark and the
+    changed dimension rows are loaded, and the state is saved once Snowflake has committed.
+    The sales of customers / products whose joined columns changed (or that appeared) are
+    re-extracted by key into the same staging table, so FACT_SALES still matches a full load.
+    """
+    report = StageReport()
+    with report.timed('extract dimensions') as stage:
+        customers = read_table(db_path, 'customers')
+        inventory = read_table(db_path, 'inventory')
+        stage.rows = len(customers) + len(inventory)
+    with report.timed('clean inventory') as stage:
+        inventory_clean = clean_inventory(inventory)
+        stage.rows = len(inventory_clean)
+    logging.info(f"Inventory: {len(inventory) - len(inventory_clean)} rows removed due to quality issues.")
+
+    dimensions = {'DIM_CUSTOMERS': customers, 'DIM_INVENTORY': inventory_clean}
+    ranges, since, sales_mark, reason, dimension_changes, keys = None, None, None, None, {}, {}
+    if state is not None:
+        with report.timed('plan increment') as stage:
+            # Inventory is hashed before cleaning, with the clean flag: a product leaving or
+            # re-entering the clean set changes which sales join
+            flagged = inventory.assign(is_clean=inventory['product_id'].isin(inventory_clean['product_id']))
+            for table_name, joined, join_columns in (
+                ('DIM_CUSTOMERS', customers, CUSTOMER_JOIN_COLUMNS),
+                ('DIM_INVENTORY', flagged, INVENTORY_JOIN_COLUMNS + ['is_clean']),
+            ):
+                dimension_changes[table_name] = diff_dimension(
+                    state.get(table_name), dimensions[table_name], joined, DIMENSION_KEYS[table_name], join_columns)
+            ranges, since, sales_mark, reason = plan_sales(db_path, state.get('sales'), watermark, chunk_rows)
+            if reason is None:
+                keys = {DIMENSION_KEYS[table_name]: changes[2]
+                        for table_name, changes in dimension_changes.items() if changes[2]}
+            stage.rows = sum(high - low for low, high in ranges)
+        if reason is not None:
+            logging.info(f"🔁 Full sales reload: {reason}")
+        else:
+            logging.info(f"➕ Incremental sales load: rowids {ranges[0][0]}-{ranges[-1][1] - 1}" if ranges
+                         else "➕ No new sales since the last run")
+            for column, values in keys.items():
+                logging.info(f"🎯 Re-extracting the sales of {len(values)} {column} key(s) read by the join "
+                             f"that changed or appeared")
+
+    chunks = iter_fact_chunks(db_path, inventory_clean, customers, report, workers, chunk_rows,
+                              ranges, 'sold_at' if since is not None else None, since, keys)
+    if not load:
+        fact_rows = sum(len(fact) for fact in chunks)
+        logging.info(f"🧪 {fact_rows:,} FACT_SALES rows transformed (--no-load: nothing written)")
+        return report
+
+    engine = snowflake_engine()
+    with engine.begin() as conn:
+        prepare_schema(conn, database, schema)
+        if ranges != [] or keys:
+            prepare_staging(conn, schema)
+            load_seconds, staged_rows = 0.0, 0
+            for fact in chunks:
+                started = time.perf_counter()
+                append_staging(conn, schema, fact)
+                load_seconds += time.perf_counter() - started
+                staged_rows += len(fact)
+            report.add(f'load {STAGING_TABLE_NAME}', load_seconds, staged_rows, peak_rss_mb())
+            logging.info(f"   -> Loaded {staged_rows:,} rows into {schema}.{STAGING_TABLE_NAME}")
+            with report.timed(f'merge {FACT_TABLE_NAME}') as stage:
+                # Every sale was extracted (no state, or a full reload): FACT_SALES is made to match it
+                merge_staging(conn, schema, full=state is None or reason is not None, keys=keys)
+                stage.rows = staged_rows
+        with report.timed('load dimensions') as stage:
+            for table_name, df in dimensions.items():
+                changes = dimension_changes.get(table_name)
+                if changes is None or state.get(table_name) is None:
+                    load_dimensions(conn, schema, {table_name: df})
+                    stage.rows += len(df)
+                else:
+                    changed, removed, _, _ = changes
+                    if not changed.empty or removed:
+                        merge_dimension(conn, schema, table_name, DIMENSION_KEYS[table_name], changed, removed)
+                    stage.rows += len(changed) + len(removed)
+    if state is not None:
+        if sales_mark is not None:
+            state.set('sales', **sales_mark)
+        for table_name, (_, _, _, table_state) in dimension_changes.items():
+            state.set(table_name, **table_state)
+        state.save()
+        logging.info(f"💾 High-water marks saved to {state.path}")
+    logging.info("🎉 ETL Batch Pipeline (avec MERGE) Complété avec Succès !")
+    return report
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Batch ETL of the Les Caves d'Albert SQLite data into Snowflake")
+    parser.add_argument("--db", default=os.getenv('DB_PATH'), help="SQLite database (default: DB_PATH)")
+    parser.add_argument("--schema", default=os.getenv('SNOWFLAKE_SCHEMA'), help="Target schema (default: SNOWFLAKE_SCHEMA)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Extraction processes")
+    parser.add_argument("--chunk-rows", type=int, default=100_000, help="Sales rowids per chunk")
+    parser.add_argument("--no-load", action="store_true", help="Extract and transform only, write nothing")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only load the sales after the high-water mark and the changed dimension rows")
+    parser.add_argument("--state", default=os.getenv('BATCH_STATE_PATH', 'batch_state.json'),
+                        help="State store of the high-water marks (with --incremental)")
+    parser.add_argument("--watermark", default=os.getenv('BATCH_WATERMARK', 'rowid'), choices=WATERMARK_COLUMNS,
+                        help="Sales high-water mark column (with --incremental)")
+    parser.add_argument("--full", action="store_true", help="With --incremental: reload everything, reset the marks")
+    args = parser.parse_args()
+    if not args.db:
+        parser.error("--db or DB_PATH is required")
+    if not args.no_load and not args.schema:
+        parser.error("--schema or SNOWFLAKE_SCHEMA is required (or --no-load)")
+
+    state = None
+    if args.incremental:
+        state = BatchState(args.state, args.db)
+        if args.full:
+            state.reset()
+    report = run_pipeline(args.db, os.getenv('SNOWFLAKE_DATABASE'), args.schema, args.workers,
+                          args.chunk_rows, load=not args.no_load, state=state, watermark=args.watermark)
+    report.log()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# batch_state.py - Les Caves d'Albert
+# Local state store of the incremental batch ETL: per-table high-water marks and dimension row hashes
+
+import os
+import json
+import hashlib
+from pathlib import Path
+from datetime import datetime, timezone
+import pandas as pd
+
+
+def row_hashes(df, key, columns=None):
+    """[(key, hash)] of each row of `df`, hashed on `columns` (all columns by default)."""
+    hashes = pd.util.hash_pandas_object(df[columns] if columns else df, index=False)
+    return list(zip(df[key].tolist(), hashes.astype(str).tolist()))
+
+
+def boundary_hash(row):
+    """Stable hash of one SQLite row (tuple), to recognise the row a rowid mark points to."""
+    return hashlib.sha1(repr(tuple(row)).encode("utf-8")).hexdigest()
+
+
+class BatchState:
+    """
+    High-water marks of one SQLite source, kept in a small JSON file between batch runs.
+
+    The file holds one entry per source database (resolved path), so several sources
+    can share it. Nothing is written until save(), which the pipeline only calls once
+    Snowflake has committed: a failed run leaves the previous marks in place and the
+    next run extracts the same rows again, which the MERGEs make harmless.
+    """
+
+    def __init__(self, path, source):
+        self.path = path
+        self.source = str(Path(source).resolve())
+        self.tables = self._read().get(self.source, {})
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def get(self, table):
+        return self.tables.get(table)
+
+    def set(self, table, **fields):
+        self.tables[table] = dict(fields, updated_at=datetime.now(timezone.utc).isoformat())
+
+    def reset(self):
+        """Forgets every mark of this source: the next run reloads everything."""
+        self.tables = {}
+
+    def save(self):
+        """Atomically replaces the file (other sources' entries are kept)."""
+        state = self._read()
+        state[self.source] = self.tables
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f, indent=1, default=str)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
@@ -50,8 +50,8 @@ SELECT
     PRODUCT_CATEGORY,
     COUNT(DISTINCT PRODUCT_ID) AS PRODUCT_COUNT,
     SUM(CURRENT_STOCK_LEVEL) AS TOTAL_STOCK,
-    AVG(CURRENT_STOCK_LEVEL) AS AVG_STOCK_PER_PRODUCT,
-    MIN(CURRENT_STOCK_LEVEL) AS MIN_STOCK,
+    SUM(CURRENT_STOCK_LEVEL) / COUNT(DISTINCT PRODUCT_ID) AS AVG_STOCK_PER_PRODUCT,
+    MIN(CURRENT_STOCK_LEVEL) AS MIN_STOCK,  -- par produit × entrepôt
     MAX(CURRENT_STOCK_LEVEL) AS MAX_STOCK
 FROM INVENTORY_CURRENT
 GROUP BY PRODUCT_CATEGORY
@@ -352,6 +352,16 @@ WITH sales_30d AS (
     FROM ORDERS
     WHERE ORDER_DATE >= DATEADD('day', -30, CURRENT_DATE())
     GROUP BY PRODUCT_ID
+),
+-- INVENTORY_CURRENT est par produit × entrepôt : rotation sur le stock total du produit
+stock AS (
+    SELECT
+        PRODUCT_ID,
+        MAX(PRODUCT_NAME) AS PRODUCT_NAME,
+        MAX(PRODUCT_CATEGORY) AS PRODUCT_CATEGORY,
+        SUM(CURRENT_STOCK_LEVEL) AS CURRENT_STOCK_LEVEL
+    FROM INVENTORY_CURRENT
+    GROUP BY PRODUCT_ID
 )
 SELECT
     i.PRODUCT_ID,
@@ -371,7 +381,7 @@ SELECT
         WHEN (s.UNITS_SOLD / i.CURRENT_STOCK_LEVEL) < 1.0 THEN '🏃 Rotation rapide'
         ELSE '🚀 Rotation très rapide'
     END AS TURNOVER_STATUS
-FROM INVENTORY_CURRENT i
+FROM stock i
 LEFT JOIN sales_30d s ON i.PRODUCT_ID = s.PRODUCT_ID
 ORDER BY TURNOVER_RATE_PCT DESC NULLS LAST;
 
@@ -580,6 +590,39 @@ SELECT
     DATEDIFF('minute', MAX(UPDATED_AT), CURRENT_TIMESTAMP())
 FROM INVENTORY_CURRENT;
 
+-- 8.3 - Réutilisation du cache de résultats par le dashboard (7 derniers jours)
+-- Le dashboard tague ses requêtes (QUERY_TAG) et les envoie avec des paramètres liés :
+-- un même état de filtres produit un même texte, réutilisable par le cache de résultats.
+-- Heuristique : une requête servie par le cache ne lit aucun octet et ne s'exécute pas.
+-- (ACCOUNT_USAGE a jusqu'à 45 minutes de latence)
+SELECT
+    DATE_TRUNC('day', START_TIME) AS QUERY_DAY,
+    QUERY_PARAMETERIZED_HASH,
+    ANY_VALUE(LEFT(REGEXP_REPLACE(QUERY_TEXT, '\\s+', ' '), 120)) AS QUERY_SAMPLE,
+    COUNT(*) AS QUERY_COUNT,
+    COUNT_IF(BYTES_SCANNED = 0 AND EXECUTION_TIME <= 5) AS RESULT_CACHE_HITS,
+    ROUND(RESULT_CACHE_HITS / QUERY_COUNT * 100, 1) AS RESULT_CACHE_HIT_PCT,
+    ROUND(SUM(TOTAL_ELAPSED_TIME) / 1000, 1) AS TOTAL_ELAPSED_SECONDS
+FROM SNOWFLAKE.ACCOUNT_USAGE.QUERY_HISTORY
+WHERE QUERY_TAG = 'CAVES_ALBERT_DASHBOARD'
+  AND START_TIME >= DATEADD('day', -7, CURRENT_TIMESTAMP())
+  AND EXECUTION_STATUS = 'SUCCESS'
+GROUP BY QUERY_DAY, QUERY_PARAMETERIZED_HASH
+ORDER BY QUERY_DAY DESC, QUERY_COUNT DESC;
+
+-- 8.4 - Taux global de réutilisation du cache de résultats par jour
+SELECT
+    DATE_TRUNC('day', START_TIME) AS QUERY_DAY,
+    COUNT(*) AS QUERY_COUNT,
+    COUNT(DISTINCT QUERY_HASH) AS DISTINCT_QUERY_TEXTS,
+    ROUND(COUNT_IF(BYTES_SCANNED = 0 AND EXECUTION_TIME <= 5) / COUNT(*) * 100, 1) AS RESULT_CACHE_HIT_PCT
+FROM SNOWFLAKE.ACCOUNT_USAGE.QUERY_HISTORY
+WHERE QUERY_TAG = 'CAVES_ALBERT_DASHBOARD'
+  AND START_TIME >= DATEADD('day', -30, CURRENT_TIMESTAMP())
+  AND EXECUTION_STATUS = 'SUCCESS'
+GROUP BY QUERY_DAY
+ORDER BY QUERY_DAY DESC;
+
 -- ============================================
 -- 📊 SECTION 9: VUES MATÉRIALISÉES (RECOMMANDÉ)
 -- ============================================
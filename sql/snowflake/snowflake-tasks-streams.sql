@@ -73,15 +73,17 @@ CREATE TABLE IF NOT EXISTS PRODUCTION.ORDERS (
     UPDATED_AT TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
 );
 
--- Table de production pour l'inventaire en temps réel
+-- Table de production pour l'inventaire en temps réel (1 ligne par produit × entrepôt)
+-- CURRENT_STOCK_LEVEL = somme des QUANTITY_CHANGE - quantités commandées, tenue incrémentalement
 CREATE TABLE IF NOT EXISTS PRODUCTION.INVENTORY_CURRENT (
-    PRODUCT_ID VARCHAR(50) PRIMARY KEY,
+    PRODUCT_ID VARCHAR(50),
     PRODUCT_NAME VARCHAR(200),
     PRODUCT_CATEGORY VARCHAR(50),
     CURRENT_STOCK_LEVEL NUMBER(10,0),
     LAST_ADJUSTMENT_TIMESTAMP TIMESTAMP_NTZ,
     WAREHOUSE_LOCATION VARCHAR(100),
-    UPDATED_AT TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
+    UPDATED_AT TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP(),
+    PRIMARY KEY (PRODUCT_ID, WAREHOUSE_LOCATION)
 );
 
 -- Table de production pour l'historique des ajustements d'inventaire
@@ -100,6 +102,32 @@ CREATE TABLE IF NOT EXISTS PRODUCTION.INVENTORY_HISTORY (
     CREATED_AT TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
 );
 
+-- Rollups pré-agrégés lus par le dashboard (maintenus incrémentalement par le DAG)
+-- Ventes par jour × catégorie × produit
+CREATE TABLE IF NOT EXISTS PRODUCTION.DAILY_SALES_BY_PRODUCT (
+    ORDER_DATE DATE NOT NULL,
+    PRODUCT_CATEGORY VARCHAR(50),
+    PRODUCT_ID VARCHAR(50),
+    PRODUCT_NAME VARCHAR(200),
+    ORDER_COUNT NUMBER(18,0),
+    TOTAL_QUANTITY NUMBER(18,0),
+    TOTAL_REVENUE NUMBER(18,2),
+    UPDATED_AT TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
+)
+CLUSTER BY (ORDER_DATE);
+
+-- Ventes par jour × client (× catégorie, pour appliquer le filtre catégories du dashboard)
+CREATE TABLE IF NOT EXISTS PRODUCTION.DAILY_SALES_BY_CUSTOMER (
+    ORDER_DATE DATE NOT NULL,
+    CUSTOMER_ID VARCHAR(50),
+    PRODUCT_CATEGORY VARCHAR(50),
+    ORDER_COUNT NUMBER(18,0),
+    TOTAL_QUANTITY NUMBER(18,0),
+    TOTAL_REVENUE NUMBER(18,2),
+    UPDATED_AT TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
+)
+CLUSTER BY (ORDER_DATE);
+
 -- ============================================
 -- 2️⃣ CRÉATION DES STREAMS (CDC)
 -- ============================================
@@ -121,10 +149,82 @@ CREATE OR REPLACE STREAM STREAM_STG_INVENTORY_FOR_HISTORY
 ON TABLE STAGING.STG_INVENTORY_ADJUSTMENTS
 COMMENT = '🔄 Stream pour PRODUCTION.INVENTORY_HISTORY';
 
+-- Append-only : une purge de STG_INVENTORY_ADJUSTMENTS ne doit pas annuler les mouvements de stock
 CREATE OR REPLACE STREAM STREAM_STG_INVENTORY_FOR_CURRENT
 ON TABLE STAGING.STG_INVENTORY_ADJUSTMENTS
+APPEND_ONLY = TRUE
 COMMENT = '🔄 Stream pour PRODUCTION.INVENTORY_CURRENT';
 
+-- Deux streams (standard, pas append-only) sur PRODUCTION.ORDERS pour les rollups :
+-- STREAM_STG_ORDERS est déjà consommé par TASK_STAGING_TO_PROD_ORDERS, et un ORDER_ID
+-- re-fusionné par le MERGE apparaît ici comme DELETE (ancienne ligne) + INSERT (nouvelle),
+-- ce qui donne des deltas exacts (pas de double comptage)
+CREATE OR REPLACE STREAM STREAM_ORDERS_FOR_PRODUCT_ROLLUP
+ON TABLE PRODUCTION.ORDERS
+COMMENT = '🔄 Stream pour PRODUCTION.DAILY_SALES_BY_PRODUCT';
+
+CREATE OR REPLACE STREAM STREAM_ORDERS_FOR_CUSTOMER_ROLLUP
+ON TABLE PRODUCTION.ORDERS
+COMMENT = '🔄 Stream pour PRODUCTION.DAILY_SALES_BY_CUSTOMER';
+
+-- Sorties de stock : une commande insérée retire sa quantité, une quantité corrigée
+-- (DELETE + INSERT) ne retire que la différence
+CREATE OR REPLACE STREAM STREAM_ORDERS_FOR_INVENTORY
+ON TABLE PRODUCTION.ORDERS
+COMMENT = '🔄 Stream pour PRODUCTION.INVENTORY_CURRENT (sorties de stock)';
+
+-- Reconstruction complète des rollups au (re)déploiement : les streams ci-dessus
+-- viennent d'être recréés et ne voient que les changements à partir de maintenant
+INSERT OVERWRITE INTO PRODUCTION.DAILY_SALES_BY_PRODUCT (
+    ORDER_DATE, PRODUCT_CATEGORY, PRODUCT_ID, PRODUCT_NAME, ORDER_COUNT, TOTAL_QUANTITY, TOTAL_REVENUE
+)
+SELECT ORDER_DATE, PRODUCT_CATEGORY, PRODUCT_ID, PRODUCT_NAME,
+       COUNT(*), SUM(QUANTITY), SUM(TOTAL_AMOUNT)
+FROM PRODUCTION.ORDERS
+GROUP BY ORDER_DATE, PRODUCT_CATEGORY, PRODUCT_ID, PRODUCT_NAME;
+
+INSERT OVERWRITE INTO PRODUCTION.DAILY_SALES_BY_CUSTOMER (
+    ORDER_DATE, CUSTOMER_ID, PRODUCT_CATEGORY, ORDER_COUNT, TOTAL_QUANTITY, TOTAL_REVENUE
+)
+SELECT ORDER_DATE, CUSTOMER_ID, PRODUCT_CATEGORY,
+       COUNT(*), SUM(QUANTITY), SUM(TOTAL_AMOUNT)
+FROM PRODUCTION.ORDERS
+GROUP BY ORDER_DATE, CUSTOMER_ID, PRODUCT_CATEGORY;
+
+-- Niveau de stock recalculé sur tout l'historique : sert à la reconstruction ci-dessous
+-- et au contrôle de cohérence (section 7). Les événements ORDER_CREATED ne portent pas
+-- d'entrepôt : les commandes sont expédiées depuis la Cave Centrale.
+CREATE OR REPLACE VIEW PRODUCTION.V_INVENTORY_RECOMPUTED AS
+SELECT
+    PRODUCT_ID,
+    WAREHOUSE_LOCATION,
+    MAX(PRODUCT_NAME) AS PRODUCT_NAME,
+    MAX(PRODUCT_CATEGORY) AS PRODUCT_CATEGORY,
+    SUM(STOCK_DELTA) AS CURRENT_STOCK_LEVEL,
+    MAX(MOVEMENT_TIMESTAMP) AS LAST_ADJUSTMENT_TIMESTAMP
+FROM (
+    SELECT PRODUCT_ID, WAREHOUSE_LOCATION, PRODUCT_NAME, PRODUCT_CATEGORY,
+           QUANTITY_CHANGE AS STOCK_DELTA, ADJUSTMENT_TIMESTAMP AS MOVEMENT_TIMESTAMP
+    FROM PRODUCTION.INVENTORY_HISTORY
+    UNION ALL
+    SELECT PRODUCT_ID, 'Cave Centrale', PRODUCT_NAME, PRODUCT_CATEGORY,
+           -QUANTITY, ORDER_TIMESTAMP
+    FROM PRODUCTION.ORDERS
+)
+GROUP BY PRODUCT_ID, WAREHOUSE_LOCATION;
+
+-- Le grain de INVENTORY_CURRENT est passé de produit à produit × entrepôt (contrainte informative)
+ALTER TABLE PRODUCTION.INVENTORY_CURRENT DROP PRIMARY KEY;
+ALTER TABLE PRODUCTION.INVENTORY_CURRENT ADD PRIMARY KEY (PRODUCT_ID, WAREHOUSE_LOCATION);
+
+INSERT OVERWRITE INTO PRODUCTION.INVENTORY_CURRENT (
+    PRODUCT_ID, WAREHOUSE_LOCATION, PRODUCT_NAME, PRODUCT_CATEGORY,
+    CURRENT_STOCK_LEVEL, LAST_ADJUSTMENT_TIMESTAMP
+)
+SELECT PRODUCT_ID, WAREHOUSE_LOCATION, PRODUCT_NAME, PRODUCT_CATEGORY,
+       CURRENT_STOCK_LEVEL, LAST_ADJUSTMENT_TIMESTAMP
+FROM PRODUCTION.V_INVENTORY_RECOMPUTED;
+
 -- ============================================
 -- 3️⃣ CRÉATION DES TASKS
 -- ============================================
@@ -166,24 +266,35 @@ INSERT ALL
 -- Source: extraction des données depuis STREAM_RAW_EVENTS
 SELECT 
     EVENT_TYPE,
-    INGESTION_TIME AS EVENT_TIMESTAMP,
+    -- Heure de l'événement (event_ts, typé en UTC à l'ingestion) ; l'heure de chargement Snowflake
+    -- seulement si le producer ne l'a pas fournie : un batch rejoué ou un backfill garde ainsi ses
+    -- vraies dates (commandes, mouvements de stock, rollups). EVENT_TS est ramené à l'heure locale
+    -- de la session, la convention de INGESTION_TIME::TIMESTAMP_NTZ que lisent le dashboard et l'historique
+    COALESCE(
+        TIMESTAMP_TZ_FROM_PARTS(YEAR(EVENT_TS), MONTH(EVENT_TS), DAY(EVENT_TS), HOUR(EVENT_TS), MINUTE(EVENT_TS),
+                                SECOND(EVENT_TS), DATE_PART(NANOSECOND, EVENT_TS), 'UTC')::TIMESTAMP_LTZ::TIMESTAMP_NTZ,
+        INGESTION_TIME::TIMESTAMP_NTZ
+    ) AS EVENT_TIMESTAMP,
     -- Colonnes directes (pas dans JSON)
     CAST(CUSTOMER_ID AS VARCHAR) AS CUSTOMER_ID_VAL,
     CAST(PRODUCT_ID AS VARCHAR) AS PRODUCT_ID_VAL,
-    -- Extraction depuis EVENT_CONTENT pour ORDER_CREATED
+    -- Colonnes typées à l'ingestion par le consumer (schema_migrations.py) ;
+    -- le COALESCE ne lit EVENT_CONTENT que pour une ligne chargée par un consumer plus ancien,
+    -- avec les mêmes casts TRY_ que le consumer : une valeur malformée donne NULL
+    COALESCE(EVENT_ID, EVENT_CONTENT:order_line_id::VARCHAR) AS ORDER_ID_VAL,
+    COALESCE(QUANTITY, TRY_CAST(EVENT_CONTENT:quantity::VARCHAR AS NUMBER)) AS QUANTITY_VAL,
+    COALESCE(TOTAL_PRICE, TRY_CAST(EVENT_CONTENT:total_price::VARCHAR AS NUMBER(10,2))) AS TOTAL_AMOUNT_VAL,
+    -- Extraction depuis EVENT_CONTENT pour ORDER_CREATED (champs froids)
     -- 🔧 CORRECTION: Utilisation des vrais noms de champs du producer
-    EVENT_CONTENT:order_line_id::VARCHAR AS ORDER_ID_VAL,
     EVENT_CONTENT:product_name::VARCHAR AS PRODUCT_NAME_VAL,
     EVENT_CONTENT:category::VARCHAR AS PRODUCT_CATEGORY_VAL,
-    EVENT_CONTENT:quantity::NUMBER AS QUANTITY_VAL,
     EVENT_CONTENT:unit_price::NUMBER AS UNIT_PRICE_VAL,
-    EVENT_CONTENT:total_price::NUMBER AS TOTAL_AMOUNT_VAL,
     EVENT_CONTENT:sales_channel::VARCHAR AS PAYMENT_METHOD_VAL,
     CONCAT('Bottle: ', EVENT_CONTENT:bottle_size_l::VARCHAR, 'L - Discount: €', EVENT_CONTENT:discount::VARCHAR) AS SHIPPING_ADDRESS_VAL,
     -- Extraction depuis EVENT_CONTENT pour INVENTORY_ADJUSTED
-    EVENT_CONTENT:event_id::VARCHAR AS ADJUSTMENT_ID_VAL,
+    COALESCE(EVENT_ID, EVENT_CONTENT:event_id::VARCHAR) AS ADJUSTMENT_ID_VAL,
+    COALESCE(QUANTITY_CHANGE, TRY_CAST(EVENT_CONTENT:quantity_change::VARCHAR AS NUMBER)) AS QUANTITY_CHANGE_VAL,
     EVENT_CONTENT:adjustment_type::VARCHAR AS ADJUSTMENT_TYPE_VAL,
-    EVENT_CONTENT:quantity_change::NUMBER AS QUANTITY_CHANGE_VAL,
     NULL AS NEW_STOCK_LEVEL_VAL,  -- Non disponible dans les événements
     EVENT_CONTENT:adjustment_type::VARCHAR AS REASON_VAL,
     EVENT_CONTENT:warehouse_location::VARCHAR AS WAREHOUSE_LOCATION_VAL
@@ -268,48 +379,133 @@ WHERE METADATA$ACTION = 'INSERT'
   AND METADATA$ISUPDATE = FALSE;
 
 
--- TASK 4: STAGING → PRODUCTION (Inventaire - État Actuel)
+-- TASK 4: STAGING → PRODUCTION (Inventaire - État Actuel, incrémental)
+-- Un seul passage sur les deux deltas : ajustements (+QUANTITY_CHANGE) et commandes
+-- (INSERT = -QUANTITY, DELETE = +QUANTITY), agrégés par produit × entrepôt puis ajoutés
+-- au niveau stocké. Le MERGE ne touche que les clés présentes dans le delta.
 CREATE OR REPLACE TASK TASK_STAGING_TO_PROD_INVENTORY_CURRENT
     WAREHOUSE = COMPUTE_WH
-    AFTER TASK_STAGING_TO_PROD_INVENTORY_HISTORY
+    AFTER TASK_STAGING_TO_PROD_INVENTORY_HISTORY, TASK_STAGING_TO_PROD_ORDERS
 WHEN
     SYSTEM$STREAM_HAS_DATA('STREAM_STG_INVENTORY_FOR_CURRENT')
+    OR SYSTEM$STREAM_HAS_DATA('STREAM_ORDERS_FOR_INVENTORY')
 AS
 MERGE INTO PRODUCTION.INVENTORY_CURRENT AS target
 USING (
     SELECT
         PRODUCT_ID,
-        PRODUCT_NAME,
-        PRODUCT_CATEGORY,
-        NEW_STOCK_LEVEL,
-        EVENT_TIMESTAMP AS LAST_ADJUSTMENT_TIMESTAMP,
         WAREHOUSE_LOCATION,
-        CURRENT_TIMESTAMP() AS UPDATED_AT
-    FROM STREAM_STG_INVENTORY_FOR_CURRENT
-    WHERE METADATA$ACTION = 'INSERT'
-      AND METADATA$ISUPDATE = FALSE
-    QUALIFY ROW_NUMBER() OVER (PARTITION BY PRODUCT_ID ORDER BY EVENT_TIMESTAMP DESC) = 1
-) AS source
-ON target.PRODUCT_ID = source.PRODUCT_ID
+        MAX(PRODUCT_NAME) AS PRODUCT_NAME,
+        MAX(PRODUCT_CATEGORY) AS PRODUCT_CATEGORY,
+        SUM(STOCK_DELTA) AS STOCK_DELTA,
+        MAX(MOVEMENT_TIMESTAMP) AS LAST_ADJUSTMENT_TIMESTAMP
+    FROM (
+        SELECT PRODUCT_ID, WAREHOUSE_LOCATION, PRODUCT_NAME, PRODUCT_CATEGORY,
+               QUANTITY_CHANGE AS STOCK_DELTA, EVENT_TIMESTAMP AS MOVEMENT_TIMESTAMP
+        FROM STREAM_STG_INVENTORY_FOR_CURRENT
+        WHERE METADATA$ACTION = 'INSERT'
+        UNION ALL
+        -- Même entrepôt d'expédition que PRODUCTION.V_INVENTORY_RECOMPUTED
+        SELECT PRODUCT_ID, 'Cave Centrale', PRODUCT_NAME, PRODUCT_CATEGORY,
+               IFF(METADATA$ACTION = 'INSERT', -QUANTITY, QUANTITY), ORDER_TIMESTAMP
+        FROM STREAM_ORDERS_FOR_INVENTORY
+    )
+    GROUP BY PRODUCT_ID, WAREHOUSE_LOCATION
+) AS delta
+ON EQUAL_NULL(target.PRODUCT_ID, delta.PRODUCT_ID)
+   AND EQUAL_NULL(target.WAREHOUSE_LOCATION, delta.WAREHOUSE_LOCATION)
 WHEN MATCHED THEN
     UPDATE SET
-        target.PRODUCT_NAME = source.PRODUCT_NAME,
-        target.PRODUCT_CATEGORY = source.PRODUCT_CATEGORY,
-        target.CURRENT_STOCK_LEVEL = source.NEW_STOCK_LEVEL,
-        target.LAST_ADJUSTMENT_TIMESTAMP = source.LAST_ADJUSTMENT_TIMESTAMP,
-        target.WAREHOUSE_LOCATION = source.WAREHOUSE_LOCATION,
-        target.UPDATED_AT = source.UPDATED_AT
+        target.PRODUCT_NAME = COALESCE(delta.PRODUCT_NAME, target.PRODUCT_NAME),
+        target.PRODUCT_CATEGORY = COALESCE(delta.PRODUCT_CATEGORY, target.PRODUCT_CATEGORY),
+        target.CURRENT_STOCK_LEVEL = COALESCE(target.CURRENT_STOCK_LEVEL, 0) + COALESCE(delta.STOCK_DELTA, 0),
+        target.LAST_ADJUSTMENT_TIMESTAMP = GREATEST(
+            COALESCE(target.LAST_ADJUSTMENT_TIMESTAMP, delta.LAST_ADJUSTMENT_TIMESTAMP),
+            COALESCE(delta.LAST_ADJUSTMENT_TIMESTAMP, target.LAST_ADJUSTMENT_TIMESTAMP)
+        ),
+        target.UPDATED_AT = CURRENT_TIMESTAMP()
 WHEN NOT MATCHED THEN
     INSERT (
-        PRODUCT_ID, PRODUCT_NAME, PRODUCT_CATEGORY, CURRENT_STOCK_LEVEL,
-        LAST_ADJUSTMENT_TIMESTAMP, WAREHOUSE_LOCATION, UPDATED_AT
+        PRODUCT_ID, WAREHOUSE_LOCATION, PRODUCT_NAME, PRODUCT_CATEGORY,
+        CURRENT_STOCK_LEVEL, LAST_ADJUSTMENT_TIMESTAMP
     )
     VALUES (
-        source.PRODUCT_ID, source.PRODUCT_NAME, source.PRODUCT_CATEGORY, source.NEW_STOCK_LEVEL,
-        source.LAST_ADJUSTMENT_TIMESTAMP, source.WAREHOUSE_LOCATION, source.UPDATED_AT
+        delta.PRODUCT_ID, delta.WAREHOUSE_LOCATION, delta.PRODUCT_NAME, delta.PRODUCT_CATEGORY,
+        COALESCE(delta.STOCK_DELTA, 0), delta.LAST_ADJUSTMENT_TIMESTAMP
     );
 
 
+-- TASK 5: PRODUCTION.ORDERS → Rollup jour × catégorie × produit (incrémental)
+-- INSERT = +1 ligne, DELETE (y compris l'ancienne image d'un UPDATE) = -1 ligne
+CREATE OR REPLACE TASK TASK_ROLLUP_DAILY_SALES_BY_PRODUCT
+    WAREHOUSE = COMPUTE_WH
+    AFTER TASK_STAGING_TO_PROD_ORDERS
+WHEN
+    SYSTEM$STREAM_HAS_DATA('STREAM_ORDERS_FOR_PRODUCT_ROLLUP')
+AS
+MERGE INTO PRODUCTION.DAILY_SALES_BY_PRODUCT AS target
+USING (
+    SELECT
+        ORDER_DATE,
+        PRODUCT_CATEGORY,
+        PRODUCT_ID,
+        PRODUCT_NAME,
+        SUM(IFF(METADATA$ACTION = 'INSERT', 1, -1)) AS ORDER_COUNT,
+        SUM(IFF(METADATA$ACTION = 'INSERT', QUANTITY, -QUANTITY)) AS TOTAL_QUANTITY,
+        SUM(IFF(METADATA$ACTION = 'INSERT', TOTAL_AMOUNT, -TOTAL_AMOUNT)) AS TOTAL_REVENUE
+    FROM STREAM_ORDERS_FOR_PRODUCT_ROLLUP
+    GROUP BY ORDER_DATE, PRODUCT_CATEGORY, PRODUCT_ID, PRODUCT_NAME
+) AS delta
+ON target.ORDER_DATE = delta.ORDER_DATE
+   AND EQUAL_NULL(target.PRODUCT_CATEGORY, delta.PRODUCT_CATEGORY)
+   AND EQUAL_NULL(target.PRODUCT_ID, delta.PRODUCT_ID)
+   AND EQUAL_NULL(target.PRODUCT_NAME, delta.PRODUCT_NAME)
+WHEN MATCHED THEN
+    UPDATE SET
+        target.ORDER_COUNT = target.ORDER_COUNT + delta.ORDER_COUNT,
+        target.TOTAL_QUANTITY = COALESCE(target.TOTAL_QUANTITY, 0) + COALESCE(delta.TOTAL_QUANTITY, 0),
+        target.TOTAL_REVENUE = COALESCE(target.TOTAL_REVENUE, 0) + COALESCE(delta.TOTAL_REVENUE, 0),
+        target.UPDATED_AT = CURRENT_TIMESTAMP()
+WHEN NOT MATCHED THEN
+    INSERT (ORDER_DATE, PRODUCT_CATEGORY, PRODUCT_ID, PRODUCT_NAME, ORDER_COUNT, TOTAL_QUANTITY, TOTAL_REVENUE)
+    VALUES (delta.ORDER_DATE, delta.PRODUCT_CATEGORY, delta.PRODUCT_ID, delta.PRODUCT_NAME,
+            delta.ORDER_COUNT, delta.TOTAL_QUANTITY, delta.TOTAL_REVENUE);
+
+
+-- TASK 6: PRODUCTION.ORDERS → Rollup jour × client (incrémental)
+CREATE OR REPLACE TASK TASK_ROLLUP_DAILY_SALES_BY_CUSTOMER
+    WAREHOUSE = COMPUTE_WH
+    AFTER TASK_STAGING_TO_PROD_ORDERS
+WHEN
+    SYSTEM$STREAM_HAS_DATA('STREAM_ORDERS_FOR_CUSTOMER_ROLLUP')
+AS
+MERGE INTO PRODUCTION.DAILY_SALES_BY_CUSTOMER AS target
+USING (
+    SELECT
+        ORDER_DATE,
+        CUSTOMER_ID,
+        PRODUCT_CATEGORY,
+        SUM(IFF(METADATA$ACTION = 'INSERT', 1, -1)) AS ORDER_COUNT,
+        SUM(IFF(METADATA$ACTION = 'INSERT', QUANTITY, -QUANTITY)) AS TOTAL_QUANTITY,
+        SUM(IFF(METADATA$ACTION = 'INSERT', TOTAL_AMOUNT, -TOTAL_AMOUNT)) AS TOTAL_REVENUE
+    FROM STREAM_ORDERS_FOR_CUSTOMER_ROLLUP
+    GROUP BY ORDER_DATE, CUSTOMER_ID, PRODUCT_CATEGORY
+) AS delta
+ON target.ORDER_DATE = delta.ORDER_DATE
+   AND EQUAL_NULL(target.CUSTOMER_ID, delta.CUSTOMER_ID)
+   AND EQUAL_NULL(target.PRODUCT_CATEGORY, delta.PRODUCT_CATEGORY)
+WHEN MATCHED THEN
+    UPDATE SET
+        target.ORDER_COUNT = target.ORDER_COUNT + delta.ORDER_COUNT,
+        target.TOTAL_QUANTITY = COALESCE(target.TOTAL_QUANTITY, 0) + COALESCE(delta.TOTAL_QUANTITY, 0),
+        target.TOTAL_REVENUE = COALESCE(target.TOTAL_REVENUE, 0) + COALESCE(delta.TOTAL_REVENUE, 0),
+        target.UPDATED_AT = CURRENT_TIMESTAMP()
+WHEN NOT MATCHED THEN
+    INSERT (ORDER_DATE, CUSTOMER_ID, PRODUCT_CATEGORY, ORDER_COUNT, TOTAL_QUANTITY, TOTAL_REVENUE)
+    VALUES (delta.ORDER_DATE, delta.CUSTOMER_ID, delta.PRODUCT_CATEGORY,
+            delta.ORDER_COUNT, delta.TOTAL_QUANTITY, delta.TOTAL_REVENUE);
+
+
 -- ============================================
 -- 4️⃣ ACTIVATION DES TASKS (DAG)
 -- ============================================
@@ -317,10 +513,14 @@ WHEN NOT MATCHED THEN
 --
 -- 1. TASK_RAW_TO_STAGING_DISTRIBUTOR (toutes les 1 min) [RACINE]
 --    ├── 2. TASK_STAGING_TO_PROD_ORDERS (après 1)
+--    │    ├── 5. TASK_ROLLUP_DAILY_SALES_BY_PRODUCT (après 2)
+--    │    └── 6. TASK_ROLLUP_DAILY_SALES_BY_CUSTOMER (après 2)
 --    └── 3. TASK_STAGING_TO_PROD_INVENTORY_HISTORY (après 1)
---         └── 4. TASK_STAGING_TO_PROD_INVENTORY_CURRENT (après 3)
+--         └── 4. TASK_STAGING_TO_PROD_INVENTORY_CURRENT (après 3 et 2 : ajustements + commandes)
 
 -- Activer les tasks enfants d'abord, puis les parents
+ALTER TASK TASK_ROLLUP_DAILY_SALES_BY_CUSTOMER RESUME;
+ALTER TASK TASK_ROLLUP_DAILY_SALES_BY_PRODUCT RESUME;
 ALTER TASK TASK_STAGING_TO_PROD_INVENTORY_CURRENT RESUME;
 ALTER TASK TASK_STAGING_TO_PROD_INVENTORY_HISTORY RESUME;
 ALTER TASK TASK_STAGING_TO_PROD_ORDERS RESUME;
@@ -349,7 +549,9 @@ WHERE NAME IN (
     'TASK_RAW_TO_STAGING_DISTRIBUTOR',
     'TASK_STAGING_TO_PROD_ORDERS',
     'TASK_STAGING_TO_PROD_INVENTORY_HISTORY',
-    'TASK_STAGING_TO_PROD_INVENTORY_CURRENT'
+    'TASK_STAGING_TO_PROD_INVENTORY_CURRENT',
+    'TASK_ROLLUP_DAILY_SALES_BY_PRODUCT',
+    'TASK_ROLLUP_DAILY_SALES_BY_CUSTOMER'
 )
 ORDER BY SCHEDULED_TIME DESC
 LIMIT 20;
@@ -361,7 +563,13 @@ SELECT 'STREAM_STG_ORDERS', SYSTEM$STREAM_HAS_DATA('STREAM_STG_ORDERS')
 UNION ALL
 SELECT 'STREAM_STG_INVENTORY_FOR_HISTORY', SYSTEM$STREAM_HAS_DATA('STREAM_STG_INVENTORY_FOR_HISTORY')
 UNION ALL
-SELECT 'STREAM_STG_INVENTORY_FOR_CURRENT', SYSTEM$STREAM_HAS_DATA('STREAM_STG_INVENTORY_FOR_CURRENT');
+SELECT 'STREAM_STG_INVENTORY_FOR_CURRENT', SYSTEM$STREAM_HAS_DATA('STREAM_STG_INVENTORY_FOR_CURRENT')
+UNION ALL
+SELECT 'STREAM_ORDERS_FOR_PRODUCT_ROLLUP', SYSTEM$STREAM_HAS_DATA('STREAM_ORDERS_FOR_PRODUCT_ROLLUP')
+UNION ALL
+SELECT 'STREAM_ORDERS_FOR_CUSTOMER_ROLLUP', SYSTEM$STREAM_HAS_DATA('STREAM_ORDERS_FOR_CUSTOMER_ROLLUP')
+UNION ALL
+SELECT 'STREAM_ORDERS_FOR_INVENTORY', SYSTEM$STREAM_HAS_DATA('STREAM_ORDERS_FOR_INVENTORY');
 
 -- Compter les lignes dans chaque stream
 SELECT 'STREAM_RAW_EVENTS' AS STREAM_NAME, COUNT(*) AS PENDING_ROWS FROM STREAM_RAW_EVENTS
@@ -370,7 +578,13 @@ SELECT 'STREAM_STG_ORDERS', COUNT(*) FROM STREAM_STG_ORDERS
 UNION ALL
 SELECT 'STREAM_STG_INVENTORY_FOR_HISTORY', COUNT(*) FROM STREAM_STG_INVENTORY_FOR_HISTORY
 UNION ALL
-SELECT 'STREAM_STG_INVENTORY_FOR_CURRENT', COUNT(*) FROM STREAM_STG_INVENTORY_FOR_CURRENT;
+SELECT 'STREAM_STG_INVENTORY_FOR_CURRENT', COUNT(*) FROM STREAM_STG_INVENTORY_FOR_CURRENT
+UNION ALL
+SELECT 'STREAM_ORDERS_FOR_PRODUCT_ROLLUP', COUNT(*) FROM STREAM_ORDERS_FOR_PRODUCT_ROLLUP
+UNION ALL
+SELECT 'STREAM_ORDERS_FOR_CUSTOMER_ROLLUP', COUNT(*) FROM STREAM_ORDERS_FOR_CUSTOMER_ROLLUP
+UNION ALL
+SELECT 'STREAM_ORDERS_FOR_INVENTORY', COUNT(*) FROM STREAM_ORDERS_FOR_INVENTORY;
 
 -- Vue d'ensemble du pipeline (nombre de lignes par table)
 SELECT 'RAW' AS LAYER, 'RAW_EVENTS_STREAM' AS TABLE_NAME, COUNT(*) AS ROWS 
@@ -385,6 +599,10 @@ UNION ALL
 SELECT 'PRODUCTION', 'INVENTORY_HISTORY', COUNT(*) FROM PRODUCTION.INVENTORY_HISTORY
 UNION ALL
 SELECT 'PRODUCTION', 'INVENTORY_CURRENT', COUNT(*) FROM PRODUCTION.INVENTORY_CURRENT
+UNION ALL
+SELECT 'PRODUCTION', 'DAILY_SALES_BY_PRODUCT', COUNT(*) FROM PRODUCTION.DAILY_SALES_BY_PRODUCT
+UNION ALL
+SELECT 'PRODUCTION', 'DAILY_SALES_BY_CUSTOMER', COUNT(*) FROM PRODUCTION.DAILY_SALES_BY_CUSTOMER
 ORDER BY LAYER, TABLE_NAME;
 
 -- ============================================
@@ -397,6 +615,8 @@ ALTER TASK TASK_RAW_TO_STAGING_DISTRIBUTOR SUSPEND;
 ALTER TASK TASK_STAGING_TO_PROD_ORDERS SUSPEND;
 ALTER TASK TASK_STAGING_TO_PROD_INVENTORY_HISTORY SUSPEND;
 ALTER TASK TASK_STAGING_TO_PROD_INVENTORY_CURRENT SUSPEND;
+ALTER TASK TASK_ROLLUP_DAILY_SALES_BY_PRODUCT SUSPEND;
+ALTER TASK TASK_ROLLUP_DAILY_SALES_BY_CUSTOMER SUSPEND;
 */
 
 -- Exécuter manuellement une task (pour tester)
@@ -404,6 +624,16 @@ ALTER TASK TASK_STAGING_TO_PROD_INVENTORY_CURRENT SUSPEND;
 EXECUTE TASK TASK_RAW_TO_STAGING_DISTRIBUTOR;
 */
 
+-- DAG déclenché par le consumer (TASK_TRIGGER_ENABLED=true, streaming-ingestion/task_trigger.py) :
+-- EXECUTE TASK après chaque seuil de lignes / d'âge, le schedule ne sert plus que de filet de sécurité
+/*
+GRANT EXECUTE TASK ON ACCOUNT TO ROLE <ROLE_DU_CONSUMER>;
+GRANT OPERATE, MONITOR ON TASK TASK_RAW_TO_STAGING_DISTRIBUTOR TO ROLE <ROLE_DU_CONSUMER>;
+ALTER TASK TASK_RAW_TO_STAGING_DISTRIBUTOR SUSPEND;
+ALTER TASK TASK_RAW_TO_STAGING_DISTRIBUTOR SET SCHEDULE = '15 MINUTE';
+ALTER TASK TASK_RAW_TO_STAGING_DISTRIBUTOR RESUME;
+*/
+
 -- ============================================
 -- 7️⃣ REQUÊTES ANALYTIQUES
 -- ============================================
@@ -425,7 +655,7 @@ SELECT
     PRODUCT_CATEGORY,
     COUNT(DISTINCT PRODUCT_ID) AS PRODUCT_COUNT,
     SUM(CURRENT_STOCK_LEVEL) AS TOTAL_STOCK,
-    ROUND(AVG(CURRENT_STOCK_LEVEL), 0) AS AVG_STOCK_PER_PRODUCT
+    ROUND(SUM(CURRENT_STOCK_LEVEL) / COUNT(DISTINCT PRODUCT_ID), 0) AS AVG_STOCK_PER_PRODUCT
 FROM PRODUCTION.INVENTORY_CURRENT
 GROUP BY PRODUCT_CATEGORY
 ORDER BY TOTAL_STOCK DESC;
@@ -440,7 +670,7 @@ WHERE ORDER_DATE >= DATEADD('day', -30, CURRENT_DATE())
 GROUP BY ORDER_DATE
 ORDER BY ORDER_DATE DESC;
 
--- Alertes : Produits avec stock faible (< 50 unités)
+-- Alertes : Produits avec stock faible (< 50 unités) par entrepôt
 SELECT
     PRODUCT_ID,
     PRODUCT_NAME,
@@ -453,6 +683,40 @@ FROM PRODUCTION.INVENTORY_CURRENT
 WHERE CURRENT_STOCK_LEVEL < 50
 ORDER BY CURRENT_STOCK_LEVEL ASC;
 
+-- Contrôle de cohérence : rollup produit vs PRODUCTION.ORDERS (écarts attendus = 0)
+SELECT
+    COALESCE(r.ORDER_DATE, o.ORDER_DATE) AS ORDER_DATE,
+    r.ORDER_COUNT AS ROLLUP_ORDERS,
+    o.ORDER_COUNT AS ORDERS,
+    r.TOTAL_REVENUE - o.TOTAL_REVENUE AS REVENUE_GAP
+FROM (
+    SELECT ORDER_DATE, SUM(ORDER_COUNT) AS ORDER_COUNT, SUM(TOTAL_REVENUE) AS TOTAL_REVENUE
+    FROM PRODUCTION.DAILY_SALES_BY_PRODUCT GROUP BY ORDER_DATE
+) r
+FULL OUTER JOIN (
+    SELECT ORDER_DATE, COUNT(*) AS ORDER_COUNT, SUM(TOTAL_AMOUNT) AS TOTAL_REVENUE
+    FROM PRODUCTION.ORDERS GROUP BY ORDER_DATE
+) o ON r.ORDER_DATE = o.ORDER_DATE
+WHERE NOT EQUAL_NULL(r.ORDER_COUNT, o.ORDER_COUNT)
+   OR NOT EQUAL_NULL(r.TOTAL_REVENUE, o.TOTAL_REVENUE)
+ORDER BY 1 DESC;
+
+-- Contrôle de cohérence : INVENTORY_CURRENT (incrémental) vs recalcul complet (écarts attendus = 0)
+-- À lancer quand STREAM_STG_INVENTORY_FOR_CURRENT et STREAM_ORDERS_FOR_INVENTORY sont vides ;
+-- en cas d'écart, rejouer l'INSERT OVERWRITE de la section 2
+SELECT
+    COALESCE(i.PRODUCT_ID, r.PRODUCT_ID) AS PRODUCT_ID,
+    COALESCE(i.WAREHOUSE_LOCATION, r.WAREHOUSE_LOCATION) AS WAREHOUSE_LOCATION,
+    i.CURRENT_STOCK_LEVEL AS INCREMENTAL_STOCK,
+    r.CURRENT_STOCK_LEVEL AS RECOMPUTED_STOCK,
+    COALESCE(i.CURRENT_STOCK_LEVEL, 0) - COALESCE(r.CURRENT_STOCK_LEVEL, 0) AS STOCK_GAP
+FROM PRODUCTION.INVENTORY_CURRENT i
+FULL OUTER JOIN PRODUCTION.V_INVENTORY_RECOMPUTED r
+    ON EQUAL_NULL(i.PRODUCT_ID, r.PRODUCT_ID)
+   AND EQUAL_NULL(i.WAREHOUSE_LOCATION, r.WAREHOUSE_LOCATION)
+WHERE NOT EQUAL_NULL(i.CURRENT_STOCK_LEVEL, r.CURRENT_STOCK_LEVEL)
+ORDER BY ABS(STOCK_GAP) DESC;
+
 -- ============================================
 -- 📊 RÉSUMÉ DES CORRECTIONS
 -- ============================================
@@ -461,4 +725,4 @@ ORDER BY CURRENT_STOCK_LEVEL ASC;
 -- ✅ 3. Ajout du mot-clé WHEN dans TASK_STAGING_TO_PROD_INVENTORY_HISTORY
 -- ✅ 4. Deux streams séparés pour STG_INVENTORY_ADJUSTMENTS (évite conflits de consommation)
 -- ✅ 5. Architecture simplifiée avec un seul stream sur RAW_EVENTS_STREAM
--- ✅ 6. Ajout de INGESTION_TIME comme EVENT_TIMESTAMP (timestamp d'insertion Snowflake)
+-- ✅ 6. EVENT_TIMESTAMP = EVENT_TS (heure de l'événement, en heure locale de session comme INGESTION_TIME), INGESTION_TIME en repli seulement
@@ -0,0 +1,109 @@
+# adaptive_batching.py - Les Caves d'Albert
+# Sizes consumer batches from observed Snowflake insert latency and event arrival rate
+
+import time
+import threading
+from collections import deque
+
+REASONS = ("warmup", "rows_target", "latency_bound", "throughput_bound", "min_bound", "max_bound")
+
+
+class AdaptiveBatchController:
+    """
+    Chooses the batch size and the max time a batch may stay open.
+
+    Insert latency is modelled as `overhead + per_row * rows`, fitted on the last
+    `history` inserts. With the arrival rate measured over `rate_window_seconds`,
+    the oldest event of a batch of n rows waits roughly `n / rate + insert(n)`:
+      - latency_bound:    largest n keeping that wait under target_latency_seconds
+      - throughput_bound: smallest n whose insert takes no longer than filling the
+                          next batch (otherwise lag grows without bound)
+      - rows_target:      preferred rows per statement when both allow it
+    The result is clamped to [min_size, max_size].
+    """
+
+    def __init__(self, min_size, max_size, target_latency_seconds, target_rows,
+                 history=50, rate_window_seconds=30):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_latency_seconds = target_latency_seconds
+        self.target_rows = target_rows
+        self.rate_window_seconds = rate_window_seconds
+        self._inserts = deque(maxlen=history)  # (rows, seconds)
+        self._arrivals = deque()  # (timestamp, count)
+        self._lock = threading.Lock()  # inserts are reported from writer threads in pipelined mode
+        self.batch_size = max(min_size, min(target_rows, max_size))
+        self.flush_interval = target_latency_seconds
+        self.reason = "warmup"
+
+    def observe_insert(self, rows, seconds):
+        with self._lock:
+            self._inserts.append((rows, seconds))
+
+    def observe_arrivals(self, count, now=None):
+        now = time.time() if now is None else now
+        self._arrivals.append((now, count))
+        while self._arrivals and self._arrivals[0][0] < now - self.rate_window_seconds:
+            self._arrivals.popleft()
+
+    def arrival_rate(self, now=None):
+        """Events per second over the rate window."""
+        now = time.time() if now is None else now
+        if not self._arrivals:
+            return 0.0
+        span = max(now - self._arrivals[0][0], 1.0)
+        return sum(count for _, count in self._arrivals) / span
+
+    def insert_model(self):
+        """Least-squares fit of (overhead_seconds, seconds_per_row) on recent inserts."""
+        with self._lock:
+            samples = list(self._inserts)
+        if not samples:
+            return None
+        n = len(samples)
+        mean_rows = sum(r for r, _ in samples) / n
+        mean_secs = sum(s for _, s in samples) / n
+        var_rows = sum((r - mean_rows) ** 2 for r, _ in samples)
+        if var_rows == 0:
+            # All batches had the same size: no way to split overhead and per-row cost
+            return mean_secs, 0.0
+        per_row = sum((r - mean_rows) * (s - mean_secs) for r, s in samples) / var_rows
+        per_row = max(per_row, 0.0)
+        overhead = max(mean_secs - per_row * mean_rows, 0.0)
+        return overhead, per_row
+
+    def update(self, now=None):
+        """Recomputes batch_size / flush_interval / reason. Returns (batch_size, flush_interval, reason)."""
+        model = self.insert_model()
+        if model is None:
+            return self.batch_size, self.flush_interval, self.reason
+
+        overhead, per_row = model
+        rate = self.arrival_rate(now)
+        size, reason = self.target_rows, "rows_target"
+
+        if rate > 0:
+            budget = self.target_latency_seconds - overhead
+            latency_cap = budget / (1.0 / rate + per_row) if budget > 0 else 0
+            if latency_cap < size:
+                size, reason = latency_cap, "latency_bound"
+            # Sustained ingest needs insert(n) <= n / rate
+            if per_row * rate < 1:
+                throughput_floor = overhead * rate / (1 - per_row * rate)
+                if throughput_floor > size:
+                    size, reason = throughput_floor, "throughput_bound"
+            else:
+                size, reason = self.max_size, "throughput_bound"
+
+        size = int(size)
+        if size <= self.min_size:
+            size, reason = self.min_size, "min_bound"
+        elif size >= self.max_size:
+            size, reason = self.max_size, "max_bound"
+
+        predicted_insert = overhead + per_row * size
+        self.batch_size = size
+        self.flush_interval = max(0.5, min(self.target_latency_seconds,
+                                           self.target_latency_seconds - predicted_insert))
+        self.reason = reason
+        return self.batch_size, self.flush_interval, self.reason
@@ -0,0 +1,173 @@
+# batch_pipeline.py - Les Caves d'Albert
+# Pipelined Snowflake writes: Kafka keeps polling while sealed batches are loaded in the background
+
+import time
+import queue
+import logging
+import threading
+from sqlalchemy.exc import SQLAlchemyError
+from snowflake_pool import is_transient_error
+
+
+class SealedBatch:
+    """A batch handed over to the writers, with the Kafka offsets it covers."""
+
+    __slots__ = ("seq", "events", "offsets", "sealed_at")
+
+    def __init__(self, seq, events, offsets):
+        self.seq = seq
+        self.events = events
+        self.offsets = offsets  # {TopicPartition: last offset included in the batch}
+        self.sealed_at = time.time()
+
+
+class BatchPipeline:
+    """
+    Bounded queue of sealed batches drained by a pool of writer threads.
+    Each writer holds its own Snowflake connection. Batches may land in any order,
+    but offsets are released for commit strictly in sequence: a batch's offsets are
+    only returned once it AND every earlier batch have been written.
+
+    Only the consumer thread touches the KafkaConsumer (it is not thread-safe):
+    it calls submit(), is_full() and pop_committable_offsets().
+
+    Connection-level errors (snowflake_pool.is_transient_error) are retried with
+    backoff. Any other error while writing a batch (ProgrammingError, DataError,
+    loader bug) is fatal: the writers stop and the next submit()/is_full() re-raises it,
+    so the consumer exits (and is restarted) instead of waiting forever on a batch
+    that will never land. Its offsets are not released, so it is replayed.
+    """
+
+    def __init__(self, engine, write_batch, writer_threads=2, queue_size=4, retry_backoff_seconds=1.0,
+                 on_written=None):
+        self.engine = engine
+        self.write_batch = write_batch  # callable(conn, events) run inside a transaction
+        self.on_written = on_written    # callable(events), called from a writer thread once committed
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._next_seq = 0
+        self._next_to_commit = 0
+        self._done = {}  # seq -> offsets of batches written but not yet released
+        self._in_flight = 0
+        self._stopping = threading.Event()
+        self._fatal = None  # exception that stopped the writers
+        self._writers = [
+            threading.Thread(target=self._writer_loop, name=f"snowflake-writer-{i}", daemon=True)
+            for i in range(writer_threads)
+        ]
+        for writer in self._writers:
+            writer.start()
+
+    # --- consumer-thread API ---
+
+    def submit(self, events, offsets):
+        """Seals a batch and queues it. Blocks only if the queue is full (callers check is_full first)."""
+        self.raise_if_failed()
+        with self._lock:
+            sealed = SealedBatch(self._next_seq, events, offsets)
+            self._next_seq += 1
+            self._in_flight += 1
+        self._queue.put(sealed)
+        return sealed.seq
+
+    def is_full(self):
+        self.raise_if_failed()
+        return self._queue.full()
+
+    def raise_if_failed(self):
+        """Re-raises, in the consumer thread, the error that stopped the writers."""
+        if self._fatal is not None:
+            raise RuntimeError("Snowflake writer stopped on an unexpected error") from self._fatal
+
+    def depth(self):
+        """Number of sealed batches not yet written (queued + being written)."""
+        with self._lock:
+            return self._in_flight
+
+    def pop_committable_offsets(self):
+        """
+        Returns {TopicPartition: next offset to commit} for the longest run of
+        consecutive written batches since the last call, or {} if nothing is ready.
+        """
+        offsets = {}
+        with self._lock:
+            while self._next_to_commit in self._done:
+                for tp, last_offset in self._done.pop(self._next_to_commit).items():
+                    offsets[tp] = max(offsets.get(tp, -1), last_offset + 1)
+                self._next_to_commit += 1
+        return offsets
+
+    def wait_idle(self, timeout=None):
+        """Waits until every submitted batch has been written. Returns False on timeout."""
+        deadline = None if timeout is None else time.time() + timeout
+        while self.depth() > 0:
+            if self._fatal is not None:
+                return False
+            if deadline is not None and time.time() >= deadline:
+                return False
+            time.sleep(0.1)
+        return True
+
+    def close(self, timeout=None):
+        """Waits for queued batches to be written, then stops the writers."""
+        self.wait_idle(timeout)
+        self._stopping.set()
+        for writer in self._writers:
+            writer.join(timeout=5)
+
+    # --- writer threads ---
+
+    @staticmethod
+    def _close(conn):
+        if conn is not None:
+            try:
+                conn.close()
+            except SQLAlchemyError:
+                pass
+
+    def _writer_loop(self):
+        conn = None
+        while not self._stopping.is_set():
+            try:
+                sealed = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            attempt = 0
+            while True:
+                try:
+                    if conn is None:
+                        conn = self.engine.connect()
+                    with conn.begin():
+                        self.write_batch(conn, sealed.events)
+                    break
+                except Exception as e:
+                    if not is_transient_error(e):
+                        # Not transient (bad data, SQL error, loader bug): retrying would spin forever
+                        logging.exception(f"❌ [{threading.current_thread().name}] Batch #{sealed.seq} failed "
+                                          f"with a non-transient error, stopping the writers")
+                        self._fatal = e
+                        self._stopping.set()
+                        self._close(conn)
+                        return
+                    attempt += 1
+                    backoff = min(self.retry_backoff_seconds * 2 ** (attempt - 1), 30)
+                    logging.error(f"❌ [{threading.current_thread().name}] Batch #{sealed.seq} failed "
+                                  f"(attempt {attempt}), retrying in {backoff:.0f}s: {e}")
+                    self._close(conn)
+                    conn = None
+                    if self._stopping.wait(backoff):
+                        # Shutdown while Snowflake is failing: leave the batch uncommitted for replay
+                        return
+            if self.on_written is not None:
+                try:
+                    self.on_written(sealed.events)
+                except Exception:
+                    # The batch is committed: a failing callback must not hold its offsets back
+                    logging.exception(f"❌ [{threading.current_thread().name}] Post-write hook failed "
+                                      f"for batch #{sealed.seq}")
+            with self._lock:
+                self._done[sealed.seq] = sealed.offsets
+                self._in_flight -= 1
+            self._queue.task_done()
+        self._close(conn)
@@ -0,0 +1,530 @@
+# batch_spool.py - Les Caves d'Albert
+# Write-ahead spool: sealed batches made durable on local disk, replayed into Snowflake in the background
+
+import os
+import mmap
+import json
+import time
+import zlib
+import struct
+import logging
+import threading
+from collections import deque
+from kafka.structs import TopicPartition
+from event_batch import EventBatch
+from snowflake_pool import is_transient_error
+
+RECORD_HEADER = struct.Struct("<II")  # payload length, CRC32 of the payload
+FIELD_LENGTHS = struct.Struct("<II")  # metadata length, content length (one per event)
+SEGMENT_SUFFIX = ".spool"
+CHECKPOINT_SUFFIX = ".drained"
+QUARANTINE_DIR = "quarantine"
+QUARANTINE_SUFFIX = ".bad"
+
+
+def encode_batch(events, spooled_at):
+    """
+    Serializes the part of an EventBatch the loaders need. The raw JSON documents
+    are written length-prefixed as they are, never re-encoded.
+    """
+    header = json.dumps({
+        "spooled_at": spooled_at,
+        "count": len(events),
+        "type_counts": events.type_counts,
+        "offset_ranges": [[tp.topic, tp.partition, first, last]
+                          for tp, (first, last) in events.offset_ranges.items()],
+        "excluded_offsets": [[tp.topic, tp.partition, offsets]
+                             for tp, offsets in events.excluded_offsets.items()],
+    }).encode("utf-8")
+    parts = [struct.pack("<I", len(header)), header]
+    for metadata, content in zip(events.metadata_json, events.content_json):
+        metadata, content = metadata.encode("utf-8"), content.encode("utf-8")
+        parts.append(FIELD_LENGTHS.pack(len(metadata), len(content)))
+        parts.append(metadata)
+        parts.append(content)
+    return b"".join(parts)
+
+
+def decode_batch(payload):
+    """Rebuilds (EventBatch, spooled_at) from an encode_batch() payload (bytes or memoryview)."""
+    (header_length,) = struct.unpack_from("<I", payload, 0)
+    position = 4 + header_length
+    header = json.loads(bytes(payload[4:position]))
+    events = EventBatch()
+    events.type_counts = header["type_counts"]
+    events.offset_ranges = {TopicPartition(topic, partition): (first, last)
+                            for topic, partition, first, last in header["offset_ranges"]}
+    events.excluded_offsets = {TopicPartition(topic, partition): offsets
+                               for topic, partition, offsets in header.get("excluded_offsets", [])}
+    for _ in range(header["count"]):
+        metadata_length, content_length = FIELD_LENGTHS.unpack_from(payload, position)
+        position += FIELD_LENGTHS.size
+        events.metadata_json.append(str(payload[position:position + metadata_length], "utf-8"))
+        position += metadata_length
+        events.content_json.append(str(payload[position:position + content_length], "utf-8"))
+        position += content_length
+    return events, header["spooled_at"]
+
+
+def read_record(buffer, position, end):
+    """Returns (payload, next position) for the record at `position`, or None if it is missing or torn."""
+    if position + RECORD_HEADER.size > end:
+        return None
+    length, crc = RECORD_HEADER.unpack_from(buffer, position)
+    start = position + RECORD_HEADER.size
+    if start + length > end:
+        return None
+    payload = memoryview(buffer)[start:start + length]
+    if zlib.crc32(payload) != crc:
+        payload.release()
+        return None
+    return payload, start + length
+
+
+def record_extent(buffer, position, end):
+    """Best guess of where an unreadable record ends: its declared length if it fits, else `end`."""
+    if position + RECORD_HEADER.size <= end:
+        length, _ = RECORD_HEADER.unpack_from(buffer, position)
+        if position + RECORD_HEADER.size + length <= end:
+            return position + RECORD_HEADER.size + length
+    return end
+
+
+class SpoolRecordError(Exception):
+    """A spooled record that cannot be read back (CRC mismatch or undecodable payload)."""
+
+    def __init__(self, message, segment, position, next_position):
+        super().__init__(message)
+        self.segment = segment
+        self.position = position
+        self.next_position = next_position
+
+
+def read_batch(buffer, segment, position, end):
+    """Returns (events, spooled_at, next position) of the record at `position`, raising SpoolRecordError."""
+    record = read_record(buffer, position, end)
+    if record is None:
+        raise SpoolRecordError(f"corrupt spool record in segment {segment} at byte {position}",
+                               segment, position, record_extent(buffer, position, end))
+    payload, next_position = record
+    try:
+        events, spooled_at = decode_batch(payload)
+    except Exception as e:
+        raise SpoolRecordError(f"undecodable spool record in segment {segment} at byte {position}: {e!r}",
+                               segment, position, next_position) from e
+    finally:
+        payload.release()
+    return events, spooled_at, next_position
+
+
+class BatchSpool:
+    """
+    Append-only, disk-backed queue of sealed batches between Kafka and Snowflake.
+
+    The consumer thread appends each sealed batch to the active segment file and
+    fsyncs it: once append() returns, the batch survives a crash and its Kafka
+    offsets can be committed. A drainer thread memory-maps the segments, replays
+    the batches into Snowflake in order and retries failed loads with exponential
+    backoff, so a Snowflake outage fills the disk (up to `max_bytes`, then the
+    consumer pauses) instead of the consumer's memory.
+
+    Progress is checkpointed per segment (`<segment>.drained`, byte offset of the
+    next batch) after each load; fully drained segments are deleted. A crash
+    between a load and its checkpoint replays that one batch (at-least-once).
+
+    Every failed load is retried: a suspended warehouse or a revoked grant raises the
+    same errors as a bad batch, and the batch's offsets are already committed. After
+    `isolate_after` consecutive non-transient failures (see snowflake_pool.is_transient_error)
+    the drainer loads the next batch as a probe: if it lands, the head batch is bad on
+    its own and is quarantined, otherwise Snowflake is the problem and the retries go on.
+    A record that cannot be read back (CRC mismatch, undecodable payload) is quarantined
+    at once. Quarantined bytes go to `quarantine/`, one spool record per `.bad` file,
+    and can be loaded again with replay_quarantine().
+    """
+
+    def __init__(self, directory, engine, write_batch, segment_bytes=64 * 1024 * 1024, max_bytes=None,
+                 retry_backoff_seconds=1.0, max_backoff_seconds=300.0, isolate_after=5, on_drained=None,
+                 on_failure=None, on_quarantine=None):
+        self.directory = directory
+        self.engine = engine
+        self.write_batch = write_batch  # callable(conn, events) run inside a transaction
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.isolate_after = isolate_after
+        self.on_drained = on_drained    # callable(events, spooled_at), called from the drainer thread
+        self.on_failure = on_failure    # callable(exception), idem
+        self.on_quarantine = on_quarantine  # callable(bytes quarantined), idem
+        self._cond = threading.Condition()
+        self._segments = []   # undrained segment numbers, oldest first (the active one last)
+        self._sizes = {}      # segment number -> bytes durably written
+        self._position = 0    # drainer position in the oldest segment
+        self._head_spooled_at = None  # spool time of the next batch to drain
+        self._head_attempts = 0  # failed loads of the next batch to drain
+        self._drained = deque()  # (time, events) of recent loads, for the drain rate
+        self._stopping = threading.Event()
+
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+        self._file = None
+        self._active = None
+        self._open_segment((self._segments[-1] + 1) if self._segments else 0)
+        self._map = None  # (segment number, mmap, mapped length) read by the drainer
+        self._drainer = threading.Thread(target=self._drain_loop, name="spool-drainer", daemon=True)
+        self._drainer.start()
+
+    # --- files ---
+
+    def _path(self, segment, suffix=SEGMENT_SUFFIX):
+        return os.path.join(self.directory, f"segment-{segment:010d}{suffix}")
+
+    def _recover(self):
+        """Reloads the segments left by a previous run and truncates a torn last append."""
+        segments = sorted(int(name[len("segment-"):-len(SEGMENT_SUFFIX)])
+                          for name in os.listdir(self.directory) if name.endswith(SEGMENT_SUFFIX))
+        for segment in segments:
+            path = self._path(segment)
+            size = os.path.getsize(path)
+            end = 0
+            if size:
+                with open(path, "rb") as f, mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as buffer:
+                    while True:
+                        record = read_record(buffer, end, size)
+                        if record is None:
+                            # A readable record after it means corruption, not a torn tail: the drainer
+                            # quarantines the bad record instead of losing the acknowledged ones after it
+                            skip = record_extent(buffer, end, size)
+                            record = read_record(buffer, skip, size) if skip < size else None
+                            if record is None:
+                                break
+                        record[0].release()
+                        end = record[1]
+            if end < size:
+                if segment != segments[-1]:
+                    # Only the last segment can hold a torn append: this is corruption of acknowledged batches
+                    logging.error(f"❌ Spool segment {segment}: unreadable record at byte {end}, "
+                                  f"quarantining {size - end} byte(s)")
+                    with open(path, "rb") as f:
+                        f.seek(end)
+                        self._write_quarantine(segment, end, f.read())
+                else:
+                    # Never fsynced, so never acknowledged: its offsets were not committed and Kafka replays it
+                    logging.warning(f"⚠️  Spool segment {segment}: truncating {size - end} byte(s) of torn write")
+                os.truncate(path, end)
+            self._segments.append(segment)
+            self._sizes[segment] = end
+        if self._segments:
+            self._position = self._read_checkpoint(self._segments[0])
+            logging.info(f"💾 Spool: {len(self._segments)} segment(s) to replay, {self.depth_bytes()} bytes")
+
+    def _read_checkpoint(self, segment):
+        try:
+            with open(self._path(segment, CHECKPOINT_SUFFIX)) as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _write_checkpoint(self, segment, position):
+        path = self._path(segment, CHECKPOINT_SUFFIX)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(str(position))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def _write_quarantine(self, segment, position, data):
+        directory = os.path.join(self.directory, QUARANTINE_DIR)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"segment-{segment:010d}-at-{position:010d}{QUARANTINE_SUFFIX}")
+        with open(path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        self._fsync_directory(directory)
+        return path
+
+    def _fsync_directory(self, directory=None):
+        fd = os.open(directory or self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _open_segment(self, segment):
+        if self._file is not None:
+            self._file.close()
+        self._file = open(self._path(segment), "ab")
+        self._fsync_directory()  # the new file entry itself must survive a crash
+        with self._cond:
+            self._active = segment
+            if segment not in self._sizes:
+                self._segments.append(segment)
+                self._sizes[segment] = 0
+
+    def _remove_segment(self, segment):
+        for suffix in (SEGMENT_SUFFIX, CHECKPOINT_SUFFIX):
+            try:
+                os.remove(self._path(segment, suffix))
+            except FileNotFoundError:
+                pass
+
+    # --- consumer-thread API ---
+
+    def append(self, events):
+        """Durably spools a sealed batch. Once this returns, its Kafka offsets may be committed."""
+        payload = encode_batch(events, time.time())
+        self._file.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)))
+        self._file.write(payload)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        with self._cond:
+            self._sizes[self._active] += RECORD_HEADER.size + len(payload)
+            rotate = self._sizes[self._active] >= self.segment_bytes
+            self._cond.notify_all()
+        if rotate:
+            self._open_segment(self._active + 1)
+
+    def is_full(self):
+        return self.max_bytes is not None and self.depth_bytes() >= self.max_bytes
+
+    def depth_bytes(self):
+        """Bytes spooled but not yet loaded into Snowflake."""
+        with self._cond:
+            return sum(self._sizes.values()) - self._position
+
+    def segment_count(self):
+        with self._cond:
+            return len(self._segments)
+
+    def oldest_age(self):
+        """Seconds since the oldest batch still in the spool was written (0 when drained)."""
+        with self._cond:
+            if self._head_spooled_at is None:
+                return 0.0
+            return max(0.0, time.time() - self._head_spooled_at)
+
+    def drain_rate(self, window_seconds=60.0):
+        """Events loaded into Snowflake per second over the last `window_seconds`."""
+        cutoff = time.time() - window_seconds
+        with self._cond:
+            while self._drained and self._drained[0][0] < cutoff:
+                self._drained.popleft()
+            return sum(count for _, count in self._drained) / window_seconds
+
+    def wait_drained(self, timeout=None):
+        """Waits until every spooled batch has been loaded. Returns False on timeout."""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while sum(self._sizes.values()) > self._position:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(timeout=0.5 if remaining is None else min(0.5, remaining))
+        return True
+
+    def close(self, timeout=None):
+        """Gives the drainer up to `timeout` seconds to catch up, then stops it. Undrained batches stay on disk."""
+        drained = self.wait_drained(timeout)
+        self._stopping.set()
+        with self._cond:
+            self._cond.notify_all()
+        self._drainer.join(timeout=10)
+        self._file.close()
+        if not drained:
+            logging.warning(f"💾 {self.depth_bytes()} spooled byte(s) left in {self.directory}, "
+                            "replayed at next start")
+        return drained
+
+    # --- drainer thread ---
+
+    def _next_batch(self):
+        """Returns (segment, position, events, spooled_at, next position) of the oldest undrained batch, or None."""
+        with self._cond:
+            segment = self._segments[0]
+            end = self._sizes[segment]
+            position = self._position
+            if position >= end:
+                if segment == self._active:
+                    self._head_spooled_at = None
+                    self._cond.wait(timeout=0.5)
+                    return None
+                # Closed and fully loaded
+                self._segments.pop(0)
+                del self._sizes[segment]
+                self._position = self._read_checkpoint(self._segments[0])
+        if position >= end:
+            self._unmap()
+            self._remove_segment(segment)
+            return None
+
+        if self._map is None or self._map[0] != segment or self._map[2] < end:
+            self._unmap()
+            with open(self._path(segment), "rb") as f:
+                self._map = (segment, mmap.mmap(f.fileno(), end, access=mmap.ACCESS_READ), end)
+        events, spooled_at, next_position = read_batch(self._map[1], segment, position, end)
+        with self._cond:
+            self._head_spooled_at = spooled_at
+        return segment, position, events, spooled_at, next_position
+
+    def _probe_batch(self, segment, position):
+        """The batch spooled after the head one (which ends at `position`), or None if there is none yet."""
+        with self._cond:
+            end = self._sizes[segment]
+            if position >= end:
+                if segment == self._active or len(self._segments) < 2:
+                    return None
+                segment, position = self._segments[1], 0
+                end = self._sizes[segment]
+                if end == 0:
+                    return None
+        with open(self._path(segment), "rb") as f, mmap.mmap(f.fileno(), end, access=mmap.ACCESS_READ) as buffer:
+            try:
+                events, spooled_at, next_position = read_batch(buffer, segment, position, end)
+            except SpoolRecordError:
+                return None  # quarantined on its own once it reaches the head
+        return segment, position, events, spooled_at, next_position
+
+    def _unmap(self):
+        if self._map is not None:
+            self._map[1].close()
+            self._map = None
+
+    def _advance(self, segment, next_position, count):
+        self._write_checkpoint(segment, next_position)
+        with self._cond:
+            if segment == self._segments[0]:
+                self._position = next_position
+            self._head_spooled_at = None
+            self._head_attempts = 0
+            self._drained.append((time.time(), count))
+            self._cond.notify_all()
+
+    def head_attempts(self):
+        """Failed loads of the oldest undrained batch so far (0 while the spool drains normally)."""
+        with self._cond:
+            return self._head_attempts
+
+    def _quarantine(self, segment, position, next_position):
+        """Moves the bytes of an unloadable record aside and checkpoints past them."""
+        path = self._write_quarantine(segment, position, self._map[1][position:next_position])
+        self._advance(segment, next_position, 0)
+        logging.error(f"❌ Quarantined {next_position - position} spooled byte(s) to {path}")
+        if self.on_quarantine is not None:
+            self.on_quarantine(next_position - position)
+
+    def _load(self, events):
+        with self.engine.begin() as conn:
+            self.write_batch(conn, events)
+
+    def _drained_hook(self, events, spooled_at):
+        if self.on_drained is not None:
+            try:
+                self.on_drained(events, spooled_at)
+            except Exception:
+                logging.exception("❌ Post-drain hook failed")
+
+    def _isolate(self, segment, position, next_position):
+        """
+        Loads the batch after the failing head. Returns True if it landed: the head was
+        then quarantined and the checkpoint moved past both.
+        """
+        probe = self._probe_batch(segment, next_position)
+        if probe is None:
+            return False
+        probe_segment, _, probe_events, probe_spooled_at, probe_next = probe
+        try:
+            self._load(probe_events)
+        except Exception as e:
+            logging.error(f"❌ Probe batch failed too, Snowflake is unavailable: {e!r}")
+            return False
+        logging.error(f"❌ Spooled batch in segment {segment} at byte {position} fails on its own "
+                      f"({self._head_attempts} attempts) while the next batch loads")
+        self._quarantine(segment, position, next_position)
+        self._advance(probe_segment, probe_next, len(probe_events))
+        self._drained_hook(probe_events, probe_spooled_at)
+        return True
+
+    def _back_off(self, attempt, error):
+        with self._cond:
+            self._head_attempts += 1
+        backoff = min(self.retry_backoff_seconds * 2 ** (attempt - 1), self.max_backoff_seconds)
+        logging.error(f"❌ Spool replay failed (attempt {attempt}), retrying in {backoff:.0f}s: {error!r}")
+        if self.on_failure is not None:
+            self.on_failure(error)
+        self._stopping.wait(backoff)
+
+    def _drain_loop(self):
+        attempt, rejected = 0, 0  # failed loads of the head batch, of which non-transient
+        while not self._stopping.is_set():
+            batch = None
+            try:
+                batch = self._next_batch()
+                if batch is None:
+                    continue
+                segment, position, events, spooled_at, next_position = batch
+                self._load(events)
+            except SpoolRecordError as e:
+                logging.error(f"❌ {e}")
+                try:
+                    self._quarantine(e.segment, e.position, e.next_position)
+                    attempt, rejected = 0, 0
+                except OSError as error:
+                    attempt += 1
+                    self._back_off(attempt, error)
+                continue
+            except Exception as e:
+                if batch is not None and not is_transient_error(e):
+                    rejected += 1
+                    if rejected % self.isolate_after == 0:  # probe every `isolate_after` failures
+                        try:
+                            if self._isolate(segment, position, next_position):
+                                attempt, rejected = 0, 0
+                                continue
+                        except OSError as error:
+                            e = error
+                attempt += 1
+                self._back_off(attempt, e)
+                continue
+            attempt, rejected = 0, 0
+            self._advance(segment, next_position, len(events))
+            self._drained_hook(events, spooled_at)
+        self._unmap()
+
+
+def replay_quarantine(directory, engine, write_batch):
+    """
+    Re-feeds the quarantined records of `directory` (a spool's `quarantine/`) through
+    `write_batch`, one transaction per file. A file is deleted once all its records
+    are loaded; a file holding an unreadable record is left untouched for inspection.
+    Returns (files replayed, files left).
+    """
+    replayed, left = 0, 0
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(QUARANTINE_SUFFIX):
+            continue
+        path = os.path.join(directory, name)
+        with open(path, "rb") as f:
+            data = f.read()
+        batches, position = [], 0
+        try:
+            while position < len(data):
+                events, _, position = read_batch(data, name, position, len(data))
+                batches.append(events)
+        except SpoolRecordError as e:
+            logging.error(f"❌ {path}: {e}, file left for inspection")
+            left += 1
+            continue
+        try:
+            with engine.begin() as conn:
+                for events in batches:
+                    write_batch(conn, events)
+        except Exception:
+            logging.exception(f"❌ {path}: replay failed, file kept")
+            left += 1
+            continue
+        os.remove(path)
+        replayed += 1
+        logging.info(f"♻️  {path}: {sum(len(events) for events in batches)} event(s) replayed")
+    return replayed, left
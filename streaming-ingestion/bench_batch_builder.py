@@ -0,0 +1,116 @@
+# bench_batch_builder.py - Les Caves d'Albert
+# Microbenchmark: pandas batch preparation (previous hot path) vs. columnar EventBatch
+#
+# Usage:
+#   python bench_batch_builder.py --events 200000 --batch-size 1000
+#
+# Each path runs in its own process so peak RSS is measured independently
+# (resource.getrusage, Linux/macOS only).
+
+import json
+import time
+import random
+import argparse
+import resource
+import multiprocessing
+from collections import namedtuple
+from event_batch import EventBatch
+from event_codec import get_codec
+
+# Same attributes as kafka.consumer.fetcher.ConsumerRecord used by the consumer
+Record = namedtuple("Record", ["topic", "partition", "offset", "timestamp", "key", "value"])
+
+
+def make_records(count):
+    rng = random.Random(42)
+    records = []
+    for offset in range(count):
+        key = f"{rng.getrandbits(128):032x}"
+        if rng.random() < 0.7:
+            event = {
+                "event_type": "ORDER_CREATED", "order_line_id": key,
+                "customer_id": rng.randint(1, 150), "product_id": rng.randint(1000, 1049),
+                "product_name": "Pinot Noir 2019 – Réserve", "category": "🍷 Rouge",
+                "quantity": rng.choice([1, 2, 3, 6]), "unit_price": 21.5, "total_price": 43.0,
+                "discount": 0.0, "bottle_size_l": 0.75, "sales_channel": "E-com",
+                "event_ts": "2025-10-01T12:00:00+00:00", "source_service": "ecom_api", "emoji": "🛒"
+            }
+        else:
+            event = {
+                "event_type": "INVENTORY_ADJUSTED", "event_id": key,
+                "product_id": rng.randint(1000, 1049), "product_name": "Champagne 2020 – Prestige",
+                "category": "🍾 Effervescent", "quantity_change": rng.randint(20, 150),
+                "adjustment_type": "REPLENISHMENT", "warehouse_location": "Cave Centrale",
+                "event_ts": "2025-10-01T12:00:00+00:00", "source_service": "warehouse_management",
+                "emoji": "📦"
+            }
+        records.append(Record("sales_events", 0, offset, 1759320000000, key.encode("utf-8"), json.dumps(event)))
+    return records
+
+
+def pandas_path(records, batch_size):
+    """Previous consumer path: dict batch -> DataFrame -> .apply extraction -> json.dumps again."""
+    import pandas as pd
+    for start in range(0, len(records), batch_size):
+        batch = []
+        for msg in records[start:start + batch_size]:
+            event_content = json.loads(msg.value)
+            batch.append({
+                "EVENT_METADATA": {
+                    "topic": msg.topic, "partition": msg.partition, "offset": msg.offset,
+                    "timestamp_ms": msg.timestamp, "key": msg.key.decode('utf-8') if msg.key else None
+                },
+                "EVENT_CONTENT": event_content
+            })
+        df = pd.DataFrame(batch)
+        df['EVENT_TYPE'] = df['EVENT_CONTENT'].apply(lambda x: x.get('event_type', 'UNKNOWN'))
+        df['PRODUCT_ID'] = df['EVENT_CONTENT'].apply(lambda x: x.get('product_id', None))
+        df['CUSTOMER_ID'] = df['EVENT_CONTENT'].apply(lambda x: x.get('customer_id', None))
+        df['EVENT_TYPE'].value_counts().to_dict()
+        df['EVENT_METADATA'].apply(json.dumps).tolist()
+        df['EVENT_CONTENT'].apply(json.dumps).tolist()
+
+
+def columnar_path(records, batch_size):
+    """Current consumer path: one decode per event, raw JSON kept, columns appended in one pass."""
+    codec = get_codec()
+    for start in range(0, len(records), batch_size):
+        batch = EventBatch()
+        for msg in records[start:start + batch_size]:
+            batch.append(msg, codec.decode_event(msg.value))
+        batch.type_counts
+        batch.metadata_json
+        batch.content_json
+
+
+def _run(path_name, events, batch_size, results):
+    records = make_records(events)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    path = pandas_path if path_name == "pandas" else columnar_path
+    start = time.perf_counter()
+    path(records, batch_size)
+    elapsed = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results[path_name] = (events / elapsed, peak_rss / 1024, (peak_rss - rss_before) / 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare batch preparation paths of the consumer")
+    parser.add_argument("--events", type=int, default=200_000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    results = multiprocessing.Manager().dict()
+    for path_name in ("pandas", "columnar"):
+        proc = multiprocessing.Process(target=_run, args=(path_name, args.events, args.batch_size, results))
+        proc.start()
+        proc.join()
+
+    print(f"{'path':<10}{'events/sec':>14}{'peak RSS MB':>14}{'RSS growth MB':>15}")
+    for path_name in ("pandas", "columnar"):
+        rate, peak, growth = results[path_name]
+        print(f"{path_name:<10}{rate:>14,.0f}{peak:>14.1f}{growth:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
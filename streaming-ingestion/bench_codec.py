@@ -0,0 +1,114 @@
+# bench_codec.py - Les Caves d'Albert
+# Encode / decode+validate throughput of every installed JSON codec backend
+#
+# Usage:
+#   python bench_codec.py --events 100000
+#   python bench_codec.py --check    # same decode_event() outcome on every backend, then exit
+
+import sys
+import time
+import argparse
+from event_codec import (available_backends, get_codec, to_builtins, OrderCreated, InventoryAdjusted,
+                         UnknownEvent, InvalidEventError, EventDecodeError)
+
+# Edge cases the consumer must route identically whatever the backend (DLQ label included)
+PARITY_PAYLOADS = [
+    '{"event_type": "ORDER_CREATED", "order_line_id": "a1", "customer_id": 7, "product_id": 1001, "quantity": 2}',
+    '{"event_type": "ORDER_CREATED", "order_line_id": "a1", "customer_id": 7, "product_id": "1001", "quantity": 2}',
+    '{"event_type": "ORDER_CREATED", "order_line_id": "a1", "customer_id": 7}',
+    '{"event_type": "INVENTORY_ADJUSTED", "event_id": "b2", "product_id": 1001, "quantity_change": -3, '
+    '"adjustment_type": "SPOILAGE"}',
+    '{"event_type": "INVENTORY_ADJUSTED", "event_id": "b2", "product_id": null, "quantity_change": -3, '
+    '"adjustment_type": "SPOILAGE"}',
+    '{"event_type": "PRICE_CHANGED", "product_id": 1001, "customer_id": null}',
+    '{"event_type": "PRICE_CHANGED", "product_id": "SKU-1001", "customer_id": 7.5}',
+    '{"event_type": null, "product_id": 1001}',
+    '{"event_type": 42}',
+    '{"event_type": ["ORDER_CREATED"]}',
+    '{"product_id": 1001}',
+    '[1, 2, 3]',
+    '{"event_type": "ORDER_CREATED",',
+]
+
+
+def decode_outcome(codec, raw):
+    """What the consumer would do with `raw`: load it, pass it through, or send it to the DLQ."""
+    try:
+        event = codec.decode_event(raw)
+    except InvalidEventError as e:
+        return ('invalid', e.event_type)
+    except EventDecodeError:
+        return ('decode_error',)
+    if isinstance(event, UnknownEvent):
+        return ('unknown', event.event_type, event.product_id, event.customer_id)
+    return ('event', type(event).__name__, to_builtins(event))
+
+
+def check_parity():
+    """Prints every payload whose outcome differs between backends. Returns True if none does."""
+    backends = available_backends()
+    codecs = [get_codec(name) for name in backends]
+    mismatches = 0
+    for raw in PARITY_PAYLOADS:
+        outcomes = [decode_outcome(codec, raw) for codec in codecs]
+        if any(outcome != outcomes[0] for outcome in outcomes[1:]):
+            mismatches += 1
+            print(f"❌ {raw}")
+            for name, outcome in zip(backends, outcomes):
+                print(f"   {name:<10}{outcome}")
+    print(f"{'✅' if not mismatches else '❌'} {len(PARITY_PAYLOADS) - mismatches}/{len(PARITY_PAYLOADS)} "
+          f"payload(s) decoded identically by {', '.join(backends)}")
+    return mismatches == 0
+
+
+def make_events(count):
+    events = []
+    for i in range(count):
+        if i % 10 < 7:
+            events.append(OrderCreated(
+                order_line_id=f"{i:032x}", customer_id=i % 150 + 1, product_id=1000 + i % 50,
+                product_name="Pinot Noir 2019 – Réserve", category="🍷 Rouge", quantity=2,
+                unit_price=21.5, total_price=43.0, discount=0.0, bottle_size_l=0.75,
+                sales_channel="E-com", event_ts="2025-10-01T12:00:00+00:00",
+                source_service="ecom_api", emoji="🛒"
+            ))
+        else:
+            events.append(InventoryAdjusted(
+                event_id=f"{i:032x}", product_id=1000 + i % 50, product_name="Champagne 2020 – Prestige",
+                category="🍾 Effervescent", quantity_change=42, adjustment_type="REPLENISHMENT",
+                warehouse_location="Cave Centrale", event_ts="2025-10-01T12:00:00+00:00",
+                source_service="warehouse_management", emoji="📦"
+            ))
+    return events
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the JSON codec backends")
+    parser.add_argument("--events", type=int, default=100_000)
+    parser.add_argument("--check", action="store_true", help="Only check that the backends agree on edge cases")
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(0 if check_parity() else 1)
+
+    events = make_events(args.events)
+    print(f"{'backend':<10}{'encode ev/s':>14}{'decode ev/s':>14}")
+    for name in available_backends():
+        codec = get_codec(name)
+
+        start = time.perf_counter()
+        payloads = [codec.encode(event) for event in events]
+        encode_rate = args.events / (time.perf_counter() - start)
+
+        # The consumer decodes the text value (kafka value_deserializer decodes bytes to str)
+        texts = [payload.decode("utf-8") for payload in payloads]
+        start = time.perf_counter()
+        for text in texts:
+            codec.decode_event(text)
+        decode_rate = args.events / (time.perf_counter() - start)
+
+        print(f"{name:<10}{encode_rate:>14,.0f}{decode_rate:>14,.0f}")
+
+
+if __name__ == "__main__":
+    main()
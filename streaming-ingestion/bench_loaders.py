@@ -0,0 +1,178 @@
+# bench_loaders.py - Les Caves d'Albert
+# Local stand-in for Snowflake to compare the consumer's loader backends (rows/sec)
+#
+# Usage:
+#   python bench_loaders.py --batches 20 --batch-size 1000 --rtt-ms 40
+#
+# The stand-in is an in-memory SQLite database that understands the handful of
+# Snowflake statements the loaders emit (PARSE_JSON, VARIANT paths, PUT, COPY INTO).
+# Every statement pays a simulated network round trip, and uploaded bytes pay a
+# simulated bandwidth cost, so the comparison reflects round trips and payload size.
+
+import os
+import re
+import gzip
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.pool import StaticPool
+from snowflake_loaders import make_loader, pq, RAW_TABLE_NAME
+
+SCHEMA = "RAW_DATA"
+
+_PARSE_JSON_PATH = re.compile(r"PARSE_JSON\((\w+)\):(\w+)::\w+")
+_PARSE_JSON = re.compile(r"PARSE_JSON\((\w+)\)")
+_VARIANT_PATH = re.compile(r"\b(CONTENT):(\w+)(?:::\w+(?:\(\d+,\d+\))?)?")
+_PUT = re.compile(r"^\s*PUT\s+'file://([^']+)'", re.IGNORECASE)
+_COPY_FILES = re.compile(r"FILES\s*=\s*\('([^']+)'\)", re.IGNORECASE)
+
+
+def create_standin_engine(stage_dir, rtt_ms=40.0, upload_mbps=100.0):
+    """Builds a SQLite engine emulating the Snowflake statements used by the loaders."""
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+
+    @event.listens_for(engine, "connect")
+    def _attach_schema(dbapi_conn, _):
+        dbapi_conn.execute(f"ATTACH DATABASE ':memory:' AS {SCHEMA}")
+
+    @event.listens_for(engine, "before_cursor_execute", retval=True)
+    def _emulate(conn, cursor, statement, parameters, context, executemany):
+        # Network cost: one round trip per statement + upload time for the statement/file bytes
+        payload_bytes = len(statement) + sum(len(str(p)) for p in (parameters or ()))
+        put = _PUT.match(statement)
+        if put:
+            payload_bytes = os.path.getsize(put.group(1))
+        time.sleep(rtt_ms / 1000 + payload_bytes * 8 / (upload_mbps * 1_000_000))
+
+        if put:
+            shutil.copy(put.group(1), stage_dir)
+            return "SELECT 1", ()
+
+        if statement.lstrip().upper().startswith("COPY INTO"):
+            file_name = _COPY_FILES.search(statement).group(1)
+            staged = os.path.join(stage_dir, file_name)
+            cursor.executemany(
+                f"INSERT INTO {SCHEMA}.{RAW_TABLE_NAME} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                _read_staged_rows(staged)
+            )
+            os.remove(staged)  # PURGE = TRUE
+            return "SELECT 1", ()
+
+        if "PARSE_JSON" in statement:
+            statement = _PARSE_JSON_PATH.sub(r"json_extract(\1, '$.\2')", statement)
+            statement = _PARSE_JSON.sub(r"\1", statement)
+            statement = statement.replace("TRY_TO_TIMESTAMP_NTZ", "").replace("TRY_CAST", "CAST")
+            statement = _VARIANT_PATH.sub(r"json_extract(\1, '$.\2')", statement)
+        return statement, parameters
+
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+            CREATE TABLE {SCHEMA}.{RAW_TABLE_NAME} (
+                EVENT_TYPE TEXT, PRODUCT_ID INTEGER, CUSTOMER_ID INTEGER,
+                EVENT_TS TEXT, EVENT_ID TEXT, QUANTITY INTEGER, TOTAL_PRICE REAL, QUANTITY_CHANGE INTEGER,
+                EVENT_METADATA TEXT, EVENT_CONTENT TEXT
+            )
+        """))
+    return engine
+
+
+def _read_staged_rows(path):
+    """Yields RAW_EVENTS_STREAM rows from a staged NDJSON.gz or Parquet file."""
+    if path.endswith(".parquet"):
+        table = pq.read_table(path).to_pydict()
+        documents = zip(table["EVENT_METADATA"], table["EVENT_CONTENT"])
+        documents = ((json.loads(m), json.loads(c)) for m, c in documents)
+    else:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            documents = [json.loads(line) for line in f]
+        documents = ((d["EVENT_METADATA"], d["EVENT_CONTENT"]) for d in documents)
+    for metadata, content in documents:
+        yield (
+            content.get("event_type"), content.get("product_id"), content.get("customer_id"),
+            content.get("event_ts"), content.get("order_line_id", content.get("event_id")),
+            content.get("quantity"), content.get("total_price"), content.get("quantity_change"),
+            json.dumps(metadata), json.dumps(content)
+        )
+
+
+def synthetic_batch(rng, batch_size, offset):
+    """Builds JSON documents shaped like the producer's events."""
+    metadata_json, content_json = [], []
+    for i in range(batch_size):
+        if rng.random() < 0.7:
+            content = {
+                "event_type": "ORDER_CREATED", "order_line_id": f"{offset + i:032x}",
+                "customer_id": rng.randint(1, 150), "product_id": rng.randint(1000, 1049),
+                "product_name": "Pinot Noir 2019 – Réserve", "category": "🍷 Rouge",
+                "quantity": rng.choice([1, 2, 3, 6]), "unit_price": 21.5, "total_price": 43.0,
+                "discount": 0.0, "bottle_size_l": 0.75, "sales_channel": "E-com",
+                "event_ts": "2025-10-01T12:00:00+00:00", "source_service": "ecom_api", "emoji": "🛒"
+            }
+        else:
+            content = {
+                "event_type": "INVENTORY_ADJUSTED", "event_id": f"{offset + i:032x}",
+                "product_id": rng.randint(1000, 1049), "product_name": "Champagne 2020 – Prestige",
+                "category": "🍾 Effervescent", "quantity_change": rng.randint(20, 150),
+                "adjustment_type": "REPLENISHMENT", "warehouse_location": "Cave Centrale",
+                "event_ts": "2025-10-01T12:00:00+00:00", "source_service": "warehouse_management",
+                "emoji": "📦"
+            }
+        metadata = {"topic": "sales_events", "partition": 0, "offset": offset + i,
+                    "timestamp_ms": 1759320000000, "key": content.get("order_line_id", content.get("event_id"))}
+        metadata_json.append(json.dumps(metadata))
+        content_json.append(json.dumps(content))
+    return metadata_json, content_json
+
+
+def run_backend(backend, file_format, batches, batch_size, rtt_ms, upload_mbps):
+    """Loads `batches` synthetic batches through one backend. Returns (rows, seconds)."""
+    stage_dir = tempfile.mkdtemp(prefix="standin_stage_")
+    engine = create_standin_engine(stage_dir, rtt_ms=rtt_ms, upload_mbps=upload_mbps)
+    loader = make_loader(backend, SCHEMA, file_format)
+    rng = random.Random(42)
+    payloads = [synthetic_batch(rng, batch_size, b * batch_size) for b in range(batches)]
+
+    start = time.perf_counter()
+    for metadata_json, content_json in payloads:
+        with engine.connect() as conn:
+            with conn.begin():
+                loader.load(conn, metadata_json, content_json)
+    elapsed = time.perf_counter() - start
+
+    with engine.connect() as conn:
+        rows = conn.execute(text(f"SELECT COUNT(*) FROM {SCHEMA}.{RAW_TABLE_NAME}")).scalar()
+    engine.dispose()
+    shutil.rmtree(stage_dir, ignore_errors=True)
+    return rows, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare consumer loader backends against a local stand-in")
+    parser.add_argument("--batches", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--rtt-ms", type=float, default=40.0, help="Simulated round trip per statement")
+    parser.add_argument("--upload-mbps", type=float, default=100.0, help="Simulated upload bandwidth")
+    args = parser.parse_args()
+
+    variants = [("insert", "ndjson"), ("copy", "ndjson")]
+    if pq is not None:
+        variants.append(("copy", "parquet"))
+
+    print(f"{'backend':<16}{'rows':>10}{'seconds':>10}{'rows/sec':>12}")
+    for backend, file_format in variants:
+        rows, elapsed = run_backend(backend, file_format, args.batches, args.batch_size,
+                                    args.rtt_ms, args.upload_mbps)
+        label = backend if backend == "insert" else f"copy/{file_format}"
+        print(f"{label:<16}{rows:>10}{elapsed:>10.2f}{rows / elapsed:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
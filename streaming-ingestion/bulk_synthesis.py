@@ -0,0 +1,314 @@
+# bulk_synthesis.py - Les Caves d'Albert
+# Vectorized bulk event synthesis: millions of events per call as NumPy/Arrow column batches
+#
+# Same distributions as kafka_producer.py (70/30 orders/inventory, quantity weights,
+# 25% discounts, adjustment type weights) and the same product catalog, drawn with
+# NumPy for a whole chunk at once. Used for backfills and Snowflake capacity tests.
+#
+# Usage:
+#   python bulk_synthesis.py --events 10000000 --days 90 --output history.parquet
+#   python bulk_synthesis.py --events 1000000 --days 30 --output history.ndjson.gz
+#   python bulk_synthesis.py --events 1000000 --days 7 --kafka
+
+import os
+import gzip
+import time
+import logging
+import argparse
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from dotenv import load_dotenv
+from event_codec import get_codec
+from product_catalog import build_catalog
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet output is optional, NDJSON and Kafka work without pyarrow
+    pa = None
+    pq = None
+
+# --- DISTRIBUTIONS (kept in sync with kafka_producer.py) ---
+
+ORDER_PROBABILITY = 0.7
+CUSTOMER_ID_RANGE = (1, 150)
+SALES_CHANNELS = ["E-com", "Boutique Paris", "Boutique Lyon", "Boutique Bordeaux"]
+BOTTLE_SIZES = [0.375, 0.5, 0.75, 1.0, 1.5]
+QUANTITIES = [1, 2, 3, 6]
+QUANTITY_WEIGHTS = [0.6, 0.25, 0.1, 0.05]
+DISCOUNT_PROBABILITY = 0.25
+DISCOUNT_MAX = 10.0
+ADJUSTMENT_TYPES = ["REPLENISHMENT", "CORRECTION", "SPOILAGE"]
+ADJUSTMENT_WEIGHTS = [0.6, 0.3, 0.1]
+ADJUSTMENT_EMOJIS = ["📦", "✏️", "❌"]
+REPLENISHMENT_RANGE = (20, 150)
+CORRECTION_RANGE = (-15, -1)
+WAREHOUSES = ["Entrepôt Paris", "Entrepôt Lyon", "Entrepôt Bordeaux", "Cave Centrale"]
+
+# Columns only meaningful for one event type (null for the other one)
+ORDER_COLUMNS = ("customer_id", "quantity", "unit_price", "total_price", "discount",
+                 "bottle_size_l", "sales_channel")
+INVENTORY_COLUMNS = ("quantity_change", "adjustment_type", "warehouse_location")
+
+if pa is not None:
+    ARROW_SCHEMA = pa.schema([
+        ("event_type", pa.string()),
+        ("event_key", pa.string()),  # order_line_id / event_id
+        ("product_id", pa.int32()),
+        ("product_name", pa.string()),
+        ("category", pa.string()),
+        ("event_ts", pa.timestamp("us", tz="UTC")),
+        ("source_service", pa.string()),
+        ("emoji", pa.string()),
+        ("customer_id", pa.int32()),
+        ("quantity", pa.int32()),
+        ("unit_price", pa.float64()),
+        ("total_price", pa.float64()),
+        ("discount", pa.float64()),
+        ("bottle_size_l", pa.float64()),
+        ("sales_channel", pa.string()),
+        ("quantity_change", pa.int32()),
+        ("adjustment_type", pa.string()),
+        ("warehouse_location", pa.string()),
+    ])
+else:
+    ARROW_SCHEMA = None
+
+
+def _uuid4_strings(rng, n):
+    """n random UUID4 strings, formatted without a Python-level loop."""
+    raw = np.frombuffer(rng.bytes(16 * n), dtype=np.uint8).reshape(n, 16).copy()
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40  # version 4
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80  # RFC 4122 variant
+    hex_digits = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+    digits = np.empty((n, 32), dtype=np.uint8)
+    digits[:, 0::2] = hex_digits[raw >> 4]
+    digits[:, 1::2] = hex_digits[raw & 0x0F]
+    out = np.full((n, 36), ord("-"), dtype=np.uint8)
+    for start, end, dest in ((0, 8, 0), (8, 12, 9), (12, 16, 14), (16, 20, 19), (20, 32, 24)):
+        out[:, dest:dest + end - start] = digits[:, start:end]
+    return out.view("S36").ravel().astype(str).astype(object)
+
+
+class EventColumns:
+    """
+    A chunk of synthetic events stored column by column.
+
+    Every column has one entry per event; `is_order` tells which rows are
+    ORDER_CREATED, and the type-specific columns are only meaningful on the
+    matching rows (they become nulls in Arrow and are omitted in JSON).
+    """
+
+    __slots__ = ("columns", "is_order")
+
+    def __init__(self, columns, is_order):
+        self.columns = columns
+        self.is_order = is_order
+
+    def __len__(self):
+        return len(self.is_order)
+
+    def to_arrow(self):
+        if pa is None:
+            raise RuntimeError("pyarrow is required for Arrow/Parquet output")
+        arrays = []
+        for field in ARROW_SCHEMA:
+            values = self.columns[field.name]
+            if field.name in ORDER_COLUMNS:
+                mask = ~self.is_order
+            elif field.name in INVENTORY_COLUMNS:
+                mask = self.is_order
+            else:
+                mask = None
+            arrays.append(pa.array(values, type=field.type, mask=mask))
+        return pa.Table.from_arrays(arrays, schema=ARROW_SCHEMA)
+
+    def iter_records(self):
+        """Yields (key, event dict, timestamp_ms) with the same fields as the producer's events."""
+        c = {name: values.tolist() for name, values in self.columns.items() if name != "event_ts"}
+        ts_iso = [ts + "+00:00" for ts in np.datetime_as_string(self.columns["event_ts"], unit="us").tolist()]
+        ts_ms = self.columns["event_ts"].astype("datetime64[ms]").astype(np.int64).tolist()
+        rows = zip(self.is_order.tolist(), c["event_key"], c["product_id"], c["product_name"], c["category"],
+                   ts_iso, c["source_service"], c["emoji"], c["customer_id"], c["quantity"], c["unit_price"],
+                   c["total_price"], c["discount"], c["bottle_size_l"], c["sales_channel"],
+                   c["quantity_change"], c["adjustment_type"], c["warehouse_location"], ts_ms)
+        for (is_order, key, product_id, product_name, category, event_ts, source_service, emoji,
+             customer_id, quantity, unit_price, total_price, discount, bottle_size_l, sales_channel,
+             quantity_change, adjustment_type, warehouse_location, timestamp_ms) in rows:
+            if is_order:
+                event = {
+                    "event_type": "ORDER_CREATED", "order_line_id": key, "customer_id": customer_id,
+                    "product_id": product_id, "product_name": product_name, "category": category,
+                    "quantity": quantity, "unit_price": unit_price, "total_price": total_price,
+                    "discount": discount, "bottle_size_l": bottle_size_l, "sales_channel": sales_channel,
+                    "event_ts": event_ts, "source_service": source_service, "emoji": emoji,
+                }
+            else:
+                event = {
+                    "event_type": "INVENTORY_ADJUSTED", "event_id": key, "product_id": product_id,
+                    "product_name": product_name, "category": category, "quantity_change": quantity_change,
+                    "adjustment_type": adjustment_type, "warehouse_location": warehouse_location,
+                    "event_ts": event_ts, "source_service": source_service, "emoji": emoji,
+                }
+            yield key, event, timestamp_ms
+
+
+class BulkEventSynthesizer:
+    """Draws events in column batches from a seeded NumPy generator."""
+
+    def __init__(self, seed=42, catalog=None):
+        self.rng = np.random.default_rng(seed)
+        catalog = catalog or build_catalog()
+        self.product_ids = np.array(catalog.product_ids, dtype=np.int64)
+        self.product_names = np.array([p.name for p in catalog], dtype=object)
+        self.category_labels = np.array([p.category_label for p in catalog], dtype=object)
+        self.unit_prices = np.array([p.unit_price for p in catalog], dtype=np.float64)
+
+    def synthesize(self, n, start, end):
+        """n events with timestamps spread uniformly (and sorted) over [start, end)."""
+        rng = self.rng
+        is_order = rng.random(n) < ORDER_PROBABILITY
+
+        product = rng.integers(0, len(self.product_ids), n)
+        unit_price = self.unit_prices[product]
+        quantity = rng.choice(QUANTITIES, size=n, p=QUANTITY_WEIGHTS)
+        discount = np.where(rng.random(n) < DISCOUNT_PROBABILITY,
+                            np.round(rng.uniform(0, DISCOUNT_MAX, n), 2), 0.0)
+
+        adjustment = rng.choice(len(ADJUSTMENT_TYPES), size=n, p=ADJUSTMENT_WEIGHTS)
+        quantity_change = np.where(
+            adjustment == 0,
+            rng.integers(REPLENISHMENT_RANGE[0], REPLENISHMENT_RANGE[1] + 1, n),
+            rng.integers(CORRECTION_RANGE[0], CORRECTION_RANGE[1] + 1, n),
+        )
+
+        start_us = int(start.timestamp() * 1_000_000)
+        span_us = max(1, int((end - start).total_seconds() * 1_000_000))
+        offsets = np.sort(rng.integers(0, span_us, n))
+        event_ts = (start_us + offsets).astype("datetime64[us]")
+
+        columns = {
+            "event_type": np.where(is_order, "ORDER_CREATED", "INVENTORY_ADJUSTED").astype(object),
+            "event_key": _uuid4_strings(rng, n),
+            "product_id": self.product_ids[product],
+            "product_name": self.product_names[product],
+            "category": self.category_labels[product],
+            "event_ts": event_ts,
+            "source_service": np.where(is_order, "ecom_api", "warehouse_management").astype(object),
+            "emoji": np.where(is_order, "🛒", np.array(ADJUSTMENT_EMOJIS, dtype=object)[adjustment]),
+            "customer_id": rng.integers(CUSTOMER_ID_RANGE[0], CUSTOMER_ID_RANGE[1] + 1, n),
+            "quantity": quantity,
+            "unit_price": unit_price,
+            "total_price": np.round(quantity * unit_price, 2),
+            "discount": discount,
+            "bottle_size_l": rng.choice(BOTTLE_SIZES, size=n),
+            "sales_channel": np.array(SALES_CHANNELS, dtype=object)[rng.integers(0, len(SALES_CHANNELS), n)],
+            "quantity_change": quantity_change,
+            "adjustment_type": np.array(ADJUSTMENT_TYPES, dtype=object)[adjustment],
+            "warehouse_location": np.array(WAREHOUSES, dtype=object)[rng.integers(0, len(WAREHOUSES), n)],
+        }
+        return EventColumns(columns, is_order)
+
+    def iter_chunks(self, total, start, end, chunk_size=1_000_000):
+        """Splits [start, end) proportionally so timestamps stay ordered across chunks."""
+        span = end - start
+        produced = 0
+        while produced < total:
+            n = min(chunk_size, total - produced)
+            chunk_start = start + span * (produced / total)
+            chunk_end = start + span * ((produced + n) / total)
+            yield self.synthesize(n, chunk_start, chunk_end)
+            produced += n
+
+
+# --- SINKS ---
+
+def write_parquet(chunks, path):
+    if pq is None:
+        raise RuntimeError("pyarrow is required for Parquet output")
+    rows = 0
+    with pq.ParquetWriter(path, ARROW_SCHEMA) as writer:
+        for chunk in chunks:
+            writer.write_table(chunk.to_arrow())
+            rows += len(chunk)
+    return rows
+
+
+def write_ndjson(chunks, path, codec=None):
+    """One event per line, exactly the JSON the producer sends (gzip if the path ends with .gz)."""
+    codec = codec or get_codec()
+    rows = 0
+    with (gzip.open(path, "wb", compresslevel=6) if path.endswith(".gz") else open(path, "wb")) as f:
+        for chunk in chunks:
+            f.write(b"\n".join(codec.encode(event) for _, event, _ in chunk.iter_records()))
+            f.write(b"\n")
+            rows += len(chunk)
+    return rows
+
+
+def stream_to_kafka(chunks, topic, bootstrap_servers, codec=None, **producer_config):
+    """Sends the events to Kafka with their synthetic event time as the record timestamp."""
+    from kafka import KafkaProducer
+
+    codec = codec or get_codec()
+    producer = KafkaProducer(bootstrap_servers=bootstrap_servers, value_serializer=codec.encode,
+                             retries=5, **producer_config)
+    rows = 0
+    try:
+        for chunk in chunks:
+            for key, event, timestamp_ms in chunk.iter_records():
+                producer.send(topic, key=key.encode("utf-8"), value=event, timestamp_ms=timestamp_ms)
+            rows += len(chunk)
+            logging.info(f"📤 {rows:,} events sent")
+    finally:
+        producer.flush(timeout=60)
+        producer.close()
+    return rows
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Generate synthetic Les Caves d'Albert history in bulk")
+    parser.add_argument("--events", type=int, default=1_000_000, help="Total number of events")
+    parser.add_argument("--days", type=float, default=30, help="History length, ending now")
+    parser.add_argument("--chunk-size", type=int, default=1_000_000, help="Events synthesized per call")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Destination file: .parquet, .ndjson or .ndjson.gz")
+    parser.add_argument("--kafka", action="store_true", help="Stream to Kafka instead of writing a file")
+    parser.add_argument("--compression", default="gzip", choices=["none", "gzip", "snappy", "lz4", "zstd"],
+                        help="Kafka producer compression (with --kafka)")
+    args = parser.parse_args()
+    if not args.kafka and not args.output:
+        parser.error("either --output or --kafka is required")
+
+    load_dotenv()
+    end = datetime.now(timezone.utc)
+    start = end - timedelta(days=args.days)
+    synthesizer = BulkEventSynthesizer(seed=args.seed)
+    chunks = synthesizer.iter_chunks(args.events, start, end, args.chunk_size)
+
+    t0 = time.perf_counter()
+    if args.kafka:
+        bootstrap = os.getenv("KAFKA_BOOTSTRAP_SERVER", "redpanda:9092")
+        rows = stream_to_kafka(
+            chunks,
+            os.getenv("KAFKA_TOPIC_NAME", "sales_events"),
+            [s.strip() for s in bootstrap.split(",") if s.strip()],
+            linger_ms=20,
+            batch_size=65536,
+            compression_type=None if args.compression == "none" else args.compression,
+        )
+        target = "Kafka"
+    elif args.output.endswith(".parquet"):
+        rows = write_parquet(chunks, args.output)
+        target = args.output
+    else:
+        rows = write_ndjson(chunks, args.output)
+        target = args.output
+    elapsed = time.perf_counter() - t0
+    logging.info(f"🍷 {rows:,} events ({args.days:g} days) written to {target} in {elapsed:.1f}s "
+                 f"({rows / elapsed:,.0f} ev/s)")
+
+
+if __name__ == "__main__":
+    main()
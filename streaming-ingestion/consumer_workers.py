@@ -0,0 +1,110 @@
+# consumer_workers.py - Les Caves d'Albert
+# Multi-worker mode: N consumer processes in one consumer group, one aggregated Prometheus endpoint
+#
+# Usage:
+#   python consumer_workers.py --workers 4
+#   CONSUMER_WORKERS=4 python consumer_workers.py
+#
+# Kafka spreads the topic's partitions over the workers (one KafkaConsumer, one Snowflake
+# engine and one set of writer threads per process). Workers beyond the partition count
+# stay idle. The parent process only supervises the workers and serves /metrics.
+
+import os
+import time
+import shutil
+import signal
+import logging
+import argparse
+import tempfile
+import multiprocessing
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(processName)s - %(levelname)s - %(message)s'
+)
+
+METRICS_PORT = int(os.getenv('METRICS_PORT', '8000'))
+RESTART_DELAY_SECONDS = 5
+
+
+def prepare_metrics_dir(path):
+    """
+    Points prometheus_client at a fresh multiprocess directory. Must run before
+    prometheus_client (hence kafka_consumer_snowflake) is imported anywhere.
+    """
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = path
+
+
+def run_worker():
+    import kafka_consumer_snowflake
+    kafka_consumer_snowflake.main(serve_metrics=False)
+
+
+def start_worker(worker_id):
+    worker = multiprocessing.Process(target=run_worker, name=f"consumer-{worker_id}")
+    worker.start()
+    logging.info(f"🚀 Worker consumer-{worker_id} started (pid {worker.pid})")
+    return worker
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run several Snowflake ingestion consumers in parallel")
+    parser.add_argument("--workers", type=int, default=int(os.getenv('CONSUMER_WORKERS', '2')),
+                        help="Number of consumer processes (at most one per partition is useful)")
+    parser.add_argument("--metrics-dir", default=os.getenv(
+        'PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'caves-albert-metrics')))
+    args = parser.parse_args()
+
+    prepare_metrics_dir(args.metrics_dir)
+    from prometheus_client import CollectorRegistry, start_http_server, multiprocess
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    start_http_server(METRICS_PORT, registry=registry)
+    logging.info(f"📊 Aggregated Prometheus metrics for {args.workers} worker(s) on port {METRICS_PORT}")
+
+    stopping = False
+
+    def _shutdown(signum, frame):
+        nonlocal stopping
+        if not stopping:
+            logging.warning(f"⚠️  Signal {signum} received: stopping workers...")
+        stopping = True
+
+    signal.signal(signal.SIGINT, _shutdown)
+    signal.signal(signal.SIGTERM, _shutdown)
+
+    workers = {i: start_worker(i) for i in range(args.workers)}
+    try:
+        while not stopping:
+            time.sleep(1)
+            for worker_id, worker in list(workers.items()):
+                if worker.is_alive() or stopping:
+                    continue
+                multiprocess.mark_process_dead(worker.pid)
+                logging.error(f"❌ Worker consumer-{worker_id} exited with code {worker.exitcode}, "
+                              f"restarting in {RESTART_DELAY_SECONDS}s")
+                time.sleep(RESTART_DELAY_SECONDS)
+                workers[worker_id] = start_worker(worker_id)
+    finally:
+        # Each worker finishes its in-flight batches and commits (its own SIGTERM handler)
+        for worker in workers.values():
+            if worker.is_alive():
+                os.kill(worker.pid, signal.SIGTERM)
+        for worker in workers.values():
+            worker.join(timeout=90)
+            if worker.is_alive():
+                logging.error(f"❌ {worker.name} did not stop in time, killing it")
+                worker.kill()
+                worker.join()
+            multiprocess.mark_process_dead(worker.pid)
+        logging.info("✅ All workers stopped - Les Caves d'Albert")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+# dead_letter_queue.py - Les Caves d'Albert
+# Asynchronous, batched DLQ publishing with a bounded buffer and delivery accounting
+
+import time
+import logging
+import threading
+from collections import deque
+from kafka.errors import KafkaError, MessageSizeTooLargeError, CorruptRecordException, InvalidRecordError
+
+# Errors about the record itself: re-sending it can never succeed
+RECORD_ERRORS = (MessageSizeTooLargeError, CorruptRecordException, InvalidRecordError)
+
+
+def is_record_error(excp):
+    """True if `excp` rejects the record itself (too large, invalid, not serializable), not the broker path."""
+    return isinstance(excp, RECORD_ERRORS) or not isinstance(excp, KafkaError)
+
+
+class DeadLetterQueue:
+    """
+    Publishes invalid events to the DLQ topic without blocking the consumer loop.
+
+    Sends go through a KafkaProducer configured for batching and compression;
+    each record gets a sequence number and stays "pending" until the broker
+    acknowledges it. Failed deliveries are re-sent from the consumer thread
+    (poll()) with capped exponential backoff for as long as it takes; meanwhile
+    is_full() is true so the consumer pauses its partitions. Only a record the
+    broker can never accept (MessageSizeTooLargeError, invalid record,
+    serialization error) is dropped, logged and reported to `on_drop`, so that
+    it cannot hold offset commits back forever. At most `max_pending` records may be
+    unacknowledged: publish() blocks beyond that, which throttles the consumer
+    during a burst of malformed events instead of growing memory without bound.
+
+    Offset commits are gated with mark() / is_delivered(mark): every record
+    published before mark() was taken must be acknowledged before the offsets
+    read up to that point are committed.
+    """
+
+    def __init__(self, producer, topic, max_pending=10000, retry_backoff_seconds=0.5, max_backoff_seconds=30.0,
+                 observe_latency=None, on_failure=None, on_drop=None):
+        self.producer = producer
+        self.topic = topic
+        self.max_pending = max_pending
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.observe_latency = observe_latency  # callable(seconds), called from the producer I/O thread
+        self.on_failure = on_failure            # callable(exception), idem
+        self.on_drop = on_drop                  # callable(exception), idem
+        self._cond = threading.Condition()
+        self._next_seq = 0
+        self._pending = {}     # seq -> (record, first published_at)
+        self._attempts = {}    # seq -> failed sends so far
+        self._failed = deque()  # (seq, retry_at) of failed deliveries, to re-send from the consumer thread
+
+    # --- consumer-thread API ---
+
+    def publish(self, record):
+        """Queues one DLQ record for asynchronous delivery. Returns its sequence number."""
+        if self.depth() >= self.max_pending:
+            logging.warning(f"⏸️  DLQ buffer full ({self.depth()} unacknowledged records), waiting...")
+            while self.depth() >= self.max_pending:
+                self.poll()
+                with self._cond:
+                    if len(self._pending) >= self.max_pending:
+                        self._cond.wait(timeout=0.5)
+        with self._cond:
+            seq = self._next_seq
+            self._next_seq += 1
+            self._pending[seq] = (record, time.time())
+        self._send(seq, record)
+        return seq
+
+    def poll(self):
+        """Re-sends failed records whose backoff has elapsed. Call regularly from the consumer loop."""
+        # Only the failures queued on entry: a send failing synchronously is queued again
+        # and must wait for the next poll(), not be popped straight back by this one
+        with self._cond:
+            count = len(self._failed)
+        for _ in range(count):
+            with self._cond:
+                if not self._failed:
+                    return
+                seq, retry_at = self._failed.popleft()
+                if seq not in self._pending:
+                    continue
+                if retry_at > time.time():
+                    self._failed.append((seq, retry_at))
+                    continue
+                record, _ = self._pending[seq]
+            self._send(seq, record)
+
+    def mark(self):
+        """Sequence number of the next record: everything published so far is below it."""
+        with self._cond:
+            return self._next_seq
+
+    def is_delivered(self, mark):
+        """True once every record published before `mark` has been acknowledged."""
+        with self._cond:
+            return not self._pending or min(self._pending) >= mark
+
+    def depth(self):
+        """Records published but not yet acknowledged by the broker."""
+        with self._cond:
+            return len(self._pending)
+
+    def failing(self):
+        """Records whose last delivery attempt failed and that wait to be re-sent."""
+        with self._cond:
+            return len(self._failed)
+
+    def is_full(self):
+        """True while deliveries are failing or the buffer is full: the consumer should stop fetching."""
+        with self._cond:
+            return bool(self._failed) or len(self._pending) >= self.max_pending
+
+    def flush(self, timeout=None):
+        """Delivers everything published so far (re-sending failures). Returns True if nothing is pending."""
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            self.poll()
+            remaining = None if deadline is None else max(0.0, deadline - time.time())
+            self.producer.flush(timeout=remaining)
+            with self._cond:
+                if not self._pending:
+                    return True
+                if deadline is not None and time.time() >= deadline:
+                    return False
+                # Failed records are waiting for poll(): back off a little before re-sending
+                self._cond.wait(timeout=min(1.0, remaining) if remaining is not None else 1.0)
+
+    def close(self, timeout=30):
+        delivered = self.flush(timeout)
+        if not delivered:
+            logging.error(f"❌ {self.depth()} DLQ record(s) not acknowledged at shutdown")
+        self.producer.close()
+        return delivered
+
+    # --- delivery callbacks (producer I/O thread) ---
+
+    def _send(self, seq, record):
+        try:
+            future = self.producer.send(self.topic, value=record)
+        except Exception as e:  # e.g. KafkaTimeoutError when the producer buffer is exhausted
+            self._on_error(seq, e)
+            return
+        future.add_callback(self._on_delivered, seq)
+        future.add_errback(self._on_error, seq)
+
+    def _on_delivered(self, seq, record_metadata):
+        with self._cond:
+            _, published_at = self._pending.pop(seq, (None, None))
+            self._attempts.pop(seq, None)
+            self._cond.notify_all()
+        if published_at is not None and self.observe_latency is not None:
+            self.observe_latency(time.time() - published_at)
+
+    def _on_error(self, seq, excp):
+        dropped = is_record_error(excp)
+        with self._cond:
+            attempt = self._attempts.get(seq, 0) + 1
+            if dropped:
+                self._pending.pop(seq, None)
+                self._attempts.pop(seq, None)
+            else:
+                self._attempts[seq] = attempt
+                backoff = min(self.retry_backoff_seconds * 2 ** (attempt - 1), self.max_backoff_seconds)
+                self._failed.append((seq, time.time() + backoff))
+            self._cond.notify_all()
+        if self.on_failure is not None:
+            self.on_failure(excp)
+        if dropped:
+            logging.error(f"❌ DLQ record #{seq} dropped, the broker can never accept it: {excp!r}")
+            if self.on_drop is not None:
+                self.on_drop(excp)
+        else:
+            logging.error(f"❌ DLQ delivery of record #{seq} failed (attempt {attempt}), "
+                          f"retrying in {backoff:.1f}s: {excp}")
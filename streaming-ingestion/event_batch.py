@@ -0,0 +1,70 @@
+# event_batch.py - Les Caves d'Albert
+# Columnar batch builder for the consumer hot path (no pandas, no JSON re-serialization)
+
+import json
+
+
+class EventBatch:
+    """
+    Accumulates consumed Kafka records directly into column buffers.
+
+    The event content is kept as the raw JSON text received from Kafka and handed
+    to the loader as-is, so each event is serialized exactly once (its small
+    metadata document).
+    """
+
+    __slots__ = ("metadata_json", "content_json", "type_counts", "offset_ranges", "excluded_offsets")
+
+    def __init__(self):
+        self.metadata_json = []
+        self.content_json = []
+        self.type_counts = {}
+        self.offset_ranges = {}  # TopicPartition -> (first, last) offset read into the batch
+        self.excluded_offsets = {}  # TopicPartition -> [offsets read but not loaded (sent to the DLQ)]
+
+    def __len__(self):
+        return len(self.content_json)
+
+    def __bool__(self):
+        return bool(self.content_json)
+
+    def append(self, msg, event):
+        """Adds one record. `msg.value` is the raw JSON text, `event` its decoded model (event_codec)."""
+        self.content_json.append(msg.value)
+        self.metadata_json.append(json.dumps({
+            "topic": msg.topic,
+            "partition": msg.partition,
+            "offset": msg.offset,
+            "timestamp_ms": msg.timestamp,
+            "key": msg.key.decode('utf-8') if msg.key else None
+        }))
+        event_type = event.event_type
+        self.type_counts[event_type] = self.type_counts.get(event_type, 0) + 1
+
+    def mark_offset(self, tp, offset):
+        """Extends the batch's offset range on `tp` (called for every record read, valid or not)."""
+        current = self.offset_ranges.get(tp)
+        self.offset_ranges[tp] = (offset, offset) if current is None else (current[0], offset)
+
+    def exclude_offset(self, tp, offset):
+        """Marks a record read into the batch but not loaded with it (rare: DLQ)."""
+        self.excluded_offsets.setdefault(tp, []).append(offset)
+
+    def loaded_ranges(self):
+        """{TopicPartition: [(first, last)]} of the offsets actually loaded: the read ranges minus the excluded offsets."""
+        ranges = {}
+        for tp, (first, last) in self.offset_ranges.items():
+            parts = []
+            for offset in sorted(self.excluded_offsets.get(tp, ())):
+                if first < offset:
+                    parts.append((first, offset - 1))
+                first = offset + 1
+            if first <= last:
+                parts.append((first, last))
+            if parts:
+                ranges[tp] = parts
+        return ranges
+
+    def last_offsets(self):
+        """{TopicPartition: last offset read into the batch}."""
+        return {tp: last for tp, (_, last) in self.offset_ranges.items()}
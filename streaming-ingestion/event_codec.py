@@ -0,0 +1,281 @@
+# event_codec.py - Les Caves d'Albert
+# Shared JSON codec and typed event models for the producer, the consumer and the DLQ
+#
+# Backends, fastest first: msgspec (typed decode + validation in one step), orjson, stdlib json.
+# JSON_CODEC=auto|msgspec|orjson|json selects one explicitly (auto = fastest installed).
+
+import os
+import json
+from typing import Any, Optional, Union
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# --- 1. EVENT SCHEMAS (single source of truth for models and validation) ---
+
+# (field, type, required)
+EVENT_FIELDS = {
+    'ORDER_CREATED': (
+        ('order_line_id', str, True),
+        ('customer_id', int, True),
+        ('product_id', int, True),
+        ('quantity', int, True),
+        ('product_name', str, False),
+        ('category', str, False),
+        ('unit_price', float, False),
+        ('total_price', float, False),
+        ('discount', float, False),
+        ('bottle_size_l', float, False),
+        ('sales_channel', str, False),
+        ('event_ts', str, False),
+        ('source_service', str, False),
+        ('emoji', str, False),
+    ),
+    'INVENTORY_ADJUSTED': (
+        ('event_id', str, True),
+        ('product_id', int, True),
+        ('quantity_change', int, True),
+        ('adjustment_type', str, True),
+        ('product_name', str, False),
+        ('category', str, False),
+        ('warehouse_location', str, False),
+        ('event_ts', str, False),
+        ('source_service', str, False),
+        ('emoji', str, False),
+    ),
+}
+
+REQUIRED_FIELDS = {
+    event_type: tuple(name for name, _, required in fields if required)
+    for event_type, fields in EVENT_FIELDS.items()
+}
+
+
+class EventDecodeError(ValueError):
+    """The payload is not valid JSON."""
+
+
+class InvalidEventError(ValueError):
+    """The payload is JSON but does not match the schema of its event type."""
+
+    def __init__(self, event_type, message):
+        super().__init__(message)
+        self.event_type = event_type
+
+
+class UnknownEvent:
+    """Event of a type without a schema: passed through with its routing fields only."""
+
+    __slots__ = ('event_type', 'product_id', 'customer_id')
+
+    def __init__(self, event_type='UNKNOWN', product_id=None, customer_id=None):
+        self.event_type = event_type
+        self.product_id = product_id
+        self.customer_id = customer_id
+
+
+# JSON type names used in validation errors, as msgspec words them
+_JSON_TYPE_NAMES = {bool: 'bool', int: 'int', float: 'float', str: 'str', type(None): 'null',
+                    dict: 'object', list: 'array'}
+
+
+def _check_field(event_type, name, typ, required, value):
+    """Validates one field the way msgspec does (no bool for numbers, int accepted as float)."""
+    if typ is float and isinstance(value, int) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, typ) and not (typ is int and isinstance(value, bool)):
+        return value
+    expected = typ.__name__ if required else f"{typ.__name__} | null"
+    raise InvalidEventError(event_type, f"Expected `{expected}`, got `{_JSON_TYPE_NAMES.get(type(value), 'value')}`"
+                                        f" - at `$.{name}`")
+
+
+class _SlotsEvent:
+    """Base of the __slots__ models used when msgspec is not installed."""
+
+    __slots__ = ()
+    event_type = None
+    _fields = ()
+    _required = frozenset()
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    @classmethod
+    def from_dict(cls, data):
+        """Builds the model with the same checks as msgspec: required fields present, types strict."""
+        missing = cls._required.difference(data)
+        if missing:
+            raise InvalidEventError(cls.event_type, f"Missing required field(s) {sorted(missing)}")
+        fields = {}
+        for name, typ, required in cls._fields:
+            value = data.get(name)
+            if value is None and not required:
+                continue
+            fields[name] = _check_field(cls.event_type, name, typ, required, value)
+        return cls(**fields)
+
+    def to_dict(self):
+        data = {'event_type': self.event_type}
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if value is not None:
+                data[name] = value
+        return data
+
+
+def _define_model(class_name, event_type):
+    fields = EVENT_FIELDS[event_type]
+    if msgspec is not None:
+        return msgspec.defstruct(
+            class_name,
+            [(name, typ) if required else (name, Optional[typ], None) for name, typ, required in fields],
+            tag_field='event_type',
+            tag=event_type,
+            kw_only=True,
+            omit_defaults=True,
+            namespace={'event_type': event_type},
+        )
+    return type(class_name, (_SlotsEvent,), {
+        '__slots__': tuple(name for name, _, _ in fields),
+        'event_type': event_type,
+        '_fields': fields,
+        '_required': frozenset(REQUIRED_FIELDS[event_type]),
+    })
+
+
+OrderCreated = _define_model('OrderCreated', 'ORDER_CREATED')
+InventoryAdjusted = _define_model('InventoryAdjusted', 'INVENTORY_ADJUSTED')
+MODELS = {'ORDER_CREATED': OrderCreated, 'INVENTORY_ADJUSTED': InventoryAdjusted}
+
+
+def to_builtins(obj):
+    """Converts models (and containers of models) to plain JSON-compatible objects."""
+    if msgspec is not None and isinstance(obj, msgspec.Struct):
+        return msgspec.to_builtins(obj)
+    if isinstance(obj, _SlotsEvent):
+        return obj.to_dict()
+    return obj
+
+
+# --- 2. CODEC BACKENDS ---
+
+class StdlibCodec:
+    name = 'json'
+
+    def encode(self, obj):
+        return json.dumps(to_builtins(obj)).encode('utf-8')
+
+    def decode(self, raw):
+        try:
+            return json.loads(raw)
+        except ValueError as e:
+            raise EventDecodeError(str(e)) from e
+
+    def decode_event(self, raw):
+        """Decodes AND validates an event. Returns a typed model or an UnknownEvent."""
+        data = self.decode(raw)
+        if not isinstance(data, dict):
+            raise InvalidEventError('UNKNOWN', "Event payload is not a JSON object")
+        event_type = data.get('event_type', 'UNKNOWN')
+        model = MODELS.get(event_type) if isinstance(event_type, str) else None
+        if model is None:
+            return UnknownEvent(event_type, data.get('product_id'), data.get('customer_id'))
+        if msgspec is not None:
+            try:
+                return msgspec.convert(data, model)
+            except msgspec.ValidationError as e:
+                raise InvalidEventError(event_type, str(e)) from e
+        return model.from_dict(data)
+
+
+class OrjsonCodec(StdlibCodec):
+    name = 'orjson'
+
+    def encode(self, obj):
+        return orjson.dumps(to_builtins(obj))
+
+    def decode(self, raw):
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError as e:
+            raise EventDecodeError(str(e)) from e
+
+
+class MsgspecCodec:
+    name = 'msgspec'
+
+    def __init__(self):
+        self._encoder = msgspec.json.Encoder()
+        self._decoder = msgspec.json.Decoder()
+        # Tagged union: dispatch on event_type, required fields and types checked while parsing
+        self._event_decoder = msgspec.json.Decoder(Union[OrderCreated, InventoryAdjusted])
+        self._envelope_decoder = msgspec.json.Decoder(_Envelope)
+
+    def encode(self, obj):
+        return self._encoder.encode(obj)
+
+    def decode(self, raw):
+        try:
+            return self._decoder.decode(raw)
+        except msgspec.DecodeError as e:
+            raise EventDecodeError(str(e)) from e
+
+    def decode_event(self, raw):
+        """Decodes AND validates an event. Returns a typed model or an UnknownEvent."""
+        try:
+            return self._event_decoder.decode(raw)
+        except msgspec.ValidationError as e:
+            # Slow path (rare): unknown event type, or a known type failing validation
+            error = e
+        except msgspec.DecodeError as e:
+            raise EventDecodeError(str(e)) from e
+        try:
+            envelope = self._envelope_decoder.decode(raw)
+        except msgspec.ValidationError:
+            raise InvalidEventError('UNKNOWN', str(error)) from error
+        if isinstance(envelope.event_type, str) and envelope.event_type in MODELS:
+            raise InvalidEventError(envelope.event_type, str(error)) from error
+        return UnknownEvent(envelope.event_type, envelope.product_id, envelope.customer_id)
+
+
+if msgspec is not None:
+    class _Envelope(msgspec.Struct):
+        # Untyped on purpose: an unknown event passes through whatever the other backends would,
+        # and a known type failing validation keeps its own type in the DLQ label
+        event_type: Any = 'UNKNOWN'
+        product_id: Any = None
+        customer_id: Any = None
+
+# --- 3. BACKEND SELECTION ---
+
+_BACKENDS = {'msgspec': MsgspecCodec, 'orjson': OrjsonCodec, 'json': StdlibCodec}
+
+
+def available_backends():
+    """Installed backends, fastest first."""
+    names = []
+    if msgspec is not None:
+        names.append('msgspec')
+    if orjson is not None:
+        names.append('orjson')
+    names.append('json')
+    return names
+
+
+def get_codec(name=None):
+    """Returns the codec selected by `name` or JSON_CODEC (default: fastest installed)."""
+    name = name or os.getenv('JSON_CODEC', 'auto')
+    if name == 'auto':
+        name = available_backends()[0]
+    if name not in available_backends():
+        raise ValueError(f"JSON codec '{name}' is not available (installed: {available_backends()})")
+    return _BACKENDS[name]()
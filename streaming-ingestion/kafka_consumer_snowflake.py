@@ -2,19 +2,32 @@
 # Production-ready Kafka Consumer with Prometheus metrics and Snowflake integration
 
 import os
-import json
 import time
 import signal
 import logging
-import pandas as pd
-from kafka import KafkaConsumer, KafkaProducer
-from sqlalchemy import create_engine, text
-from sqlalchemy.engine import Engine
+import argparse
+import multiprocessing
+from kafka import KafkaConsumer, KafkaProducer, ConsumerRebalanceListener
+from kafka.errors import CommitFailedError
+from kafka.structs import OffsetAndMetadata
+from sqlalchemy import text
 from sqlalchemy.exc import SQLAlchemyError
 from snowflake.sqlalchemy import URL
 from dotenv import load_dotenv
 from prometheus_client import Counter, Histogram, Gauge, start_http_server, Summary
 from datetime import datetime
+from snowflake_loaders import make_loader, RAW_TABLE_NAME
+from snowflake_pool import create_snowflake_engine, warm_up
+from schema_migrations import apply_migrations
+from task_trigger import TaskGraphTrigger
+from batch_pipeline import BatchPipeline
+from batch_spool import BatchSpool, replay_quarantine
+from dead_letter_queue import DeadLetterQueue
+from lag_tracker import LagTracker
+from offset_ledger import OffsetLedger, LedgerRebalanceListener
+from event_batch import EventBatch
+from event_codec import get_codec, EventDecodeError, InvalidEventError
+from adaptive_batching import AdaptiveBatchController, REASONS
 
 # --- 1. ENHANCED CONFIGURATION ---
 
@@ -29,6 +42,12 @@ load_dotenv()
 TOPIC_NAME = os.getenv("KAFKA_TOPIC_NAME", "sales_events")  # Updated for Les Caves d'Albert
 DLQ_TOPIC_NAME = f"{TOPIC_NAME}_dlq"  # Dead-Letter Queue for invalid messages
 BOOTSTRAP_SERVER = os.getenv("KAFKA_BOOTSTRAP_SERVER", "redpanda:9092")
+CONSUMER_GROUP_ID = os.getenv("KAFKA_CONSUMER_GROUP", "snowflake-ingestion-les-caves-albert-v1")
+
+# DLQ publishing: asynchronous, batched and compressed, at most DLQ_MAX_PENDING unacknowledged records
+DLQ_MAX_PENDING = int(os.getenv("DLQ_MAX_PENDING", "10000"))
+DLQ_LINGER_MS = int(os.getenv("DLQ_LINGER_MS", "50"))
+DLQ_COMPRESSION = os.getenv("DLQ_COMPRESSION", "gzip")  # none | gzip | snappy | lz4 | zstd
 
 # Snowflake Settings
 SNOWFLAKE_USER = os.getenv('SNOWFLAKE_USER')
@@ -38,10 +57,70 @@ SNOWFLAKE_WAREHOUSE = os.getenv('SNOWFLAKE_WAREHOUSE')
 SNOWFLAKE_DATABASE = os.getenv('SNOWFLAKE_DATABASE')
 TARGET_SCHEMA = os.getenv('SNOWFLAKE_SCHEMA', 'RAW_DATA')
 
+# Loader backend: 'copy' (PUT + COPY INTO) or 'insert' (direct VARIANT insert fallback)
+LOADER_BACKEND = os.getenv('LOADER_BACKEND', 'copy')
+LOADER_FILE_FORMAT = os.getenv('LOADER_FILE_FORMAT', 'ndjson')  # 'ndjson' or 'parquet'
+
+# Offset ledger: batch offset ranges written in the load transaction, replays skipped after a crash
+OFFSET_LEDGER_ENABLED = os.getenv('OFFSET_LEDGER_ENABLED', 'false').lower() == 'true'
+
+# Pipelined mode: Kafka keeps polling while background writers load sealed batches
+PIPELINE_ENABLED = os.getenv('PIPELINE_ENABLED', 'false').lower() == 'true'
+PIPELINE_WRITER_THREADS = int(os.getenv('PIPELINE_WRITER_THREADS', '2'))
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', '4'))
+
+# Write-ahead spool: sealed batches fsynced to local segment files, offsets committed once spooled,
+# loaded into Snowflake by a background drainer (retries with exponential backoff during outages)
+SPOOL_ENABLED = os.getenv('SPOOL_ENABLED', 'false').lower() == 'true'
+SPOOL_DIR = os.getenv('SPOOL_DIR', 'spool')
+SPOOL_SEGMENT_BYTES = int(os.getenv('SPOOL_SEGMENT_BYTES', str(64 * 1024 * 1024)))
+SPOOL_MAX_BYTES = int(os.getenv('SPOOL_MAX_BYTES', str(10 * 1024 * 1024 * 1024)))
+SPOOL_RETRY_BACKOFF_SECONDS = float(os.getenv('SPOOL_RETRY_BACKOFF_SECONDS', '1'))
+SPOOL_MAX_BACKOFF_SECONDS = float(os.getenv('SPOOL_MAX_BACKOFF_SECONDS', '300'))
+# Non-transient failures of one batch before the drainer probes the next one to tell a bad batch from an outage
+SPOOL_ISOLATE_AFTER_ATTEMPTS = int(os.getenv('SPOOL_ISOLATE_AFTER_ATTEMPTS', '5'))
+
+# Event-driven task graph: EXECUTE TASK on the root once TASK_TRIGGER_MIN_ROWS rows were loaded, or the
+# oldest of them waited TASK_TRIGGER_MAX_AGE_SECONDS; triggers during a run are coalesced into the next one
+TASK_TRIGGER_ENABLED = os.getenv('TASK_TRIGGER_ENABLED', 'false').lower() == 'true'
+TASK_TRIGGER_ROOT_TASK = os.getenv('TASK_TRIGGER_ROOT_TASK', 'TASK_RAW_TO_STAGING_DISTRIBUTOR')
+TASK_TRIGGER_MIN_ROWS = int(os.getenv('TASK_TRIGGER_MIN_ROWS', '1000'))
+TASK_TRIGGER_MAX_AGE_SECONDS = float(os.getenv('TASK_TRIGGER_MAX_AGE_SECONDS', '20'))
+TASK_TRIGGER_POLL_SECONDS = float(os.getenv('TASK_TRIGGER_POLL_SECONDS', '2'))
+
+# Connection pool: one session per writer thread plus the consumer thread (and the task trigger),
+# kept alive between batches
+SNOWFLAKE_POOL_SIZE = int(os.getenv('SNOWFLAKE_POOL_SIZE', str(
+    (PIPELINE_WRITER_THREADS + 1 if PIPELINE_ENABLED else 2) + (1 if TASK_TRIGGER_ENABLED else 0))))
+SNOWFLAKE_POOL_MAX_OVERFLOW = int(os.getenv('SNOWFLAKE_POOL_MAX_OVERFLOW', '2'))
+SNOWFLAKE_POOL_RECYCLE_SECONDS = int(os.getenv('SNOWFLAKE_POOL_RECYCLE_SECONDS', '3600'))
+SNOWFLAKE_POOL_PRE_PING = os.getenv('SNOWFLAKE_POOL_PRE_PING', 'true').lower() == 'true'
+SNOWFLAKE_CLIENT_SESSION_KEEP_ALIVE = os.getenv('SNOWFLAKE_CLIENT_SESSION_KEEP_ALIVE', 'true').lower() == 'true'
+SNOWFLAKE_WARM_UP_RESUME_WAREHOUSE = os.getenv('SNOWFLAKE_WARM_UP_RESUME_WAREHOUSE', 'false').lower() == 'true'
+
+# Batching: fixed BATCH_SIZE / COMMIT_INTERVAL_SECONDS, or adaptive sizing within [MIN, MAX]
+BATCH_SIZE = int(os.getenv('BATCH_SIZE', '100'))
+COMMIT_INTERVAL_SECONDS = float(os.getenv('COMMIT_INTERVAL_SECONDS', '10'))
+ADAPTIVE_BATCHING = os.getenv('ADAPTIVE_BATCHING', 'true').lower() == 'true'
+BATCH_SIZE_MIN = int(os.getenv('BATCH_SIZE_MIN', '10'))
+BATCH_SIZE_MAX = int(os.getenv('BATCH_SIZE_MAX', '5000'))
+TARGET_LATENCY_SECONDS = float(os.getenv('TARGET_LATENCY_SECONDS', '5'))
+TARGET_ROWS_PER_STATEMENT = int(os.getenv('TARGET_ROWS_PER_STATEMENT', '1000'))
+
+# JSON codec shared with the producer: auto (fastest installed) | msgspec | orjson | json
+CODEC = get_codec(os.getenv('JSON_CODEC', 'auto'))
+
+# Consumer lag: end offsets fetched by a background thread every LAG_TRACKER_INTERVAL_SECONDS
+LAG_TRACKER_INTERVAL_SECONDS = float(os.getenv('LAG_TRACKER_INTERVAL_SECONDS', '15'))
+
+# Time a revoked worker may spend landing in-flight batches before giving up its partitions
+REBALANCE_DRAIN_TIMEOUT_SECONDS = float(os.getenv('REBALANCE_DRAIN_TIMEOUT_SECONDS', '60'))
+
 # Prometheus Metrics Port
 METRICS_PORT = int(os.getenv('METRICS_PORT', '8000'))
 
 # --- 2. PROMETHEUS METRICS DEFINITIONS ---
+# multiprocess_mode only applies with several workers (consumer_workers.py) and is ignored otherwise
 
 # Counters
 events_consumed_total = Counter(
@@ -56,17 +135,64 @@ events_inserted_total = Counter(
     ['event_type']
 )
 
+ledger_skipped_total = Counter(
+    'offset_ledger_skipped_total',
+    'Re-delivered records skipped because their offsets are already loaded (offset ledger)'
+)
+
+spool_drained_events_total = Counter(
+    'spool_drained_events_total',
+    'Events replayed from the local spool into Snowflake'
+)
+
+spool_drain_failures_total = Counter(
+    'spool_drain_failures_total',
+    'Failed attempts to load a spooled batch into Snowflake (retried with backoff)'
+)
+
+spool_quarantined_records_total = Counter(
+    'spool_quarantined_records_total',
+    'Spooled records moved to the quarantine directory (corrupt, undecodable, or failing while the next batch loads)'
+)
+
+task_graph_triggers_total = Counter(
+    'snowflake_task_graph_triggers_total',
+    'EXECUTE TASK issued on the root of the task graph',
+    ['reason']  # rows | age
+)
+
+task_graph_coalesced_rows_total = Counter(
+    'snowflake_task_graph_coalesced_rows_total',
+    'Rows loaded while a task graph run was in flight (picked up by the next run)'
+)
+
+task_graph_runs_total = Counter(
+    'snowflake_task_graph_runs_total',
+    'Completed task graph runs triggered by the consumer',
+    ['state']  # SUCCEEDED | FAILED | SKIPPED | CANCELLED
+)
+
 dlq_messages_total = Counter(
     'dlq_messages_total',
     'Total number of messages sent to DLQ',
     ['error_type']
 )
 
+dlq_delivery_failures_total = Counter(
+    'dlq_delivery_failures_total',
+    'DLQ send attempts that failed and were queued for retry'
+)
+
+dlq_dropped_total = Counter(
+    'dlq_dropped_total',
+    'DLQ records dropped because the broker can never accept them (too large, invalid, not serializable)'
+)
+
 # Histograms
 batch_size_histogram = Histogram(
     'batch_size_events',
     'Distribution of batch sizes',
-    buckets=[10, 25, 50, 75, 100, 150, 200]
+    buckets=[10, 25, 50, 100, 250, 500, 1000, 2500, 5000]  # BATCH_SIZE_MIN .. BATCH_SIZE_MAX defaults
 )
 
 batch_processing_duration = Histogram(
@@ -81,21 +207,168 @@ snowflake_insert_duration = Histogram(
     buckets=[0.1, 0.5, 1.0, 2.5, 5.0, 10.0]
 )
 
+snowflake_pool_checkout_wait = Histogram(
+    'snowflake_pool_checkout_wait_seconds',
+    'Time spent waiting for a pooled Snowflake connection (including opening a new session)',
+    buckets=[0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0]
+)
+
+task_graph_duration = Histogram(
+    'snowflake_task_graph_duration_seconds',
+    'Task graph run duration, from scheduled to completed',
+    buckets=[1, 2.5, 5, 10, 20, 30, 60, 120, 300]
+)
+
+task_graph_freshness = Histogram(
+    'snowflake_task_graph_freshness_seconds',
+    'Time from the oldest load covered by a run to the end of the run (RAW load -> PRODUCTION)',
+    buckets=[5, 10, 20, 30, 45, 60, 90, 120, 300]
+)
+
+task_stage_duration = Histogram(
+    'snowflake_task_stage_duration_seconds',
+    'Per-task duration within a triggered task graph run (TASK_HISTORY)',
+    # phase: queued (scheduled -> query start) | running (query start -> completed);
+    # state: TASK_HISTORY state of the run (SUCCEEDED, FAILED, ...)
+    ['task', 'phase', 'state'],
+    buckets=[0.5, 1, 2.5, 5, 10, 20, 30, 60, 120]
+)
+
+dlq_delivery_latency = Histogram(
+    'dlq_delivery_latency_seconds',
+    'Time from DLQ publish to broker acknowledgement',
+    buckets=[0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+)
+
 # Gauges
 current_batch_size = Gauge(
     'current_batch_size',
-    'Current number of events in the batch waiting to be processed'
+    'Current number of events in the batch waiting to be processed',
+    multiprocess_mode='livesum'
 )
 
 kafka_lag = Gauge(
     'kafka_consumer_lag',
     'Current lag of the Kafka consumer',
-    ['partition']
+    ['partition'],
+    multiprocess_mode='livesum'
+)
+
+kafka_in_flight_lag = Gauge(
+    'kafka_consumer_in_flight_lag',
+    'Records not yet read by the consumer (end offset - next offset to read)',
+    ['partition'],
+    multiprocess_mode='livesum'
+)
+
+kafka_oldest_uncommitted_age = Gauge(
+    'kafka_oldest_uncommitted_record_age_seconds',
+    'Age of the oldest record read but not yet committed',
+    ['partition'],
+    multiprocess_mode='livemax'
+)
+
+kafka_catch_up_seconds = Gauge(
+    'kafka_consumer_catch_up_seconds',
+    'Estimated time to consume the current lag at the current net drain rate (+Inf if not draining)',
+    multiprocess_mode='livemax'
+)
+
+adaptive_batch_size = Gauge(
+    'adaptive_batch_target_size',
+    'Batch size currently chosen by the batching controller',
+    multiprocess_mode='liveall'
+)
+
+adaptive_flush_interval = Gauge(
+    'adaptive_flush_interval_seconds',
+    'Max time a batch may stay open before being flushed',
+    multiprocess_mode='liveall'
+)
+
+adaptive_batch_reason = Gauge(
+    'adaptive_batch_reason',
+    '1 for the constraint that determined the current batch size',
+    ['reason'],
+    multiprocess_mode='liveall'
+)
+
+observed_event_rate = Gauge(
+    'kafka_observed_event_rate',
+    'Incoming events per second seen by the consumer',
+    multiprocess_mode='livesum'
+)
+
+pipeline_queue_depth = Gauge(
+    'pipeline_queue_depth',
+    'Sealed batches waiting for or being written by the background writers',
+    multiprocess_mode='livesum'
+)
+
+pipeline_paused = Gauge(
+    'pipeline_partitions_paused',
+    '1 while partitions are paused because the flush queue or the spool is full, or DLQ deliveries fail',
+    multiprocess_mode='livemax'
+)
+
+spool_bytes = Gauge(
+    'spool_bytes',
+    'Bytes spooled on local disk and not yet loaded into Snowflake',
+    multiprocess_mode='livesum'
+)
+
+spool_segments = Gauge(
+    'spool_segments',
+    'Spool segment files not yet fully loaded into Snowflake',
+    multiprocess_mode='livesum'
+)
+
+spool_oldest_segment_age = Gauge(
+    'spool_oldest_segment_age_seconds',
+    'Age of the oldest spooled batch not yet loaded into Snowflake',
+    multiprocess_mode='livemax'
+)
+
+spool_head_failed_attempts = Gauge(
+    'spool_head_failed_attempts',
+    'Failed loads of the oldest spooled batch so far (0 while the spool drains normally)',
+    multiprocess_mode='livemax'
+)
+
+spool_drain_rate = Gauge(
+    'spool_drain_rate_events_per_second',
+    'Events loaded from the spool into Snowflake per second (last minute)',
+    multiprocess_mode='livesum'
+)
+
+dlq_buffer_depth = Gauge(
+    'dlq_buffer_depth',
+    'DLQ records published but not yet acknowledged by the broker',
+    multiprocess_mode='livesum'
+)
+
+offsets_awaiting_dlq = Gauge(
+    'offsets_awaiting_dlq',
+    'Written batches whose offset commit waits for DLQ acknowledgements',
+    multiprocess_mode='livesum'
+)
+
+task_graph_pending_rows = Gauge(
+    'snowflake_task_graph_pending_rows',
+    'Rows loaded since the last task graph trigger',
+    multiprocess_mode='livesum'
+)
+
+assigned_partitions = Gauge(
+    'kafka_assigned_partitions',
+    'Partitions currently assigned to the consumer',
+    multiprocess_mode='livesum'
 )
 
 last_commit_timestamp = Gauge(
     'last_commit_timestamp',
-    'Unix timestamp of the last successful commit'
+    'Unix timestamp of the last successful commit',
+    multiprocess_mode='livemax'
 )
 
 # Summary
@@ -106,14 +379,11 @@ event_processing_summary = Summary(
 
 # --- 3. OPTIMIZED SNOWFLAKE SCHEMA FOR STREAMING (ELT APPROACH) ---
 
-def setup_snowflake_schema(engine):
+def setup_snowflake_schema(engine, ledger=None):
     """
     Creates tables for ingesting ALL raw events in JSON format.
     This is the cornerstone of the ELT approach. Transformation happens IN Snowflake.
     """
-    RAW_TABLE_NAME = "RAW_EVENTS_STREAM"
-    STAGING_TABLE = "stg_raw_events_stream"
-    
     try:
         with engine.begin() as connection:
             # Use the database first
@@ -136,23 +406,18 @@ def setup_snowflake_schema(engine):
                     INGESTION_TIME TIMESTAMP_LTZ DEFAULT CURRENT_TIMESTAMP()
                 );
             """))
-            
-            # Create staging table (VARCHAR columns for pandas compatibility)
-            connection.execute(text(f"""
-                CREATE TABLE IF NOT EXISTS {TARGET_SCHEMA}.{STAGING_TABLE} (
-                    EVENT_METADATA_V VARCHAR,
-                    EVENT_CONTENT_V VARCHAR
-                );
-            """))
-            
-            # Verify staging table is empty at startup
-            result = connection.execute(text(f"SELECT COUNT(*) as cnt FROM {TARGET_SCHEMA}.{STAGING_TABLE};"))
-            staging_count = result.fetchone()[0]
-            
-            if staging_count > 0:
-                logging.warning(f"⚠️  Staging table contains {staging_count} rows at startup. Cleaning...")
-                connection.execute(text(f"TRUNCATE TABLE {TARGET_SCHEMA}.{STAGING_TABLE};"))
-                logging.info(f"✅ Staging table cleaned successfully")
+
+            # Typed hot columns and clustering key (idempotent, versioned in SCHEMA_MIGRATIONS)
+            applied = apply_migrations(connection, TARGET_SCHEMA)
+            if applied:
+                logging.info(f"🧱 Schema migrations applied: {applied}")
+
+            # No shared staging table: every backend loads RAW_EVENTS_STREAM directly,
+            # so concurrent consumers never touch each other's in-flight rows
+
+            # Offset ledger (exactly-once mode)
+            if ledger is not None:
+                ledger.setup(connection)
             
         logging.info(f"🍷 Snowflake schema and table '{RAW_TABLE_NAME}' ready for ingestion - Les Caves d'Albert")
         
@@ -162,13 +427,15 @@ def setup_snowflake_schema(engine):
 
 # --- 4. ROBUST INGESTION LOGIC WITH METRICS (ELT APPROACH) ---
 
-def ingest_raw_events_batch(conn, batch):
+def ingest_raw_events_batch(conn, batch, loader=None):
     """
-    Ingests a batch of raw events into the destination table.
+    Ingests an EventBatch of raw events into the destination table.
     This function is simple, fast, and reliable with full metrics tracking.
+    The actual load is delegated to the configured loader backend (COPY INTO or direct insert).
+    Returns the Snowflake insert duration in seconds.
     """
     if not batch:
-        return
+        return 0.0
     
     start_time = time.time()
     batch_size = len(batch)
@@ -179,78 +446,19 @@ def ingest_raw_events_batch(conn, batch):
     
     logging.info(f"📦 Processing batch of {batch_size} events...")
 
-    df = pd.DataFrame(batch)
-    
-    # Extract key fields for faster querying
-    df['EVENT_TYPE'] = df['EVENT_CONTENT'].apply(lambda x: x.get('event_type', 'UNKNOWN'))
-    df['PRODUCT_ID'] = df['EVENT_CONTENT'].apply(lambda x: x.get('product_id', None))
-    df['CUSTOMER_ID'] = df['EVENT_CONTENT'].apply(lambda x: x.get('customer_id', None))
-    
-    # Count events by type for metrics
-    event_type_counts = df['EVENT_TYPE'].value_counts().to_dict()
+    # Event type counts were accumulated by the batch builder
+    event_type_counts = batch.type_counts
     for event_type, count in event_type_counts.items():
         logging.info(f"  📊 {event_type}: {count} events")
-    
-    # Convert to JSON strings for staging table
-    df['EVENT_CONTENT_JSON'] = df['EVENT_CONTENT'].apply(json.dumps)
-    df['EVENT_METADATA_JSON'] = df['EVENT_METADATA'].apply(json.dumps)
-
-    # Staging table setup
-    STAGING_TABLE = "stg_raw_events_stream"
-    full_staging = f"{TARGET_SCHEMA}.{STAGING_TABLE}"
-
-    # Determine Engine for pandas.to_sql
-    if isinstance(conn, Engine):
-        engine = conn
-        exec_conn = None
-    else:
-        engine = getattr(conn, 'engine', None)
-        exec_conn = conn
-    if engine is None:
-        raise RuntimeError("Connection does not expose 'engine' required for pandas.to_sql")
 
-    try:
-        # Load data into staging table (VARCHAR columns)
-        df_stg = df[['EVENT_METADATA_JSON', 'EVENT_CONTENT_JSON']].rename(columns={
-            'EVENT_METADATA_JSON': 'EVENT_METADATA_V',
-            'EVENT_CONTENT_JSON': 'EVENT_CONTENT_V'
-        })
+    if loader is None:
+        loader = make_loader(LOADER_BACKEND, TARGET_SCHEMA, LOADER_FILE_FORMAT)
 
+    try:
         staging_start = time.time()
-        
-        df_stg.to_sql(
-            name=STAGING_TABLE,
-            con=engine,
-            schema=TARGET_SCHEMA,
-            if_exists='append',
-            index=False,
-            method='multi',
-            chunksize=1000
-        )
-        
-        logging.info(f"  ✅ Loaded {len(df_stg)} rows into staging table")
-
-        # Insert into final table with PARSE_JSON conversion and extracted fields
-        insert_sql = text(f"""
-            INSERT INTO {TARGET_SCHEMA}.RAW_EVENTS_STREAM 
-                (EVENT_TYPE, PRODUCT_ID, CUSTOMER_ID, EVENT_METADATA, EVENT_CONTENT)
-            SELECT 
-                PARSE_JSON(EVENT_CONTENT_V):event_type::VARCHAR as EVENT_TYPE,
-                PARSE_JSON(EVENT_CONTENT_V):product_id::INTEGER as PRODUCT_ID,
-                PARSE_JSON(EVENT_CONTENT_V):customer_id::INTEGER as CUSTOMER_ID,
-                PARSE_JSON(EVENT_METADATA_V) as EVENT_METADATA,
-                PARSE_JSON(EVENT_CONTENT_V) as EVENT_CONTENT
-            FROM {full_staging};
-        """)
-
-        # Execute operations
-        if exec_conn is not None:
-            exec_conn.execute(insert_sql)
-            exec_conn.execute(text(f"TRUNCATE TABLE {full_staging};"))
-        else:
-            with engine.begin() as tx_conn:
-                tx_conn.execute(insert_sql)
-                tx_conn.execute(text(f"TRUNCATE TABLE {full_staging};"))
+
+        # Raw JSON as received from Kafka, no re-serialization
+        loader.load(conn, batch.metadata_json, batch.content_json)
         
         # Record metrics
         snowflake_duration = time.time() - staging_start
@@ -262,11 +470,13 @@ def ingest_raw_events_batch(conn, batch):
         total_duration = time.time() - start_time
         batch_processing_duration.observe(total_duration)
         
-        logging.info(f"  ⚡ Snowflake insert completed in {snowflake_duration:.2f}s")
+        logging.info(f"  ⚡ Snowflake insert ({loader.name}) completed in {snowflake_duration:.2f}s")
         logging.info(f"  🎯 Total batch processing time: {total_duration:.2f}s")
         
         # Reset current batch size
         current_batch_size.set(0)
+
+        return snowflake_duration
         
     except Exception as e:
         logging.error(f"❌ Error during batch ingestion: {e}")
@@ -283,113 +493,383 @@ def handle_shutdown(signum, frame):
     logging.warning(f"⚠️  Signal {signum} received. Finishing current batch processing...")
     running = False
 
-def validate_event_schema(event_content, event_type):
+def commit_ready_offsets(consumer, dlq, pending_commits, lag_tracker, ledger=None):
     """
-    Validates that events contain required fields based on their type.
-    Returns True if valid, False otherwise.
+    Commits the offsets of written batches whose DLQ records have all been acknowledged.
+    `pending_commits` is a list of (dlq_mark, {TopicPartition: next offset}) in write order.
     """
-    required_fields = {
-        'ORDER_CREATED': ['order_line_id', 'customer_id', 'product_id', 'quantity'],
-        'INVENTORY_ADJUSTED': ['event_id', 'product_id', 'quantity_change', 'adjustment_type']
-    }
-    
-    if event_type not in required_fields:
-        return True  # Unknown event types pass through
-    
-    for field in required_fields[event_type]:
-        if field not in event_content:
-            logging.warning(f"⚠️  Missing required field '{field}' in {event_type} event")
-            return False
-    
-    return True
+    dlq.poll()
+    offsets = {}
+    while pending_commits and dlq.is_delivered(pending_commits[0][0]):
+        for tp, offset in pending_commits.pop(0)[1].items():
+            offsets[tp] = max(offsets.get(tp, 0), offset)
+    offsets_awaiting_dlq.set(len(pending_commits))
+    dlq_buffer_depth.set(dlq.depth())
+    if not offsets:
+        return
+    try:
+        consumer.commit({tp: OffsetAndMetadata(offset, None) for tp, offset in offsets.items()})
+    except CommitFailedError as e:
+        # Partitions moved to another worker meanwhile: it resumes from the last committed offsets
+        logging.warning(f"⚠️  Offset commit rejected after a rebalance: {e}")
+        return
+    lag_tracker.record_commit(offsets)
+    if ledger is not None:
+        ledger.committed(offsets)
+    last_commit_timestamp.set(time.time())
+    logging.info("✅ Offsets committed: " +
+                 ", ".join(f"p{tp.partition}@{offset}" for tp, offset in sorted(offsets.items())))
+
+def collect_pipeline_offsets(pipeline, dlq, pending_commits):
+    """Queues the offsets of every batch that has landed along with all earlier batches."""
+    offsets = pipeline.pop_committable_offsets()
+    pipeline_queue_depth.set(pipeline.depth())
+    if offsets:
+        # The batches were sealed before this mark, so were their DLQ records
+        pending_commits.append((dlq.mark(), offsets))
+
+def apply_backpressure(consumer, buffers):
+    """
+    Pauses fetching while the flush queue (or the spool) is full so memory and disk stay bounded,
+    and while DLQ deliveries fail so no offset is committed past an undelivered DLQ record.
+    `buffers` lists (buffer, describe) pairs; `describe()` says what is full, for the logs.
+    """
+    full = [describe for buffer, describe in buffers if buffer.is_full()]
+    if full:
+        if not consumer.paused():
+            logging.warning(f"⏸️  {full[0]()} full, pausing partitions")
+        # Re-applied every loop so partitions gained in a rebalance are paused too
+        consumer.pause(*consumer.assignment())
+        pipeline_paused.set(1)
+    elif consumer.paused():
+        logging.info("▶️  Back-pressure cleared, resuming partitions")
+        consumer.resume(*consumer.paused())
+        pipeline_paused.set(0)
+
+def export_spool(spool):
+    """Exports the spool's backlog and drain progress."""
+    spool_bytes.set(spool.depth_bytes())
+    spool_segments.set(spool.segment_count())
+    spool_oldest_segment_age.set(spool.oldest_age())
+    spool_head_failed_attempts.set(spool.head_attempts())
+    spool_drain_rate.set(spool.drain_rate())
+
+_lag_partitions = set()
+
+def export_task_stage(task_name, state, queued_seconds, run_seconds):
+    """Exports one task's timings from a completed task graph run."""
+    task_stage_duration.labels(task=task_name, phase='queued', state=state).observe(queued_seconds)
+    task_stage_duration.labels(task=task_name, phase='running', state=state).observe(run_seconds)
+
+def export_task_graph(state, duration_seconds, freshness_seconds):
+    task_graph_runs_total.labels(state=state).inc()
+    task_graph_duration.observe(duration_seconds)
+    task_graph_freshness.observe(freshness_seconds)
+
+def export_lag(sample):
+    """Exports a LagSample (called from the lag tracker thread)."""
+    partitions = {str(tp.partition) for tp in sample.committed_lag}
+    for partition in _lag_partitions - partitions:
+        # Partition revoked: stop exporting stale values (zeroed first for the multiprocess files)
+        for gauge in (kafka_lag, kafka_in_flight_lag, kafka_oldest_uncommitted_age):
+            gauge.labels(partition=partition).set(0)
+            gauge.remove(partition)
+    _lag_partitions.clear()
+    _lag_partitions.update(partitions)
+    for tp, lag in sample.committed_lag.items():
+        kafka_lag.labels(partition=str(tp.partition)).set(lag)
+        kafka_in_flight_lag.labels(partition=str(tp.partition)).set(sample.in_flight_lag[tp])
+        kafka_oldest_uncommitted_age.labels(partition=str(tp.partition)).set(sample.oldest_uncommitted_age[tp])
+    kafka_catch_up_seconds.set(sample.catch_up_seconds)
+
+class PartitionRebalanceHandler(ConsumerRebalanceListener):
+    """Runs the consumer loop's rebalance callbacks, then the offset ledger's when enabled."""
+
+    def __init__(self, on_revoked, on_assigned, ledger_listener=None):
+        self.on_revoked = on_revoked
+        self.on_assigned = on_assigned
+        self.ledger_listener = ledger_listener
+
+    def on_partitions_revoked(self, revoked):
+        self.on_revoked(revoked)
+        if self.ledger_listener is not None:
+            self.ledger_listener.on_partitions_revoked(revoked)
+
+    def on_partitions_assigned(self, assigned):
+        if self.ledger_listener is not None:
+            self.ledger_listener.on_partitions_assigned(assigned)
+        self.on_assigned(assigned)
+
+def update_batching(batching):
+    """Re-evaluates the adaptive batch size and exports the decision."""
+    size, interval, reason = batching.update()
+    adaptive_batch_size.set(size)
+    adaptive_flush_interval.set(interval)
+    observed_event_rate.set(batching.arrival_rate())
+    for candidate in REASONS:
+        adaptive_batch_reason.labels(reason=candidate).set(1 if candidate == reason else 0)
+    return size, interval
+
+def create_engine_from_env():
+    """Snowflake engine configured from the SNOWFLAKE_* settings."""
+    return create_snowflake_engine(
+        URL(**{
+            "user": SNOWFLAKE_USER, "password": SNOWFLAKE_PASSWORD, "account": SNOWFLAKE_ACCOUNT,
+            "database": SNOWFLAKE_DATABASE, "warehouse": SNOWFLAKE_WAREHOUSE, "schema": TARGET_SCHEMA
+        }),
+        pool_size=SNOWFLAKE_POOL_SIZE,
+        max_overflow=SNOWFLAKE_POOL_MAX_OVERFLOW,
+        pool_recycle=SNOWFLAKE_POOL_RECYCLE_SECONDS,
+        pool_pre_ping=SNOWFLAKE_POOL_PRE_PING,
+        keep_alive=SNOWFLAKE_CLIENT_SESSION_KEEP_ALIVE,
+        observe_checkout=snowflake_pool_checkout_wait.observe,
+    )
+
+def replay_quarantined(directory):
+    """Loads the quarantined spool records of `directory` into RAW_EVENTS_STREAM (--replay-quarantine)."""
+    snowflake_engine = create_engine_from_env()
+    ledger = OffsetLedger(TARGET_SCHEMA, TOPIC_NAME, CONSUMER_GROUP_ID) if OFFSET_LEDGER_ENABLED else None
+    setup_snowflake_schema(snowflake_engine, ledger)
+    loader = make_loader(LOADER_BACKEND, TARGET_SCHEMA, LOADER_FILE_FORMAT)
 
-def main():
-    """Main entry point of the consumer with Prometheus metrics."""
+    def write_batch(conn, events):
+        ingest_raw_events_batch(conn, events, loader)
+        if ledger is not None:
+            ledger.record(conn, events.loaded_ranges(), len(events))
+
+    replayed, left = replay_quarantine(directory, snowflake_engine, write_batch)
+    logging.info(f"♻️  Quarantine replay: {replayed} file(s) loaded, {left} left in {directory}")
+    snowflake_engine.dispose()
+    return left == 0
+
+def main(serve_metrics=True):
+    """
+    Main entry point of the consumer with Prometheus metrics.
+    In multi-worker mode (consumer_workers.py) each worker runs main(serve_metrics=False)
+    and the parent process serves the aggregated metrics.
+    """
     global running
     signal.signal(signal.SIGINT, handle_shutdown)
     signal.signal(signal.SIGTERM, handle_shutdown)
 
     # Start Prometheus metrics server
-    start_http_server(METRICS_PORT)
-    logging.info(f"📊 Prometheus metrics server started on port {METRICS_PORT}")
+    if serve_metrics:
+        start_http_server(METRICS_PORT)
+        logging.info(f"📊 Prometheus metrics server started on port {METRICS_PORT}")
 
     # Connect to services
-    snowflake_engine = create_engine(URL(**{
-        "user": SNOWFLAKE_USER, "password": SNOWFLAKE_PASSWORD, "account": SNOWFLAKE_ACCOUNT,
-        "database": SNOWFLAKE_DATABASE, "warehouse": SNOWFLAKE_WAREHOUSE, "schema": TARGET_SCHEMA
-    }))
-    setup_snowflake_schema(snowflake_engine)
-
-    # Producer for Dead-Letter Queue (DLQ)
-    dlq_producer = KafkaProducer(
-        bootstrap_servers=BOOTSTRAP_SERVER,
-        value_serializer=lambda v: json.dumps(v).encode('utf-8')
+    snowflake_engine = create_engine_from_env()
+    logging.info(f"🏊 Snowflake pool: size={SNOWFLAKE_POOL_SIZE}, max_overflow={SNOWFLAKE_POOL_MAX_OVERFLOW}, "
+                 f"recycle={SNOWFLAKE_POOL_RECYCLE_SECONDS}s, pre_ping={SNOWFLAKE_POOL_PRE_PING}, "
+                 f"keep_alive={SNOWFLAKE_CLIENT_SESSION_KEEP_ALIVE}")
+    warm_up(snowflake_engine, SNOWFLAKE_POOL_SIZE,
+            warehouse=SNOWFLAKE_WAREHOUSE if SNOWFLAKE_WARM_UP_RESUME_WAREHOUSE else None)
+    ledger = OffsetLedger(TARGET_SCHEMA, TOPIC_NAME, CONSUMER_GROUP_ID) if OFFSET_LEDGER_ENABLED else None
+    setup_snowflake_schema(snowflake_engine, ledger)
+    loader = make_loader(LOADER_BACKEND, TARGET_SCHEMA, LOADER_FILE_FORMAT)
+    logging.info(f"🧬 JSON codec: {CODEC.name}")
+    logging.info(f"🚚 Loader backend: {loader.name} ({LOADER_FILE_FORMAT if loader.name == 'copy' else 'direct VARIANT insert'})")
+
+    # Producer for Dead-Letter Queue (DLQ): batched, compressed, acknowledged asynchronously
+    dlq = DeadLetterQueue(
+        KafkaProducer(
+            bootstrap_servers=BOOTSTRAP_SERVER,
+            value_serializer=CODEC.encode,
+            acks='all',
+            retries=5,
+            linger_ms=DLQ_LINGER_MS,
+            compression_type=None if DLQ_COMPRESSION == 'none' else DLQ_COMPRESSION
+        ),
+        DLQ_TOPIC_NAME,
+        max_pending=DLQ_MAX_PENDING,
+        observe_latency=dlq_delivery_latency.observe,
+        on_failure=lambda excp: dlq_delivery_failures_total.inc(),
+        on_drop=lambda excp: dlq_dropped_total.inc()
     )
     
     consumer = KafkaConsumer(
-        TOPIC_NAME,
         bootstrap_servers=BOOTSTRAP_SERVER,
         auto_offset_reset='earliest',
         enable_auto_commit=False,
-        group_id='snowflake-ingestion-les-caves-albert-v1',
+        group_id=CONSUMER_GROUP_ID,
         value_deserializer=lambda x: x.decode('utf-8')
     )
+    ledger_listener = None
+    if ledger is not None:
+        # Resume from the offset ledger rather than from the Kafka-committed offsets alone
+        ledger_listener = LedgerRebalanceListener(consumer, snowflake_engine, ledger)
+        logging.info(f"📒 Offset ledger enabled ({ledger.table})")
+
+    # Lag tracker: its own metadata-only consumer, polled off the hot path
+    lag_tracker = LagTracker(
+        lambda: KafkaConsumer(bootstrap_servers=BOOTSTRAP_SERVER, enable_auto_commit=False),
+        export_lag,
+        interval_seconds=LAG_TRACKER_INTERVAL_SECONDS
+    ).start()
+
+    # Batching controller: adapts size/interval to insert latency and arrival rate
+    batching = AdaptiveBatchController(
+        min_size=BATCH_SIZE_MIN,
+        max_size=BATCH_SIZE_MAX,
+        target_latency_seconds=TARGET_LATENCY_SECONDS,
+        target_rows=TARGET_ROWS_PER_STATEMENT
+    ) if ADAPTIVE_BATCHING else None
+    batch_size, flush_interval = BATCH_SIZE, COMMIT_INTERVAL_SECONDS
+
+    # Event-driven task graph: notified after each committed load, whatever the write path
+    task_trigger = None
+    if TASK_TRIGGER_ENABLED:
+        task_trigger = TaskGraphTrigger(
+            snowflake_engine,
+            TASK_TRIGGER_ROOT_TASK,
+            min_rows=TASK_TRIGGER_MIN_ROWS,
+            max_age_seconds=TASK_TRIGGER_MAX_AGE_SECONDS,
+            poll_interval_seconds=TASK_TRIGGER_POLL_SECONDS,
+            on_trigger=lambda reason, rows: task_graph_triggers_total.labels(reason=reason).inc(),
+            on_coalesced=task_graph_coalesced_rows_total.inc,
+            on_graph=export_task_graph,
+            on_stage=export_task_stage
+        ).start()
+        logging.info(f"🚀 Task graph trigger enabled on {TASK_TRIGGER_ROOT_TASK} "
+                     f"(>= {TASK_TRIGGER_MIN_ROWS} rows or {TASK_TRIGGER_MAX_AGE_SECONDS:.0f}s)")
+
+    def loaded(events):
+        if task_trigger is not None:
+            task_trigger.notify_loaded(len(events))
+
+    def spool_drained(events, spooled_at):
+        spool_drained_events_total.inc(len(events))
+        loaded(events)
+
+    def write_batch(conn, events):
+        duration = ingest_raw_events_batch(conn, events, loader)
+        if ledger is not None:
+            # Same transaction as the rows: the range is recorded iff the rows are loaded
+            ledger.record(conn, events.loaded_ranges(), len(events))
+        if batching is not None:
+            batching.observe_insert(len(events), duration)
+
+    # Write-ahead spool: the drainer thread is the only Snowflake writer
+    spool = None
+    if SPOOL_ENABLED:
+        # One spool per worker process: a restarted worker replays its own segments
+        spool_dir = os.path.join(SPOOL_DIR, multiprocessing.current_process().name)
+        spool = BatchSpool(
+            spool_dir,
+            snowflake_engine,
+            write_batch,
+            segment_bytes=SPOOL_SEGMENT_BYTES,
+            max_bytes=SPOOL_MAX_BYTES,
+            retry_backoff_seconds=SPOOL_RETRY_BACKOFF_SECONDS,
+            max_backoff_seconds=SPOOL_MAX_BACKOFF_SECONDS,
+            isolate_after=SPOOL_ISOLATE_AFTER_ATTEMPTS,
+            on_drained=spool_drained,
+            on_failure=lambda excp: spool_drain_failures_total.inc(),
+            on_quarantine=lambda size: spool_quarantined_records_total.inc()
+        )
+        logging.info(f"💾 Spool enabled in {spool_dir} (segments of {SPOOL_SEGMENT_BYTES} bytes, "
+                     f"max {SPOOL_MAX_BYTES} bytes)")
+        if PIPELINE_ENABLED:
+            logging.warning("⚠️  PIPELINE_ENABLED ignored: with the spool, Snowflake writes already run in the background")
+
+    # Background writers (pipelined mode only)
+    pipeline = None
+    if PIPELINE_ENABLED and spool is None:
+        pipeline = BatchPipeline(
+            snowflake_engine,
+            write_batch,
+            writer_threads=PIPELINE_WRITER_THREADS,
+            queue_size=PIPELINE_QUEUE_SIZE,
+            on_written=loaded
+        )
+        logging.info(f"🧵 Pipelined mode: {PIPELINE_WRITER_THREADS} writer threads, "
+                     f"queue of {PIPELINE_QUEUE_SIZE} sealed batches")
 
     logging.info(f"🍷 Les Caves d'Albert Consumer started. Listening to topic '{TOPIC_NAME}'")
     logging.info("=" * 80)
 
-    batch = []
+    batch = EventBatch()
+    pending_commits = []  # (DLQ mark, offsets) of written batches, committed once their DLQ records are acked
     last_commit = time.time()
-    BATCH_SIZE = 100
-    COMMIT_INTERVAL_SECONDS = 10
     
     # Event type counters for logging
     event_stats = {'ORDER_CREATED': 0, 'INVENTORY_ADJUSTED': 0, 'OTHER': 0, 'ERRORS': 0}
 
+    def on_partitions_revoked(revoked):
+        """Lands written work and drops unwritten work before the partitions move to another worker."""
+        nonlocal batch
+        if not revoked:
+            return
+        logging.warning(f"🔀 Rebalance: revoking partitions {sorted(tp.partition for tp in revoked)}")
+        if batch:
+            logging.info(f"🗑️  Discarding {len(batch)} unwritten event(s) of the open batch")
+        # Not written yet: the next owner re-reads these records from the committed offsets
+        batch = EventBatch()
+        if pipeline is not None and not pipeline.wait_idle(timeout=REBALANCE_DRAIN_TIMEOUT_SECONDS):
+            logging.warning(f"⚠️  {pipeline.depth()} batch(es) still being written at revocation, "
+                            "their offsets will not be committed by this worker")
+        if pipeline is not None:
+            collect_pipeline_offsets(pipeline, dlq, pending_commits)
+        dlq.flush(timeout=REBALANCE_DRAIN_TIMEOUT_SECONDS)
+        commit_ready_offsets(consumer, dlq, pending_commits, lag_tracker, ledger)
+        if pending_commits:
+            logging.warning(f"⚠️  Dropping {len(pending_commits)} uncommittable offset range(s) (DLQ not acknowledged)")
+            pending_commits.clear()
+        assigned_partitions.set(0)
+
+    def on_partitions_assigned(assigned):
+        logging.info(f"🔀 Rebalance: assigned partitions {sorted(tp.partition for tp in assigned)}")
+        assigned_partitions.set(len(assigned))
+
+    consumer.subscribe([TOPIC_NAME], listener=PartitionRebalanceHandler(
+        on_partitions_revoked, on_partitions_assigned, ledger_listener
+    ))
+
     try:
         while running:
+            buffers = [(dlq, lambda: f"DLQ ({dlq.depth()} unacknowledged, {dlq.failing()} failing record(s))")]
+            if pipeline is not None:
+                collect_pipeline_offsets(pipeline, dlq, pending_commits)
+                buffers.append((pipeline, lambda: f"Flush queue ({pipeline.depth()} batch(es) in flight)"))
+            if spool is not None:
+                export_spool(spool)
+                buffers.append((spool,
+                                lambda: f"Spool ({spool.depth_bytes()} bytes in {spool.segment_count()} segment(s))"))
+            apply_backpressure(consumer, buffers)
+            if task_trigger is not None:
+                task_graph_pending_rows.set(task_trigger.pending_rows())
+            commit_ready_offsets(consumer, dlq, pending_commits, lag_tracker, ledger)
+
+            if batching is not None:
+                batch_size, flush_interval = update_batching(batching)
+
             # Poll with timeout to avoid blocking indefinitely
-            messages = consumer.poll(timeout_ms=1000, max_records=BATCH_SIZE)
+            messages = consumer.poll(timeout_ms=1000, max_records=max(batch_size - len(batch), 1))
+            if batching is not None:
+                batching.observe_arrivals(sum(len(msgs) for msgs in messages.values()))
+            lag_tracker.set_assignment(consumer.assignment())
+            lag_tracker.record_poll(messages)
             
             if not messages:
                 # If no messages, check if we should commit current batch due to time elapsed
-                if batch and (time.time() - last_commit > COMMIT_INTERVAL_SECONDS):
+                if batch and (time.time() - last_commit > flush_interval):
                     pass  # Commit will happen below
                 else:
                     continue
 
             for topic_partition, msgs in messages.items():
                 for msg in msgs:
+                    batch.mark_offset(topic_partition, msg.offset)
+                    if ledger is not None and ledger.is_loaded(topic_partition, msg.offset):
+                        ledger_skipped_total.inc()
+                        continue
                     with event_processing_summary.time():
                         try:
-                            event_content = json.loads(msg.value)
-                            event_type = event_content.get('event_type', 'UNKNOWN')
-                            
-                            # Validate event schema
-                            if not validate_event_schema(event_content, event_type):
-                                events_consumed_total.labels(event_type=event_type, status='invalid_schema').inc()
-                                dlq_producer.send(DLQ_TOPIC_NAME, value={
-                                    "raw_message": msg.value,
-                                    "error": "InvalidSchema",
-                                    "event_type": event_type,
-                                    "offset": msg.offset
-                                })
-                                dlq_messages_total.labels(error_type='invalid_schema').inc()
-                                event_stats['ERRORS'] += 1
-                                continue
-                            
-                            event_metadata = {
-                                "topic": msg.topic,
-                                "partition": msg.partition,
-                                "offset": msg.offset,
-                                "timestamp_ms": msg.timestamp,
-                                "key": msg.key.decode('utf-8') if msg.key else None
-                            }
+                            # Decoding validates the event schema (typed models per event type)
+                            event = CODEC.decode_event(msg.value)
+                            event_type = event.event_type
                             
-                            batch.append({
-                                "EVENT_METADATA": event_metadata,
-                                "EVENT_CONTENT": event_content
-                            })
+                            batch.append(msg, event)
                             
                             # Track event consumption
                             events_consumed_total.labels(event_type=event_type, status='success').inc()
@@ -400,40 +880,85 @@ def main():
                             else:
                                 event_stats['OTHER'] += 1
                             
-                        except json.JSONDecodeError as e:
+                        except InvalidEventError as e:
+                            logging.warning(f"⚠️  Invalid {e.event_type} event at offset {msg.offset}: {e}")
+                            events_consumed_total.labels(event_type=e.event_type, status='invalid_schema').inc()
+                            dlq.publish({
+                                "raw_message": msg.value,
+                                "error": "InvalidSchema",
+                                "event_type": e.event_type,
+                                "offset": msg.offset
+                            })
+                            # Not loaded: kept out of the ledger ranges, so a crash before the DLQ ack replays it
+                            batch.exclude_offset(topic_partition, msg.offset)
+                            dlq_messages_total.labels(error_type='invalid_schema').inc()
+                            event_stats['ERRORS'] += 1
+                            continue
+
+                        except EventDecodeError as e:
                             logging.error(f"❌ JSON decode error at offset {msg.offset}: {e}")
                             events_consumed_total.labels(event_type='UNKNOWN', status='json_error').inc()
-                            dlq_producer.send(DLQ_TOPIC_NAME, value={
+                            dlq.publish({
                                 "raw_message": msg.value,
                                 "error": f"JSONDecodeError: {str(e)}",
                                 "offset": msg.offset
                             })
+                            # Not loaded: kept out of the ledger ranges, so a crash before the DLQ ack replays it
+                            batch.exclude_offset(topic_partition, msg.offset)
                             dlq_messages_total.labels(error_type='json_decode').inc()
                             event_stats['ERRORS'] += 1
                             continue
             
             # Commit condition: batch size or time interval reached
-            if batch and (len(batch) >= BATCH_SIZE or time.time() - last_commit > COMMIT_INTERVAL_SECONDS):
+            if batch and (len(batch) >= batch_size or time.time() - last_commit > flush_interval):
+                if pipeline is not None:
+                    # Hand the sealed batch to the writers and go straight back to polling
+                    if not pipeline.is_full():
+                        seq = pipeline.submit(batch, batch.last_offsets())
+                        pipeline_queue_depth.set(pipeline.depth())
+                        logging.info(f"📤 Batch #{seq} sealed ({len(batch)} events), "
+                                     f"{pipeline.depth()} batch(es) in flight")
+                        batch = EventBatch()
+                        last_commit = time.time()
+                    continue
+
+                if spool is not None:
+                    # Durable on local disk: the offsets can be committed, the drainer loads Snowflake
+                    if not spool.is_full():
+                        spool.append(batch)
+                        pending_commits.append((dlq.mark(), {
+                            tp: offset + 1 for tp, offset in batch.last_offsets().items()
+                        }))
+                        commit_ready_offsets(consumer, dlq, pending_commits, lag_tracker, ledger)
+                        logging.info(f"💾 Batch spooled ({len(batch)} events), "
+                                     f"{spool.depth_bytes()} bytes awaiting Snowflake")
+                        batch = EventBatch()
+                        last_commit = time.time()
+                    continue
+
                 logging.info("=" * 80)
                 with snowflake_engine.connect() as conn:
                     transaction = conn.begin()
                     try:
-                        ingest_raw_events_batch(conn, batch)
+                        write_batch(conn, batch)
                         transaction.commit()
-                        consumer.commit()
-                        
-                        # Update metrics
-                        last_commit_timestamp.set(time.time())
+                        loaded(batch)
+
+                        # Kafka offsets follow once the batch's DLQ records are acknowledged
+                        pending_commits.append((dlq.mark(), {
+                            tp: offset + 1 for tp, offset in batch.last_offsets().items()
+                        }))
+                        commit_ready_offsets(consumer, dlq, pending_commits, lag_tracker, ledger)
                         
                         # Log statistics
-                        logging.info(f"✅ Batch committed successfully!")
+                        logging.info("✅ Batch written to Snowflake!")
                         logging.info(f"📈 Session stats - Orders: {event_stats['ORDER_CREATED']}, "
                                    f"Inventory: {event_stats['INVENTORY_ADJUSTED']}, "
                                    f"Other: {event_stats['OTHER']}, "
                                    f"Errors: {event_stats['ERRORS']}")
                         logging.info("=" * 80)
                         
-                        batch = []
+                        batch = EventBatch()
                         last_commit = time.time()
                         
                     except SQLAlchemyError as e:
@@ -448,11 +973,30 @@ def main():
                    f"Inventory: {event_stats['INVENTORY_ADJUSTED']}, "
                    f"Other: {event_stats['OTHER']}, "
                    f"Errors: {event_stats['ERRORS']}")
+        if pipeline is not None:
+            logging.info(f"⏳ Waiting for {pipeline.depth()} in-flight batch(es)...")
+            pipeline.close(timeout=60)
+            collect_pipeline_offsets(pipeline, dlq, pending_commits)
+        if spool is not None:
+            logging.info(f"⏳ Draining {spool.depth_bytes()} spooled byte(s) into Snowflake...")
+            spool.close(timeout=30)
+        logging.info(f"⏳ Waiting for {dlq.depth()} unacknowledged DLQ record(s)...")
+        dlq.flush(timeout=30)
+        commit_ready_offsets(consumer, dlq, pending_commits, lag_tracker, ledger)
         logging.info("🔄 Closing connections...")
+        if task_trigger is not None:
+            task_trigger.stop()
+        lag_tracker.stop()
         consumer.close()
-        dlq_producer.close()
+        dlq.close(timeout=5)
         snowflake_engine.dispose()
         logging.info("✅ Consumer stopped gracefully - Les Caves d'Albert")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Kafka -> Snowflake ingestion consumer")
+    parser.add_argument("--replay-quarantine", metavar="DIR",
+                        help="Load the quarantined spool records of DIR (e.g. spool/MainProcess/quarantine) and exit")
+    args = parser.parse_args()
+    if args.replay_quarantine:
+        raise SystemExit(0 if replay_quarantined(args.replay_quarantine) else 1)
     main()
\ No newline at end of file
@@ -1,14 +1,18 @@
 import os
-import json
 import uuid
 import time
 import random
 import signal
 import logging
 import sys
+import queue
+import argparse
+import multiprocessing
 from datetime import datetime, timezone
 from kafka import KafkaProducer
 from dotenv import load_dotenv
+from event_codec import get_codec, OrderCreated, InventoryAdjusted
+from product_catalog import build_catalog
 
 # --- CONFIGURATION ---
 
@@ -24,65 +28,32 @@ BOOTSTRAP_SERVER = os.getenv("KAFKA_BOOTSTRAP_SERVER", "redpanda:9092")
 # Accept a comma-separated list and produce a list for kafka-python
 BOOTSTRAP_SERVERS = [s.strip() for s in BOOTSTRAP_SERVER.split(",") if s.strip()]
 
+# JSON codec shared with the consumer: auto (fastest installed) | msgspec | orjson | json
+CODEC = get_codec(os.getenv("JSON_CODEC", "auto"))
+
 # Random Data Generation - Consistent with Data_generator_faker_docker
 rng = random.Random()
 rng.seed(42)  # Seed for reproducibility
 
 # Les Caves d'Albert Configuration
 CUSTOMER_IDS = list(range(1, 151))
-PRODUCT_IDS = list(range(1000, 1050))  # Consistent with generator (1000-1049)
+PRODUCT_IDS = list(range(1000, 1050))  # Consistent with generator (1000-1049) and the catalog
 SALES_CHANNELS = ["E-com", "Boutique Paris", "Boutique Lyon", "Boutique Bordeaux"]
 
-# Realistic wine data - Les Caves d'Albert 🍷
-WINE_CATEGORIES = [
-    ("🍷 Rouge", ["Merlot", "Cabernet Sauvignon", "Pinot Noir", "Syrah", "Malbec"]),
-    ("🥂 Blanc", ["Chardonnay", "Sauvignon Blanc", "Riesling", "Viognier"]),
-    ("🌸 Rosé", ["Grenache Rosé", "Syrah Rosé", "Cinsault Rosé"]),
-    ("🍾 Effervescent", ["Champagne", "Crémant", "Prosecco"]),
-    ("🥃 Spiritueux", ["Whisky", "Rhum", "Cognac", "Armagnac"]),
-]
-
-ADJECTIVES = ["Réserve", "Tradition", "Sélection", "Grande Cuvée", "Prestige", "Vieilles Vignes", "Édition Limitée"]
 BOTTLE_SIZES = [0.375, 0.5, 0.75, 1.0, 1.5]
 
-# Mapping product_id -> product details (simulated)
-def get_product_name(product_id):
-    """Generates a consistent product name based on ID"""
-    rng_product = random.Random(product_id)  # Seed based on ID for consistency
-    current_year = datetime.now().year
-    category_emoji, grape_list = rng_product.choice(WINE_CATEGORIES)
-    grape = rng_product.choice(grape_list)
-    adj = rng_product.choice(ADJECTIVES)
-    year = rng_product.randint(current_year - 15, current_year)
-    return f"{grape} {year} – {adj}", category_emoji
-
-def get_product_price(product_id):
-    """Generates a consistent price based on ID"""
-    rng_price = random.Random(product_id + 1000)
-    category_emoji, _ = get_product_name(product_id)[1], None
-    
-    # Base price per category
-    if "Rouge" in category_emoji:
-        base = 18
-    elif "Blanc" in category_emoji:
-        base = 15
-    elif "Rosé" in category_emoji:
-        base = 12
-    elif "Effervescent" in category_emoji:
-        base = 30
-    else:  # Spiritueux
-        base = 45
-    
-    return round(rng_price.uniform(base * 0.7, base * 2), 2)
+# Product catalog: computed once at startup, shared with the batch data generator
+CATALOG = build_catalog(PRODUCT_IDS)
 
 # --- EVENT GENERATION FUNCTIONS ---
 
-def generate_order_created_event():
+def generate_order_created_event(log=True):
     """🛒 Event 1: Simulates a new customer order (ORDER_CREATED) - Les Caves d'Albert"""
     product_id = rng.choice(PRODUCT_IDS)
-    product_name, category_emoji = get_product_name(product_id)
+    product = CATALOG[product_id]
+    product_name, category_emoji = product.name, product.category_label
     quantity = rng.choices([1, 2, 3, 6], weights=[0.6, 0.25, 0.1, 0.05])[0]
-    unit_price = get_product_price(product_id)
+    unit_price = product.unit_price
     total_price = round(quantity * unit_price, 2)
     customer_id = rng.choice(CUSTOMER_IDS)
     sales_channel = rng.choice(SALES_CHANNELS)
@@ -91,28 +62,28 @@ def generate_order_created_event():
     # Apply discount (25% chance)
     discount = round(rng.uniform(0, 10), 2) if rng.random() < 0.25 else 0.0
     
-    event = {
-        "event_type": "ORDER_CREATED",
-        "order_line_id": str(uuid.uuid4()),
-        "customer_id": customer_id,
-        "product_id": product_id,
-        "product_name": product_name,
-        "category": category_emoji,
-        "quantity": quantity,
-        "unit_price": unit_price,
-        "total_price": total_price,
-        "discount": discount,
-        "bottle_size_l": bottle_size,
-        "sales_channel": sales_channel,
-        "event_ts": datetime.now(timezone.utc).isoformat(),
-        "source_service": "ecom_api",
-        "emoji": "🛒"
-    }
+    event = OrderCreated(
+        order_line_id=str(uuid.uuid4()),
+        customer_id=customer_id,
+        product_id=product_id,
+        product_name=product_name,
+        category=category_emoji,
+        quantity=quantity,
+        unit_price=unit_price,
+        total_price=total_price,
+        discount=discount,
+        bottle_size_l=bottle_size,
+        sales_channel=sales_channel,
+        event_ts=datetime.now(timezone.utc).isoformat(),
+        source_service="ecom_api",
+        emoji="🛒"
+    )
     
-    logging.info(f"🛒 ORDER_CREATED | Customer #{customer_id} | {category_emoji} {product_name} | Qty: {quantity} | Price: €{total_price} | Channel: {sales_channel}")
+    if log:
+        logging.info(f"🛒 ORDER_CREATED | Customer #{customer_id} | {category_emoji} {product_name} | Qty: {quantity} | Price: €{total_price} | Channel: {sales_channel}")
     return event
 
-def generate_inventory_adjusted_event():
+def generate_inventory_adjusted_event(log=True):
     """📦 Event 2: Simulates inventory variation (INVENTORY_ADJUSTED) - Les Caves d'Albert"""
     adjustment_type = rng.choices(
         ["REPLENISHMENT", "CORRECTION", "SPOILAGE"], 
@@ -127,7 +98,8 @@ def generate_inventory_adjusted_event():
     }
     
     product_id = rng.choice(PRODUCT_IDS)
-    product_name, category_emoji = get_product_name(product_id)
+    product = CATALOG[product_id]
+    product_name, category_emoji = product.name, product.category_label
     
     # Quantity logic based on type
     if adjustment_type == "REPLENISHMENT":
@@ -137,34 +109,34 @@ def generate_inventory_adjusted_event():
     
     warehouse_location = rng.choice(["Entrepôt Paris", "Entrepôt Lyon", "Entrepôt Bordeaux", "Cave Centrale"])
     
-    event = {
-        "event_type": "INVENTORY_ADJUSTED",
-        "event_id": str(uuid.uuid4()),
-        "product_id": product_id,
-        "product_name": product_name,
-        "category": category_emoji,
-        "quantity_change": quantity_change,
-        "adjustment_type": adjustment_type,
-        "warehouse_location": warehouse_location,
-        "event_ts": datetime.now(timezone.utc).isoformat(),
-        "source_service": "warehouse_management",
-        "emoji": adjustment_emojis[adjustment_type]
-    }
+    event = InventoryAdjusted(
+        event_id=str(uuid.uuid4()),
+        product_id=product_id,
+        product_name=product_name,
+        category=category_emoji,
+        quantity_change=quantity_change,
+        adjustment_type=adjustment_type,
+        warehouse_location=warehouse_location,
+        event_ts=datetime.now(timezone.utc).isoformat(),
+        source_service="warehouse_management",
+        emoji=adjustment_emojis[adjustment_type]
+    )
     
-    sign = "+" if quantity_change > 0 else ""
-    logging.info(f"{adjustment_emojis[adjustment_type]} INVENTORY_ADJUSTED | Product #{product_id} | {category_emoji} {product_name} | {sign}{quantity_change} units | Type: {adjustment_type} | {warehouse_location}")
+    if log:
+        sign = "+" if quantity_change > 0 else ""
+        logging.info(f"{adjustment_emojis[adjustment_type]} INVENTORY_ADJUSTED | Product #{product_id} | {category_emoji} {product_name} | {sign}{quantity_change} units | Type: {adjustment_type} | {warehouse_location}")
     return event
 
 # --- MAIN LOGIC ---
 
 def run_producer():
     """🚀 Connects to Kafka and continuously sends events with graceful shutdown - Les Caves d'Albert"""
-    logging.info(f"🔌 Connecting to Kafka at {BOOTSTRAP_SERVERS}")
+    logging.info(f"🔌 Connecting to Kafka at {BOOTSTRAP_SERVERS} (JSON codec: {CODEC.name})")
 
     try:
         producer = KafkaProducer(
             bootstrap_servers=BOOTSTRAP_SERVERS,
-            value_serializer=lambda v: json.dumps(v).encode('utf-8'),
+            value_serializer=CODEC.encode,
             retries=5,
             linger_ms=10
         )
@@ -198,10 +170,10 @@ def run_producer():
             # 70% orders, 30% inventory adjustments
             if rng.random() < 0.7:
                 event = generate_order_created_event()
-                key = event['order_line_id']
+                key = event.order_line_id
             else:
                 event = generate_inventory_adjusted_event()
-                key = event['event_id']
+                key = event.event_id
 
             try:
                 future = producer.send(
@@ -231,5 +203,170 @@ def run_producer():
             logging.warning(f"⚠️  Error while closing producer: {e}")
         logging.info("🛑 Producer stopped - Les Caves d'Albert")
 
+# --- LOAD-GENERATOR MODE ---
+
+class TokenBucket:
+    """Paces sends to `rate` events/sec, allowing bursts of up to `burst` events."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate / 10)
+        self.tokens = self.capacity
+        self.last = time.perf_counter()
+
+    def acquire(self):
+        while True:
+            now = time.perf_counter()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            time.sleep((1 - self.tokens) / self.rate)
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def _load_worker(worker_id, args, results):
+    """One load-generator process: own producer, own seeded RNG stream, own share of the rate and count."""
+    rng.seed(args.seed + worker_id)
+    running = True
+
+    def _shutdown(signum, frame):
+        nonlocal running
+        running = False
+
+    signal.signal(signal.SIGINT, _shutdown)
+    signal.signal(signal.SIGTERM, _shutdown)
+
+    producer = KafkaProducer(
+        bootstrap_servers=BOOTSTRAP_SERVERS,
+        value_serializer=CODEC.encode,
+        retries=5,
+        acks=args.acks,
+        batch_size=args.batch_size,
+        linger_ms=args.linger_ms,
+        compression_type=None if args.compression == "none" else args.compression
+    )
+
+    pacer = TokenBucket(args.rate / args.workers) if args.rate > 0 else None
+    quota = None
+    if args.count:
+        quota = args.count // args.workers + (1 if worker_id < args.count % args.workers else 0)
+    deadline = time.perf_counter() + args.duration if args.duration else None
+
+    latencies = []
+    errors = [0]
+
+    def _on_error(excp):
+        errors[0] += 1
+        if errors[0] <= 5:
+            logging.error(f"❌ [worker {worker_id}] Message delivery failed: {excp}")
+
+    sent = 0
+    start = time.perf_counter()
+    while running and (quota is None or sent < quota) and (deadline is None or time.perf_counter() < deadline):
+        if pacer is not None:
+            pacer.acquire()
+        log = args.log_every > 0 and sent % args.log_every == 0
+        if rng.random() < 0.7:
+            event = generate_order_created_event(log=log)
+            key = event.order_line_id
+        else:
+            event = generate_inventory_adjusted_event(log=log)
+            key = event.event_id
+        sent_at = time.perf_counter()
+        future = producer.send(TOPIC_NAME, key=key.encode('utf-8'), value=event)
+        future.add_callback(lambda _, t=sent_at: latencies.append(time.perf_counter() - t))
+        future.add_errback(_on_error)
+        sent += 1
+
+    producer.flush(timeout=60)
+    elapsed = time.perf_counter() - start
+    producer.close()
+
+    # Cap what travels back to the parent: a uniform subsample is enough for percentiles
+    step = max(1, len(latencies) // 50_000)
+    results.put({
+        "worker": worker_id,
+        "sent": sent,
+        "delivered": len(latencies),
+        "errors": errors[0],
+        "elapsed": elapsed,
+        "latencies": latencies[::step],
+    })
+
+def run_load_generator(args):
+    """🏎️ Load-test mode: target rate, duration/count, tunable batching, N worker processes."""
+    target = f"{args.rate:,.0f} ev/s" if args.rate > 0 else "unthrottled"
+    limit = f"{args.count:,} events" if args.count else f"{args.duration:.0f}s"
+    logging.info(f"🏎️ Load generator: {target}, {limit}, {args.workers} worker(s), "
+                 f"batch_size={args.batch_size}, linger_ms={args.linger_ms}, compression={args.compression}, "
+                 f"codec={CODEC.name}")
+    logging.info("=" * 80)
+
+    # Workers trap SIGINT themselves and report what they sent
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    results = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(target=_load_worker, args=(i, args, results), name=f"loadgen-{i}")
+        for i in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+    reports = []
+    while len(reports) < len(workers):
+        try:
+            reports.append(results.get(timeout=1))
+        except queue.Empty:
+            if not any(worker.is_alive() for worker in workers) and results.empty():
+                break
+    for worker in workers:
+        worker.join()
+    if not reports:
+        logging.error("❌ No load-generator worker reported back")
+        return
+
+    sent = sum(r["sent"] for r in reports)
+    delivered = sum(r["delivered"] for r in reports)
+    errors = sum(r["errors"] for r in reports)
+    elapsed = max(r["elapsed"] for r in reports)
+    latencies = sorted(latency for r in reports for latency in r["latencies"])
+
+    logging.info("=" * 80)
+    logging.info(f"📊 Sent: {sent:,} | Delivered: {delivered:,} | Errors: {errors:,} | Elapsed: {elapsed:.1f}s")
+    logging.info(f"🚀 Achieved throughput: {sent / elapsed:,.0f} ev/s sent, {delivered / elapsed:,.0f} ev/s delivered")
+    logging.info(f"⏱️  Delivery latency (ms): p50={_percentile(latencies, 50) * 1000:.1f} "
+                 f"p95={_percentile(latencies, 95) * 1000:.1f} "
+                 f"p99={_percentile(latencies, 99) * 1000:.1f} "
+                 f"max={(latencies[-1] if latencies else float('nan')) * 1000:.1f}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Les Caves d'Albert event producer")
+    parser.add_argument("--load-test", action="store_true",
+                        help="High-throughput load-generator mode instead of the paced demo stream")
+    parser.add_argument("--rate", type=float, default=1000, help="Target events/sec in total (0 = unthrottled)")
+    parser.add_argument("--duration", type=float, default=60, help="Run time in seconds (ignored with --count)")
+    parser.add_argument("--count", type=int, default=0, help="Total number of events to send")
+    parser.add_argument("--workers", type=int, default=1, help="Number of producer processes")
+    parser.add_argument("--batch-size", type=int, default=65536, help="Producer batch_size in bytes")
+    parser.add_argument("--linger-ms", type=int, default=20, help="Producer linger_ms")
+    parser.add_argument("--compression", default="gzip", choices=["none", "gzip", "snappy", "lz4", "zstd"])
+    parser.add_argument("--acks", default=1, type=lambda v: v if v == "all" else int(v))
+    parser.add_argument("--log-every", type=int, default=10_000, help="Log one event out of N (0 = never)")
+    parser.add_argument("--seed", type=int, default=42, help="Base seed; worker i uses seed + i")
+    args = parser.parse_args(argv)
+    if args.count:
+        args.duration = None
+    return args
+
 if __name__ == "__main__":
-    run_producer()
\ No newline at end of file
+    cli_args = parse_args()
+    if cli_args.load_test:
+        run_load_generator(cli_args)
+    else:
+        run_producer()
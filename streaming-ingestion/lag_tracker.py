@@ -0,0 +1,159 @@
+# lag_tracker.py - Les Caves d'Albert
+# Consumer lag computed off the hot path: end offsets vs. committed and in-flight positions
+
+import time
+import logging
+import threading
+from collections import deque
+
+
+class LagSample:
+    """One lag measurement for all assigned partitions."""
+
+    __slots__ = ("at", "committed_lag", "in_flight_lag", "oldest_uncommitted_age", "catch_up_seconds",
+                 "consume_rate", "produce_rate")
+
+    def __init__(self, at, committed_lag, in_flight_lag, oldest_uncommitted_age, catch_up_seconds,
+                 consume_rate, produce_rate):
+        self.at = at
+        self.committed_lag = committed_lag            # {TopicPartition: end offset - committed offset}
+        self.in_flight_lag = in_flight_lag            # {TopicPartition: end offset - next offset to read}
+        self.oldest_uncommitted_age = oldest_uncommitted_age  # {TopicPartition: seconds} (0 if all committed)
+        self.catch_up_seconds = catch_up_seconds      # total committed lag / net drain rate (inf if not draining)
+        self.consume_rate = consume_rate              # committed events/sec since the previous sample
+        self.produce_rate = produce_rate              # end offset growth/sec since the previous sample
+
+    @property
+    def total_lag(self):
+        return sum(self.committed_lag.values())
+
+
+class LagTracker:
+    """
+    Tracks what the consumer has read and committed, and periodically compares it
+    with the partitions' end offsets from a background thread.
+
+    The consumer thread only updates in-memory positions (record_poll,
+    record_commit, set_assignment): no I/O is added to the poll loop. The
+    background thread queries end offsets with its own KafkaConsumer, since
+    KafkaConsumer instances are not thread-safe, and hands each LagSample to
+    `on_sample`.
+    """
+
+    def __init__(self, end_offsets_consumer_factory, on_sample, interval_seconds=15.0):
+        self._consumer_factory = end_offsets_consumer_factory  # callable() -> KafkaConsumer (no group)
+        self.on_sample = on_sample
+        self.interval_seconds = interval_seconds
+        self._lock = threading.Lock()
+        self._assignment = frozenset()
+        self._committed = {}   # TopicPartition -> next offset committed
+        self._position = {}    # TopicPartition -> next offset to read
+        self._uncommitted = {}  # TopicPartition -> deque of (first offset, last offset, first timestamp ms) per poll
+        self._previous = None  # (time, assignment, committed total, end offsets total)
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="lag-tracker", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        self._thread.join(timeout=timeout)
+
+    # --- consumer-thread API ---
+
+    def set_assignment(self, partitions):
+        partitions = frozenset(partitions)
+        if partitions == self._assignment:
+            return
+        with self._lock:
+            self._assignment = partitions
+            for state in (self._committed, self._position, self._uncommitted):
+                for tp in list(state):
+                    if tp not in partitions:
+                        del state[tp]
+
+    def record_poll(self, messages):
+        """Records the records returned by one poll ({TopicPartition: [ConsumerRecord]})."""
+        with self._lock:
+            for tp, msgs in messages.items():
+                if not msgs:
+                    continue
+                first, last = msgs[0], msgs[-1]
+                # Nothing committed yet in this session: the group's committed offset is where we started
+                self._committed.setdefault(tp, first.offset)
+                self._position[tp] = last.offset + 1
+                self._uncommitted.setdefault(tp, deque()).append((first.offset, last.offset, first.timestamp))
+
+    def record_commit(self, offsets):
+        """Records a successful commit ({TopicPartition: next offset})."""
+        with self._lock:
+            for tp, offset in offsets.items():
+                self._committed[tp] = max(self._committed.get(tp, 0), offset)
+                polls = self._uncommitted.get(tp)
+                while polls and polls[0][1] < offset:
+                    polls.popleft()
+
+    # --- background thread ---
+
+    def _snapshot(self):
+        with self._lock:
+            oldest = {tp: polls[0][2] for tp, polls in self._uncommitted.items() if polls}
+            return self._assignment, dict(self._committed), dict(self._position), oldest
+
+    def sample(self, end_offsets):
+        """Builds a LagSample from {TopicPartition: end offset}."""
+        now = time.time()
+        assignment, committed, position, oldest = self._snapshot()
+        committed_lag, in_flight_lag, ages = {}, {}, {}
+        for tp in assignment:
+            end = end_offsets.get(tp)
+            if end is None:
+                continue
+            committed_lag[tp] = max(0, end - committed.get(tp, end))
+            in_flight_lag[tp] = max(0, end - position.get(tp, committed.get(tp, end)))
+            ages[tp] = max(0.0, now - oldest[tp] / 1000) if tp in oldest else 0.0
+
+        committed_total = sum(committed.get(tp, 0) for tp in committed_lag)
+        end_total = sum(end_offsets[tp] for tp in committed_lag)
+        consume_rate = produce_rate = 0.0
+        # Rates are only meaningful between two samples over the same partitions
+        if self._previous is not None and self._previous[1] == assignment and now > self._previous[0]:
+            elapsed = now - self._previous[0]
+            consume_rate = max(0.0, (committed_total - self._previous[2]) / elapsed)
+            produce_rate = max(0.0, (end_total - self._previous[3]) / elapsed)
+        self._previous = (now, assignment, committed_total, end_total)
+
+        total_lag = sum(committed_lag.values())
+        drain_rate = consume_rate - produce_rate
+        if total_lag == 0:
+            catch_up = 0.0
+        elif drain_rate > 0:
+            catch_up = total_lag / drain_rate
+        else:
+            catch_up = float("inf")
+        return LagSample(now, committed_lag, in_flight_lag, ages, catch_up, consume_rate, produce_rate)
+
+    def _run(self):
+        consumer = None
+        while not self._stopping.wait(self.interval_seconds):
+            assignment = self._assignment
+            if not assignment:
+                continue
+            try:
+                if consumer is None:
+                    consumer = self._consumer_factory()
+                end_offsets = consumer.end_offsets(list(assignment))
+            except Exception as e:  # broker unavailable: keep the last exported values, retry next tick
+                logging.warning(f"⚠️  Lag tracker could not fetch end offsets: {e}")
+                if consumer is not None:
+                    consumer.close()
+                    consumer = None
+                continue
+            try:
+                self.on_sample(self.sample(end_offsets))
+            except Exception:
+                logging.exception("❌ Lag tracker failed to export a sample")
+        if consumer is not None:
+            consumer.close()
@@ -0,0 +1,184 @@
+# offset_ledger.py - Les Caves d'Albert
+# Exactly-once ingestion: Kafka offset ranges recorded in Snowflake in the same transaction as the rows
+
+import time
+import logging
+import threading
+from kafka import ConsumerRebalanceListener
+from kafka.structs import TopicPartition
+from sqlalchemy import text, bindparam
+
+LEDGER_TABLE = "KAFKA_OFFSET_LEDGER"
+
+
+class OffsetLedger:
+    """
+    Per-partition offset ranges of every batch loaded into Snowflake.
+
+    record() runs on the batch's own connection, inside the transaction that
+    loads the rows, so a range is in the ledger if and only if its rows are in
+    RAW_EVENTS_STREAM. After a crash between the Snowflake commit and the Kafka
+    commit, the ranges found in the ledger tell the consumer where to resume
+    (contiguous ranges) and which re-delivered offsets to skip (ranges written
+    out of order by the pipelined writers). Skipping is an in-memory range
+    check: no per-row round trip.
+
+    Only loaded offsets are recorded: a record sent to the DLQ leaves a gap, so
+    if its DLQ send was never acknowledged before a crash, it is read (and
+    published) again. Rows below the Kafka-committed offsets are pruned by
+    record() every `prune_interval_seconds`, in the load transaction.
+    """
+
+    def __init__(self, schema, topic, group_id, table=LEDGER_TABLE, prune_interval_seconds=300):
+        self.schema = schema
+        self.topic = topic
+        self.group_id = group_id
+        self.table = f"{schema}.{table}"
+        self.prune_interval_seconds = prune_interval_seconds
+        self._skip = {}  # TopicPartition -> sorted [(first, last)] already loaded, ahead of the position
+        self._lock = threading.Lock()
+        self._committed = {}  # partition -> Kafka-committed offset not pruned yet
+        self._pruned_at = time.monotonic()
+
+    def setup(self, conn):
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {self.table} (
+                CONSUMER_GROUP VARCHAR(255) NOT NULL,
+                TOPIC VARCHAR(255) NOT NULL,
+                PARTITION_ID INTEGER NOT NULL,
+                FIRST_OFFSET BIGINT NOT NULL,
+                LAST_OFFSET BIGINT NOT NULL,
+                ROW_COUNT INTEGER,
+                LOADED_AT TIMESTAMP_LTZ DEFAULT CURRENT_TIMESTAMP()
+            );
+        """))
+
+    def record(self, conn, loaded_ranges, row_count):
+        """
+        Inserts the batch's {TopicPartition: [(first, last)]} loaded ranges (one statement,
+        caller's transaction), and prunes the rows below the committed offsets when due.
+        """
+        if loaded_ranges:
+            conn.execute(text(f"""
+                INSERT INTO {self.table} (CONSUMER_GROUP, TOPIC, PARTITION_ID, FIRST_OFFSET, LAST_OFFSET, ROW_COUNT)
+                VALUES (:group_id, :topic, :partition, :first_offset, :last_offset, :row_count)
+            """), [
+                {"group_id": self.group_id, "topic": tp.topic, "partition": tp.partition,
+                 "first_offset": first, "last_offset": last, "row_count": row_count}
+                for tp, ranges in loaded_ranges.items() for first, last in ranges
+            ])
+        with self._lock:
+            due = self._committed and time.monotonic() - self._pruned_at >= self.prune_interval_seconds
+            if due:
+                # Best effort: if this transaction rolls back, the next commits are pruned later
+                committed, self._committed = self._committed, {}
+                self._pruned_at = time.monotonic()
+        if due:
+            self._prune(conn, committed)
+
+    def committed(self, offsets):
+        """Notes {TopicPartition: next offset} committed to Kafka (consumer thread), to be pruned by record()."""
+        with self._lock:
+            for tp, offset in offsets.items():
+                if tp.topic == self.topic:
+                    self._committed[tp.partition] = max(self._committed.get(tp.partition, 0), offset)
+
+    def _prune(self, conn, committed):
+        """Deletes the ranges entirely below the committed offsets ({partition: offset}): never needed again."""
+        conn.execute(text(f"""
+            DELETE FROM {self.table}
+            WHERE CONSUMER_GROUP = :group_id AND TOPIC = :topic
+              AND PARTITION_ID = :partition AND LAST_OFFSET < :committed
+        """), [
+            {"group_id": self.group_id, "topic": self.topic, "partition": partition, "committed": offset}
+            for partition, offset in committed.items()
+        ])
+
+    def resume(self, conn, committed):
+        """
+        Computes where to resume each partition from its Kafka-committed offset
+        ({TopicPartition: next offset}) and the ledger. Returns {TopicPartition: position}
+        and keeps the non-contiguous ranges beyond it to be skipped.
+        """
+        if not committed:
+            return {}
+        rows = conn.execute(text(f"""
+            SELECT PARTITION_ID, FIRST_OFFSET, LAST_OFFSET
+            FROM {self.table}
+            WHERE CONSUMER_GROUP = :group_id AND TOPIC = :topic AND PARTITION_ID IN :partitions
+            ORDER BY PARTITION_ID, FIRST_OFFSET
+        """).bindparams(bindparam("partitions", expanding=True)), {
+            "group_id": self.group_id, "topic": self.topic,
+            "partitions": sorted(tp.partition for tp in committed),
+        }).fetchall()
+
+        ranges = {}
+        for partition, first, last in rows:
+            ranges.setdefault(TopicPartition(self.topic, partition), []).append((first, last))
+
+        positions = {}
+        for tp, position in committed.items():
+            ahead = []
+            for first, last in ranges.get(tp, []):
+                if last < position:
+                    continue
+                if first <= position:
+                    position = last + 1  # contiguous with what is already loaded
+                else:
+                    ahead.append((first, last))
+            positions[tp] = position
+            if ahead:
+                self._skip[tp] = ahead
+            else:
+                self._skip.pop(tp, None)
+
+        self._prune(conn, {tp.partition: offset for tp, offset in committed.items()})
+        return positions
+
+    def forget(self, partitions):
+        for tp in partitions:
+            self._skip.pop(tp, None)
+
+    def is_loaded(self, tp, offset):
+        """True if `offset` belongs to a range already loaded into Snowflake (re-delivery to skip)."""
+        ranges = self._skip.get(tp)
+        if not ranges:
+            return False
+        while ranges and ranges[0][1] < offset:
+            ranges.pop(0)
+        if not ranges:
+            del self._skip[tp]
+            return False
+        return ranges[0][0] <= offset
+
+
+class LedgerRebalanceListener(ConsumerRebalanceListener):
+    """Seeks newly assigned partitions to the position derived from the ledger."""
+
+    def __init__(self, consumer, engine, ledger):
+        self.consumer = consumer
+        self.engine = engine
+        self.ledger = ledger
+
+    def on_partitions_revoked(self, revoked):
+        self.ledger.forget(revoked)
+
+    def on_partitions_assigned(self, assigned):
+        if not assigned:
+            return
+        beginning = None
+        committed = {}
+        for tp in assigned:
+            offset = self.consumer.committed(tp)
+            if offset is None:
+                if beginning is None:
+                    beginning = self.consumer.beginning_offsets(list(assigned))
+                offset = beginning[tp]
+            committed[tp] = offset
+        with self.engine.begin() as conn:
+            positions = self.ledger.resume(conn, committed)
+        for tp, position in positions.items():
+            if position != committed[tp]:
+                logging.warning(f"♻️  p{tp.partition}: offsets {committed[tp]}..{position - 1} already in Snowflake "
+                                f"(offset ledger), resuming at {position}")
+            self.consumer.seek(tp, position)
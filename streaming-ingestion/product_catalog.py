@@ -0,0 +1,127 @@
+# product_catalog.py - Les Caves d'Albert
+# Immutable product catalog shared by the streaming producer and the batch data generator
+#
+# Each product is derived deterministically from its product_id, computed once and
+# looked up by id. Export it for the batch notebook with:
+#   python product_catalog.py --output product_catalog.csv
+
+import csv
+import json
+import random
+import argparse
+from datetime import datetime
+from typing import NamedTuple
+
+PRODUCT_IDS = range(1000, 1050)
+
+# Realistic wine data - Les Caves d'Albert 🍷
+WINE_CATEGORIES = [
+    ("🍷 Rouge", ["Merlot", "Cabernet Sauvignon", "Pinot Noir", "Syrah", "Malbec"]),
+    ("🥂 Blanc", ["Chardonnay", "Sauvignon Blanc", "Riesling", "Viognier"]),
+    ("🌸 Rosé", ["Grenache Rosé", "Syrah Rosé", "Cinsault Rosé"]),
+    ("🍾 Effervescent", ["Champagne", "Crémant", "Prosecco"]),
+    ("🥃 Spiritueux", ["Whisky", "Rhum", "Cognac", "Armagnac"]),
+]
+
+ADJECTIVES = ["Réserve", "Tradition", "Sélection", "Grande Cuvée", "Prestige", "Vieilles Vignes", "Édition Limitée"]
+
+# Base price per category (€)
+CATEGORY_BASE_PRICES = {"Rouge": 18, "Blanc": 15, "Rosé": 12, "Effervescent": 30, "Spiritueux": 45}
+
+
+class Product(NamedTuple):
+    product_id: int
+    name: str
+    category: str        # e.g. "Rouge" (batch tables)
+    category_label: str  # e.g. "🍷 Rouge" (streaming events)
+    grape: str
+    vintage: int
+    unit_price: float
+
+
+class ProductCatalog:
+    """Read-only product table indexed by product_id."""
+
+    __slots__ = ("_products", "_first_id")
+
+    def __init__(self, products):
+        self._products = tuple(products)
+        self._first_id = self._products[0].product_id
+        if any(p.product_id != self._first_id + i for i, p in enumerate(self._products)):
+            raise ValueError("Catalog product ids must be contiguous")
+
+    def __getitem__(self, product_id):
+        index = product_id - self._first_id
+        if index < 0:
+            raise KeyError(product_id)
+        try:
+            return self._products[index]
+        except IndexError:
+            raise KeyError(product_id) from None
+
+    def __contains__(self, product_id):
+        return 0 <= product_id - self._first_id < len(self._products)
+
+    def __iter__(self):
+        return iter(self._products)
+
+    def __len__(self):
+        return len(self._products)
+
+    @property
+    def product_ids(self):
+        return [p.product_id for p in self._products]
+
+    def to_records(self):
+        return [p._asdict() for p in self._products]
+
+    def export(self, path):
+        """Writes the catalog as CSV or JSON (by extension)."""
+        if path.endswith(".json"):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(self.to_records(), f, ensure_ascii=False, indent=2)
+        else:
+            with open(path, "w", encoding="utf-8", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=Product._fields)
+                writer.writeheader()
+                writer.writerows(self.to_records())
+
+
+def build_product(product_id, reference_year):
+    """Derives one product from its id (same seeds as the original per-event generators)."""
+    rng_product = random.Random(product_id)
+    category_label, grape_list = rng_product.choice(WINE_CATEGORIES)
+    grape = rng_product.choice(grape_list)
+    adj = rng_product.choice(ADJECTIVES)
+    vintage = rng_product.randint(reference_year - 15, reference_year)
+
+    category = category_label.split(" ", 1)[1]
+    base = CATEGORY_BASE_PRICES[category]
+    unit_price = round(random.Random(product_id + 1000).uniform(base * 0.7, base * 2), 2)
+
+    return Product(
+        product_id=product_id,
+        name=f"{grape} {vintage} – {adj}",
+        category=category,
+        category_label=category_label,
+        grape=grape,
+        vintage=vintage,
+        unit_price=unit_price,
+    )
+
+
+def build_catalog(product_ids=PRODUCT_IDS, reference_year=None):
+    """Computes the whole catalog once. `reference_year` defaults to the current year."""
+    reference_year = reference_year or datetime.now().year
+    return ProductCatalog(build_product(pid, reference_year) for pid in product_ids)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the Les Caves d'Albert product catalog")
+    parser.add_argument("--output", default="product_catalog.csv", help="Destination .csv or .json file")
+    parser.add_argument("--reference-year", type=int, default=None, help="Year used for vintages (default: now)")
+    args = parser.parse_args()
+
+    catalog = build_catalog(reference_year=args.reference_year)
+    catalog.export(args.output)
+    print(f"🍷 Exported {len(catalog)} products to {args.output}")
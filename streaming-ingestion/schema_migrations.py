@@ -0,0 +1,62 @@
+# schema_migrations.py - Les Caves d'Albert
+# Versioned schema evolution of RAW_EVENTS_STREAM, applied by the consumer at start-up
+
+import logging
+from sqlalchemy import text
+from snowflake_loaders import RAW_TABLE_NAME
+
+MIGRATIONS_TABLE = "SCHEMA_MIGRATIONS"
+
+# (version, description, statements). Every statement is idempotent on its own: several
+# consumers may start at once, and Snowflake DDL commits immediately, so a migration
+# interrupted half-way is simply replayed at the next start-up.
+MIGRATIONS = (
+    (1, "typed hot columns (EVENT_TS, EVENT_ID, QUANTITY, TOTAL_PRICE, QUANTITY_CHANGE)", [
+        "ALTER TABLE {table} ADD COLUMN IF NOT EXISTS EVENT_TS TIMESTAMP_NTZ",        # event_ts, UTC
+        "ALTER TABLE {table} ADD COLUMN IF NOT EXISTS EVENT_ID VARCHAR",              # order_line_id / event_id
+        "ALTER TABLE {table} ADD COLUMN IF NOT EXISTS QUANTITY INTEGER",              # ORDER_CREATED
+        "ALTER TABLE {table} ADD COLUMN IF NOT EXISTS TOTAL_PRICE NUMBER(10,2)",      # ORDER_CREATED
+        "ALTER TABLE {table} ADD COLUMN IF NOT EXISTS QUANTITY_CHANGE INTEGER",       # INVENTORY_ADJUSTED
+    ]),
+    (2, "backfill typed columns of rows loaded before version 1", [
+        """
+        UPDATE {table} SET
+            EVENT_TS = TRY_TO_TIMESTAMP_NTZ(EVENT_CONTENT:event_ts::VARCHAR),
+            EVENT_ID = COALESCE(EVENT_CONTENT:order_line_id::VARCHAR, EVENT_CONTENT:event_id::VARCHAR),
+            QUANTITY = TRY_CAST(EVENT_CONTENT:quantity::VARCHAR AS INTEGER),
+            TOTAL_PRICE = TRY_CAST(EVENT_CONTENT:total_price::VARCHAR AS NUMBER(10,2)),
+            QUANTITY_CHANGE = TRY_CAST(EVENT_CONTENT:quantity_change::VARCHAR AS INTEGER)
+        WHERE EVENT_TS IS NULL AND EVENT_ID IS NULL
+        """,
+    ]),
+    (3, "clustering key on event date and type", [
+        "ALTER TABLE {table} CLUSTER BY (TO_DATE(EVENT_TS), EVENT_TYPE)",
+    ]),
+)
+
+
+def apply_migrations(conn, schema):
+    """
+    Applies the migrations not yet recorded in SCHEMA_MIGRATIONS, in version order.
+    Returns the versions applied by this call.
+    """
+    table = f"{schema}.{RAW_TABLE_NAME}"
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {schema}.{MIGRATIONS_TABLE} (
+            VERSION INTEGER NOT NULL,
+            DESCRIPTION VARCHAR(255),
+            APPLIED_AT TIMESTAMP_LTZ DEFAULT CURRENT_TIMESTAMP()
+        );
+    """))
+    applied = {row[0] for row in conn.execute(text(f"SELECT VERSION FROM {schema}.{MIGRATIONS_TABLE}"))}
+    newly_applied = []
+    for version, description, statements in MIGRATIONS:
+        if version in applied:
+            continue
+        logging.info(f"🧱 Schema migration {version}: {description}")
+        for statement in statements:
+            conn.execute(text(statement.format(table=table)))
+        conn.execute(text(f"INSERT INTO {schema}.{MIGRATIONS_TABLE} (VERSION, DESCRIPTION) VALUES (:version, :description)"),
+                     {"version": version, "description": description})
+        newly_applied.append(version)
+    return newly_applied
@@ -0,0 +1,168 @@
+# snowflake_loaders.py - Les Caves d'Albert
+# Pluggable loader backends used by the Kafka consumer to land batches in RAW_EVENTS_STREAM
+
+import os
+import gzip
+import uuid
+import logging
+import tempfile
+from sqlalchemy import text
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet staging is optional, NDJSON works without pyarrow
+    pa = None
+    pq = None
+
+RAW_TABLE_NAME = "RAW_EVENTS_STREAM"
+
+# Columns loaded into RAW_EVENTS_STREAM by every backend (INGESTION_TIME uses its default).
+# The typed hot columns are added by schema_migrations.py.
+RAW_COLUMNS = ("EVENT_TYPE, PRODUCT_ID, CUSTOMER_ID, EVENT_TS, EVENT_ID, QUANTITY, TOTAL_PRICE, QUANTITY_CHANGE, "
+               "EVENT_METADATA, EVENT_CONTENT")
+
+
+def raw_select_list(content, metadata):
+    """
+    SELECT list matching RAW_COLUMNS: hot columns typed at ingest out of the `content` VARIANT expression.
+    Every cast is a TRY_ cast: a malformed value lands as NULL (the raw payload stays in EVENT_CONTENT)
+    instead of failing the whole chunk or COPY file.
+    """
+    return f"""
+                SUBSTR({content}:event_type::VARCHAR, 1, 50),
+                TRY_CAST({content}:product_id::VARCHAR AS INTEGER),
+                TRY_CAST({content}:customer_id::VARCHAR AS INTEGER),
+                TRY_TO_TIMESTAMP_NTZ({content}:event_ts::VARCHAR),
+                COALESCE({content}:order_line_id::VARCHAR, {content}:event_id::VARCHAR),
+                TRY_CAST({content}:quantity::VARCHAR AS INTEGER),
+                TRY_CAST({content}:total_price::VARCHAR AS NUMBER(10,2)),
+                TRY_CAST({content}:quantity_change::VARCHAR AS INTEGER),
+                {metadata},
+                {content}"""
+
+
+class InsertLoader:
+    """
+    Fallback backend without any staging table: one INSERT ... SELECT PARSE_JSON(...)
+    FROM VALUES statement per chunk, the JSON documents travelling as bind parameters.
+    Everything runs on the caller's connection and transaction, so concurrent consumers
+    never share (or truncate) each other's rows.
+    """
+
+    name = "insert"
+
+    def __init__(self, schema, chunk_size=1000):
+        self.schema = schema
+        self.chunk_size = chunk_size
+
+    def insert_sql(self, rows):
+        """INSERT statement for `rows` (metadata, content) pairs bound as :m<i>, :c<i>."""
+        values = ", ".join(f"(:m{i}, :c{i})" for i in range(rows))
+        return text(f"""
+            INSERT INTO {self.schema}.{RAW_TABLE_NAME} ({RAW_COLUMNS})
+            SELECT {raw_select_list("CONTENT", "METADATA")}
+            FROM (
+                SELECT PARSE_JSON(column1) AS METADATA, PARSE_JSON(column2) AS CONTENT
+                FROM (VALUES {values})
+            );
+        """)
+
+    def load(self, conn, metadata_json, content_json):
+        """Loads pre-serialized JSON documents (one metadata + one content string per event)."""
+        for start in range(0, len(content_json), self.chunk_size):
+            metadata_chunk = metadata_json[start:start + self.chunk_size]
+            content_chunk = content_json[start:start + self.chunk_size]
+            params = {}
+            for i, (metadata, content) in enumerate(zip(metadata_chunk, content_chunk)):
+                params[f"m{i}"] = metadata
+                params[f"c{i}"] = content
+            conn.execute(self.insert_sql(len(content_chunk)), params)
+        logging.info(f"  ✅ Inserted {len(content_json)} rows directly as VARIANT")
+
+
+class CopyIntoLoader:
+    """
+    Bulk backend: writes the batch to a compressed NDJSON (or Parquet) file, uploads it
+    to the table stage with PUT and loads it with a single COPY INTO straight into the
+    VARIANT column. No staging table, no literal INSERT statements.
+    """
+
+    name = "copy"
+
+    def __init__(self, schema, file_format="ndjson", stage_path="consumer", tmp_dir=None):
+        if file_format not in ("ndjson", "parquet"):
+            raise ValueError(f"Unsupported file format for COPY INTO: {file_format}")
+        if file_format == "parquet" and pa is None:
+            raise RuntimeError("pyarrow is required for the Parquet COPY INTO backend")
+        self.schema = schema
+        self.file_format = file_format
+        self.stage = f"@{schema}.%{RAW_TABLE_NAME}/{stage_path}"
+        self.tmp_dir = tmp_dir or tempfile.gettempdir()
+
+    def write_file(self, metadata_json, content_json):
+        """Serializes the batch into a local file ready for PUT. Returns its path."""
+        if self.file_format == "ndjson":
+            path = os.path.join(self.tmp_dir, f"raw_events_{uuid.uuid4().hex}.ndjson.gz")
+            # Documents are already JSON, so each line is assembled without re-serializing
+            payload = "".join(
+                '{"EVENT_METADATA":' + m + ',"EVENT_CONTENT":' + c + '}\n'
+                for m, c in zip(metadata_json, content_json)
+            )
+            with gzip.open(path, "wb", compresslevel=1) as f:
+                f.write(payload.encode("utf-8"))
+        else:
+            path = os.path.join(self.tmp_dir, f"raw_events_{uuid.uuid4().hex}.parquet")
+            table = pa.table({
+                "EVENT_METADATA": pa.array(metadata_json, type=pa.string()),
+                "EVENT_CONTENT": pa.array(content_json, type=pa.string())
+            })
+            pq.write_table(table, path, compression="snappy")
+        return path
+
+    def copy_sql(self, file_name):
+        """COPY INTO statement projecting the hot columns out of the staged file."""
+        if self.file_format == "ndjson":
+            content = "$1:EVENT_CONTENT"
+            metadata = "$1:EVENT_METADATA"
+            file_format = "TYPE = JSON COMPRESSION = GZIP"
+        else:
+            content = "PARSE_JSON($1:EVENT_CONTENT)"
+            metadata = "PARSE_JSON($1:EVENT_METADATA)"
+            file_format = "TYPE = PARQUET"
+        return text(f"""
+            COPY INTO {self.schema}.{RAW_TABLE_NAME} ({RAW_COLUMNS})
+            FROM (
+                SELECT {raw_select_list(content, metadata)}
+                FROM {self.stage}
+            )
+            FILES = ('{file_name}')
+            FILE_FORMAT = ({file_format})
+            ON_ERROR = ABORT_STATEMENT
+            PURGE = TRUE;
+        """)
+
+    def load(self, conn, metadata_json, content_json):
+        """Loads pre-serialized JSON documents with PUT + COPY INTO."""
+        path = self.write_file(metadata_json, content_json)
+        file_name = os.path.basename(path)
+        try:
+            put_uri = "file://" + path.replace("\\", "/")
+            conn.execute(text(
+                f"PUT '{put_uri}' {self.stage} AUTO_COMPRESS = FALSE OVERWRITE = TRUE;"
+            ))
+            conn.execute(self.copy_sql(file_name))
+            logging.info(f"  ✅ Copied {len(content_json)} rows from {self.file_format} file {file_name}")
+        finally:
+            os.remove(path)
+
+
+def make_loader(backend, schema, file_format="ndjson"):
+    """Builds the loader selected by configuration ('copy' or 'insert')."""
+    if backend == "copy":
+        return CopyIntoLoader(schema, file_format=file_format)
+    if backend in ("insert", "to_sql"):
+        if backend == "to_sql":
+            logging.warning("⚠️  LOADER_BACKEND=to_sql is deprecated (no more staging table), using 'insert'")
+        return InsertLoader(schema)
+    raise ValueError(f"Unknown loader backend: {backend}")
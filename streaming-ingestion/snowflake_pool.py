@@ -0,0 +1,85 @@
+# snowflake_pool.py - Les Caves d'Albert
+# Snowflake engine with an explicit connection pool, session keep-alive and start-up warm-up
+
+import time
+import logging
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import DBAPIError, DisconnectionError, InterfaceError, OperationalError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool reporting how long each checkout waited (idle connection, new connection or queue)."""
+
+    def __init__(self, creator, observe_checkout=None, **kw):
+        super().__init__(creator, **kw)
+        self.observe_checkout = observe_checkout
+
+    def recreate(self):
+        # Keep the observer when the pool is rebuilt (engine.dispose(), invalidation)
+        pool = super().recreate()
+        pool.observe_checkout = self.observe_checkout
+        return pool
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            if self.observe_checkout is not None:
+                self.observe_checkout(time.perf_counter() - start)
+
+
+def is_transient_error(error):
+    """
+    True for connection-level failures (network, outage, expired session, pool timeout)
+    that a retry can fix. Data and SQL errors (ProgrammingError, DataError, ...) fail the
+    same way on every attempt and are not transient.
+    """
+    if isinstance(error, DBAPIError) and error.connection_invalidated:
+        return True
+    return isinstance(error, (OperationalError, InterfaceError, DisconnectionError, PoolTimeoutError, OSError))
+
+
+def create_snowflake_engine(url, pool_size=4, max_overflow=2, pool_recycle=3600, pool_pre_ping=True,
+                            keep_alive=True, observe_checkout=None):
+    """
+    Builds the consumer's engine. `keep_alive` sets client_session_keep_alive so idle
+    pooled sessions are not expired by Snowflake (no re-authentication after a quiet period);
+    `pool_recycle` still replaces connections older than the given number of seconds.
+    """
+    return create_engine(
+        url,
+        poolclass=TimedQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_recycle=pool_recycle,
+        pool_pre_ping=pool_pre_ping,
+        connect_args={"client_session_keep_alive": keep_alive},
+        observe_checkout=observe_checkout,
+    )
+
+
+def warm_up(engine, connections, warehouse=None):
+    """
+    Opens `connections` sessions up front (authentication paid at start-up, not on the
+    first batch) and runs a cheap query on each. With `warehouse`, also resumes it if
+    suspended so the first load does not wait for it.
+    """
+    start = time.time()
+    opened = []
+    try:
+        for _ in range(connections):
+            conn = engine.connect()
+            opened.append(conn)
+            conn.execute(text("SELECT CURRENT_SESSION();"))
+        if warehouse and opened:
+            try:
+                opened[0].execute(text(f"ALTER WAREHOUSE IF EXISTS {warehouse} RESUME IF SUSPENDED;"))
+            except Exception as e:  # missing OPERATE privilege: the first load resumes it instead
+                logging.warning(f"⚠️  Could not resume warehouse {warehouse} during warm-up: {e}")
+    finally:
+        for conn in opened:
+            conn.close()  # back to the pool, session kept open
+    logging.info(f"🔥 Snowflake pool warmed up: {len(opened)} session(s) in {time.time() - start:.2f}s")
@@ -0,0 +1,189 @@
+# task_trigger.py - Les Caves d'Albert
+# Event-driven runs of the RAW → STAGING → PRODUCTION task graph, triggered from the consumer
+
+import time
+import logging
+import threading
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+
+class TaskGraphTrigger:
+    """
+    Runs the task graph (EXECUTE TASK on its root) once enough freshly loaded rows
+    are waiting: `min_rows` rows, or the oldest one waiting for `max_age_seconds`.
+
+    The consumer only calls notify_loaded() after each committed load; a
+    background thread with its own connection does the rest. Loads notified
+    while a graph run is in flight (started here, by another worker or by the
+    root task's schedule) are coalesced into the next run. Once a run started
+    here completes, its per-task timings are read from TASK_HISTORY and handed
+    to `on_stage`; the thread only queries Snowflake while a run is in flight.
+    """
+
+    def __init__(self, engine, root_task, min_rows=1000, max_age_seconds=20.0, poll_interval_seconds=2.0,
+                 run_timeout_seconds=600.0, on_trigger=None, on_coalesced=None, on_graph=None, on_stage=None):
+        self.engine = engine
+        self.root_task = root_task
+        self.min_rows = min_rows
+        self.max_age_seconds = max_age_seconds
+        self.poll_interval_seconds = poll_interval_seconds
+        self.run_timeout_seconds = run_timeout_seconds
+        self.on_trigger = on_trigger      # callable(reason, rows): 'rows' or 'age'
+        self.on_coalesced = on_coalesced  # callable(rows) for a load notified while a run is in flight
+        self.on_graph = on_graph          # callable(state, duration_seconds, freshness_seconds)
+        self.on_stage = on_stage          # callable(task_name, state, queued_seconds, run_seconds)
+        self._cond = threading.Condition()
+        self._rows = 0               # rows loaded since the last trigger
+        self._first_loaded_at = None  # time of the oldest of those loads
+        self._in_flight = False
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="task-trigger", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        with self._cond:
+            self._cond.notify_all()
+        self._thread.join(timeout=timeout)
+
+    # --- consumer-side API (any thread) ---
+
+    def notify_loaded(self, rows):
+        """Records `rows` committed to RAW_EVENTS_STREAM."""
+        if rows <= 0:
+            return
+        with self._cond:
+            if self._first_loaded_at is None:
+                self._first_loaded_at = time.time()
+            self._rows += rows
+            in_flight = self._in_flight
+            self._cond.notify_all()
+        if in_flight and self.on_coalesced is not None:
+            self.on_coalesced(rows)
+
+    def pending_rows(self):
+        with self._cond:
+            return self._rows
+
+    # --- background thread ---
+
+    def _due(self, now):
+        """Trigger reason ('rows' / 'age') if the thresholds are crossed, else None."""
+        if self._rows >= self.min_rows:
+            return "rows"
+        if self._first_loaded_at is not None and now - self._first_loaded_at >= self.max_age_seconds:
+            return "age"
+        return None
+
+    def _wait_until_due(self):
+        """Blocks until a trigger is due. Returns (reason, rows, first loaded at), or None when stopping."""
+        with self._cond:
+            while not self._stopping.is_set():
+                now = time.time()
+                reason = self._due(now)
+                if reason is not None:
+                    return reason, self._rows, self._first_loaded_at
+                timeout = None
+                if self._first_loaded_at is not None:
+                    timeout = self._first_loaded_at + self.max_age_seconds - now
+                self._cond.wait(timeout=timeout)
+        return None
+
+    def _running_graphs(self, conn):
+        return conn.execute(text("""
+            SELECT COUNT(*)
+            FROM TABLE(INFORMATION_SCHEMA.CURRENT_TASK_GRAPHS(ROOT_TASK_NAME => :root))
+        """), {"root": self.root_task}).scalar()
+
+    def _completed_graph(self, conn, since):
+        """First graph run of the root scheduled at or after `since` (server time) that has completed."""
+        return conn.execute(text("""
+            SELECT GRAPH_RUN_GROUP_ID, STATE, SCHEDULED_TIME, COMPLETED_TIME
+            FROM TABLE(INFORMATION_SCHEMA.COMPLETE_TASK_GRAPHS(ROOT_TASK_NAME => :root))
+            WHERE SCHEDULED_TIME >= :since
+            ORDER BY SCHEDULED_TIME
+            LIMIT 1
+        """), {"root": self.root_task, "since": since}).fetchone()
+
+    def _export_stages(self, conn, graph_run_group_id):
+        rows = conn.execute(text("""
+            SELECT NAME, STATE,
+                   DATEDIFF('millisecond', SCHEDULED_TIME, QUERY_START_TIME) / 1000 AS QUEUED_SECONDS,
+                   DATEDIFF('millisecond', QUERY_START_TIME, COMPLETED_TIME) / 1000 AS RUN_SECONDS
+            FROM TABLE(INFORMATION_SCHEMA.TASK_HISTORY(
+                SCHEDULED_TIME_RANGE_START => DATEADD('hour', -1, CURRENT_TIMESTAMP())
+            ))
+            WHERE GRAPH_RUN_GROUP_ID = :graph_run_group_id
+              AND QUERY_START_TIME IS NOT NULL
+        """), {"graph_run_group_id": graph_run_group_id}).fetchall()
+        for name, state, queued_seconds, run_seconds in rows:
+            logging.info(f"  ⏱️  {name}: {state} in {run_seconds or 0:.1f}s (queued {queued_seconds or 0:.1f}s)")
+            if self.on_stage is not None:
+                self.on_stage(name, state, float(queued_seconds or 0), float(run_seconds or 0))
+
+    def _wait_while_running(self, conn, since=None):
+        """
+        Polls until the graph is idle. With `since`, waits for the run scheduled at or after it
+        to complete and returns its (GRAPH_RUN_GROUP_ID, STATE, SCHEDULED_TIME, COMPLETED_TIME).
+        """
+        deadline = time.time() + self.run_timeout_seconds
+        while not self._stopping.wait(self.poll_interval_seconds):
+            if since is not None:
+                completed = self._completed_graph(conn, since)
+                if completed is not None:
+                    return completed
+            elif not self._running_graphs(conn):
+                return None
+            if time.time() >= deadline:
+                logging.warning(f"⚠️  Task graph {self.root_task} still running after {self.run_timeout_seconds:.0f}s")
+                return None
+        return None
+
+    def _set_in_flight(self, in_flight):
+        with self._cond:
+            self._in_flight = in_flight
+
+    def _run(self):
+        while not self._stopping.is_set():
+            due = self._wait_until_due()
+            if due is None:
+                return
+            reason, rows, first_loaded_at = due
+            try:
+                with self.engine.connect() as conn:
+                    self._set_in_flight(True)
+                    if self._running_graphs(conn):
+                        # Another worker (or the schedule) is running it: ours go in the next run
+                        logging.info(f"⏳ Task graph {self.root_task} already running, coalescing {rows} row(s)")
+                        self._wait_while_running(conn)
+                        continue
+                    since = conn.execute(text("SELECT CURRENT_TIMESTAMP()")).scalar()
+                    conn.execute(text(f"EXECUTE TASK {self.root_task}"))
+                    with self._cond:
+                        # Loads notified from now on are not covered by this run
+                        self._rows = max(self._rows - rows, 0)
+                        self._first_loaded_at = time.time() if self._rows else None
+                    logging.info(f"🚀 Task graph {self.root_task} triggered ({reason}: {rows} row(s) waiting)")
+                    if self.on_trigger is not None:
+                        self.on_trigger(reason, rows)
+                    completed = self._wait_while_running(conn, since)
+                    if completed is None:
+                        continue
+                    graph_run_group_id, state, scheduled_time, completed_time = completed
+                    duration = (completed_time - scheduled_time).total_seconds()
+                    freshness = time.time() - first_loaded_at
+                    logging.info(f"🏁 Task graph {self.root_task}: {state} in {duration:.1f}s "
+                                 f"({freshness:.1f}s after the oldest load)")
+                    if self.on_graph is not None:
+                        self.on_graph(state, duration, freshness)
+                    self._export_stages(conn, graph_run_group_id)
+            except SQLAlchemyError as e:
+                # The root task's schedule still picks the rows up: retry at the next due check
+                logging.error(f"❌ Task graph trigger failed: {e}")
+                self._stopping.wait(self.poll_interval_seconds)
+            finally:
+                self._set_in_flight(False)
@@ -1,8 +1,13 @@
 # 🍷 Les Caves d'Albert - BI Dashboard Streamlit in Snowflake
 
+import time
 import streamlit as st
 import pandas as pd
 from snowflake.snowpark.context import get_active_session
+from query_cache import QueryCache
+from query_builder import BoundQuery, PERIODS, period_start, canonical_categories
+from dashboard_data import orders_panels_query, rollup_panels_query, movements_query, split_orders_panels
+from live_tail import LiveOrders, LiveMovements
 
 # Page configuration
 st.set_page_config(
@@ -14,6 +19,83 @@ st.set_page_config(
 
 # Get active Snowflake session
 session = get_active_session()
+# Tags every dashboard query (result cache monitoring in analytical-queries.sql)
+session.query_tag = "CAVES_ALBERT_DASHBOARD"
+
+# ============================================
+# QUERY CACHE
+# ============================================
+# Cache lifetime per panel (seconds): static lists for long, KPIs only briefly
+PANEL_TTL_SECONDS = {
+    "categories": 3600,
+    "orders_panels": 60,  # KPIs, top products, categories, daily revenue, top customers
+    "rollup_panels": 60,  # same panels, read from the daily rollup tables
+    "low_stock": 120,
+    "stock_by_category": 120,
+    "recent_movements": 60,
+}
+
+# Tasks whose completed runs change the data shown by the dashboard
+DAG_TASKS = (
+    'TASK_RAW_TO_STAGING_DISTRIBUTOR',
+    'TASK_STAGING_TO_PROD_ORDERS',
+    'TASK_STAGING_TO_PROD_INVENTORY_HISTORY',
+    'TASK_STAGING_TO_PROD_INVENTORY_CURRENT',
+    'TASK_ROLLUP_DAILY_SALES_BY_PRODUCT',
+    'TASK_ROLLUP_DAILY_SALES_BY_CUSTOMER',
+)
+DATA_VERSION_TTL_SECONDS = 30
+
+
+@st.cache_resource
+def get_query_cache():
+    """One cache for every session of the app."""
+    return QueryCache()
+
+
+@st.cache_data(ttl=DATA_VERSION_TTL_SECONDS, show_spinner=False)
+def load_data_version():
+    """Completion time of the last successful run of the task DAG (changes when new data lands)."""
+    return session.sql(f"""
+        SELECT MAX(COMPLETED_TIME)
+        FROM TABLE(INFORMATION_SCHEMA.TASK_HISTORY(
+            SCHEDULED_TIME_RANGE_START => DATEADD('day', -1, CURRENT_TIMESTAMP())
+        ))
+        WHERE STATE = 'SUCCEEDED'
+          AND NAME IN ({', '.join('?' * len(DAG_TASKS))})
+    """, params=list(DAG_TASKS)).collect()[0][0]
+
+
+query_cache = get_query_cache()
+query_cache.set_data_version(load_data_version())
+
+
+def run_query(query):
+    return session.sql(query.sql, params=list(query.params) or None).to_pandas()
+
+
+def cached_query(panel, query, filter_state=()):
+    """Runs a BoundQuery or reuses the result cached for this panel and filter state."""
+    return query_cache.get((panel,) + tuple(filter_state), PANEL_TTL_SECONDS[panel], lambda: run_query(query))
+
+
+# Live mode: refresh intervals offered (seconds)
+LIVE_INTERVALS = [5, 10, 30, 60]
+
+
+def live_tail(key, make, filter_state, refresh=False):
+    """
+    Live-mode state of one panel group, kept in st.session_state: rebuilt (full query) when
+    the filter state changes, on "Refresh Data" or when stale, otherwise advanced by one tick.
+    """
+    entry = st.session_state.get(key)
+    if refresh or entry is None or entry[0] != filter_state or entry[1].is_stale():
+        tail = make()
+        tail.baseline()
+        st.session_state[key] = (filter_state, tail)
+        return tail
+    entry[1].tick()
+    return entry[1]
 
 # ============================================
 # CUSTOM CSS STYLES
@@ -60,25 +142,19 @@ with st.sidebar:
     # Time period
     time_range = st.selectbox(
         "Analysis Period",
-        ["Last 24 hours", "Last 7 days", "Last 30 days", "All time"]
+        list(PERIODS)
     )
     
-    # Period mapping
-    time_mapping = {
-        "Last 24 hours": "DATEADD('day', -1, CURRENT_TIMESTAMP())",
-        "Last 7 days": "DATEADD('day', -7, CURRENT_TIMESTAMP())",
-        "Last 30 days": "DATEADD('day', -30, CURRENT_TIMESTAMP())",
-        "All time": "DATEADD('year', -10, CURRENT_TIMESTAMP())"
-    }
-    time_filter = time_mapping[time_range]
+    # Period start, bound as a parameter and rounded so identical states send identical queries
+    start = period_start(time_range)
     
     # Product category
-    categories = session.sql("""
+    categories = cached_query("categories", BoundQuery("""
         SELECT DISTINCT PRODUCT_CATEGORY 
         FROM PRODUCTION.ORDERS 
         WHERE PRODUCT_CATEGORY IS NOT NULL
         ORDER BY PRODUCT_CATEGORY
-    """).to_pandas()
+    """))
     
     selected_categories = st.multiselect(
         "Product Categories",
@@ -86,33 +162,54 @@ with st.sidebar:
         default=categories['PRODUCT_CATEGORY'].tolist()
     )
     
+    # Rollups: page cost independent of the size of PRODUCTION.ORDERS (whole-day periods).
+    # Opt-in: the rounding shifts the figures away from the exact period shown by default
+    use_rollups = st.checkbox(
+        "⚡ Read sales from daily rollups",
+        value=False,
+        help="Pre-aggregated by the task DAG. Faster, but periods are rounded to whole days."
+    )
+    
     st.markdown("---")
     st.markdown("### 🔄 Refresh")
-    if st.button("🔄 Refresh Data", use_container_width=True):
-        st.rerun()
+    # Live mode: only rows newer than the last seen timestamps are queried at each refresh
+    live_mode = st.checkbox(
+        "🔴 Live mode",
+        value=False,
+        help="Auto-refresh: sales and movements are updated from new orders / adjustments only."
+    )
+    if live_mode:
+        live_interval = st.select_slider("Refresh every (s)", options=LIVE_INTERVALS, value=LIVE_INTERVALS[0])
+    refresh_requested = st.button("🔄 Refresh Data", use_container_width=True)
+    if refresh_requested:
+        query_cache.clear()
 
 # ============================================
 # KEY METRICS (KPIs)
 # ============================================
 st.header("📈 Key Performance Indicators")
 
-# Build category filter
-category_filter = "AND PRODUCT_CATEGORY IN (" + ",".join([f"'{cat}'" for cat in selected_categories]) + ")" if selected_categories else ""
+# Category filter (sorted: any selection order gives the same query) and cache key of every filtered panel
+selected = canonical_categories(selected_categories)
+filter_state = (start, selected)
 
-# KPIs query
-kpi_query = f"""
-SELECT 
-    COUNT(DISTINCT ORDER_ID) AS TOTAL_ORDERS,
-    COUNT(DISTINCT CUSTOMER_ID) AS TOTAL_CUSTOMERS,
-    ROUND(SUM(TOTAL_AMOUNT), 2) AS TOTAL_REVENUE,
-    ROUND(AVG(TOTAL_AMOUNT), 2) AS AVG_ORDER_VALUE,
-    SUM(QUANTITY) AS TOTAL_ITEMS_SOLD
-FROM PRODUCTION.ORDERS
-WHERE ORDER_TIMESTAMP >= {time_filter}
-{category_filter}
-"""
+# One query feeds every sales panel below: live aggregates, daily rollups, or a single scan of PRODUCTION.ORDERS
+if live_mode:
+    # Reads PRODUCTION.ORDERS (rollups lag behind their task); the switch above is ignored
+    live_orders = live_tail(
+        "live_orders", lambda: LiveOrders(run_query, start, selected), filter_state, refresh_requested
+    )
+    orders_panels = split_orders_panels(live_orders.rows())
+elif use_rollups:
+    orders_panels = split_orders_panels(cached_query(
+        "rollup_panels", rollup_panels_query(start, selected), filter_state
+    ))
+else:
+    orders_panels = split_orders_panels(cached_query(
+        "orders_panels", orders_panels_query(start, selected), filter_state
+    ))
 
-kpis = session.sql(kpi_query).to_pandas().iloc[0]
+kpis = orders_panels['kpis']
 
 col1, col2, col3, col4, col5 = st.columns(5)
 
@@ -162,20 +259,7 @@ col1, col2 = st.columns(2)
 
 with col1:
     st.subheader("🍷 Top 10 Best-Selling Wines")
-    top_products = session.sql(f"""
-        SELECT 
-            PRODUCT_NAME,
-            PRODUCT_CATEGORY,
-            COUNT(*) AS ORDER_COUNT,
-            SUM(QUANTITY) AS TOTAL_QUANTITY,
-            ROUND(SUM(TOTAL_AMOUNT), 2) AS TOTAL_REVENUE
-        FROM PRODUCTION.ORDERS
-        WHERE ORDER_TIMESTAMP >= {time_filter}
-        {category_filter}
-        GROUP BY PRODUCT_NAME, PRODUCT_CATEGORY
-        ORDER BY TOTAL_REVENUE DESC
-        LIMIT 10
-    """).to_pandas()
+    top_products = orders_panels['top_products']
     
     if not top_products.empty:
         st.bar_chart(
@@ -195,17 +279,7 @@ with col1:
 
 with col2:
     st.subheader("📊 Sales by Category")
-    category_sales = session.sql(f"""
-        SELECT 
-            PRODUCT_CATEGORY,
-            COUNT(*) AS ORDER_COUNT,
-            ROUND(SUM(TOTAL_AMOUNT), 2) AS TOTAL_REVENUE
-        FROM PRODUCTION.ORDERS
-        WHERE ORDER_TIMESTAMP >= {time_filter}
-        {category_filter}
-        GROUP BY PRODUCT_CATEGORY
-        ORDER BY TOTAL_REVENUE DESC
-    """).to_pandas()
+    category_sales = orders_panels['category_sales']
     
     if not category_sales.empty:
         st.bar_chart(
@@ -233,21 +307,9 @@ col1, col2 = st.columns(2)
 
 with col1:
     st.subheader("📅 Revenue Evolution")
-    daily_sales = session.sql(f"""
-        SELECT 
-            ORDER_DATE,
-            COUNT(*) AS ORDER_COUNT,
-            ROUND(SUM(TOTAL_AMOUNT), 2) AS DAILY_REVENUE
-        FROM PRODUCTION.ORDERS
-        WHERE ORDER_TIMESTAMP >= {time_filter}
-        {category_filter}
-        GROUP BY ORDER_DATE
-        ORDER BY ORDER_DATE DESC
-        LIMIT 30
-    """).to_pandas()
+    daily_sales = orders_panels['daily_sales']
     
     if not daily_sales.empty:
-        daily_sales = daily_sales.sort_values('ORDER_DATE')
         st.line_chart(
             daily_sales.set_index('ORDER_DATE')['DAILY_REVENUE'],
             use_container_width=True
@@ -258,19 +320,7 @@ with col1:
 
 with col2:
     st.subheader("👥 Top 10 Customers (by Revenue)")
-    top_customers = session.sql(f"""
-        SELECT 
-            CUSTOMER_ID,
-            COUNT(*) AS ORDER_COUNT,
-            SUM(QUANTITY) AS TOTAL_ITEMS,
-            ROUND(SUM(TOTAL_AMOUNT), 2) AS TOTAL_SPENT
-        FROM PRODUCTION.ORDERS
-        WHERE ORDER_TIMESTAMP >= {time_filter}
-        {category_filter}
-        GROUP BY CUSTOMER_ID
-        ORDER BY TOTAL_SPENT DESC
-        LIMIT 10
-    """).to_pandas()
+    top_customers = orders_panels['top_customers']
     
     if not top_customers.empty:
         st.dataframe(
@@ -295,7 +345,7 @@ col1, col2 = st.columns(2)
 
 with col1:
     st.subheader("⚠️ Low Stock Alerts (< 50 units)")
-    low_stock = session.sql("""
+    low_stock = cached_query("low_stock", BoundQuery("""
         SELECT 
             PRODUCT_ID,
             PRODUCT_NAME,
@@ -307,10 +357,10 @@ with col1:
         WHERE CURRENT_STOCK_LEVEL < 50
         ORDER BY CURRENT_STOCK_LEVEL ASC
         LIMIT 15
-    """).to_pandas()
+    """))
     
     if not low_stock.empty:
-        st.warning(f"⚠️ {len(low_stock)} products with critical stock!")
+        st.warning(f"⚠️ {len(low_stock)} product/warehouse pairs with critical stock!")
         st.dataframe(
             low_stock.style.format({
                 'CURRENT_STOCK_LEVEL': '{:,.0f}'
@@ -322,16 +372,16 @@ with col1:
 
 with col2:
     st.subheader("📊 Stock Distribution by Category")
-    stock_by_category = session.sql("""
+    stock_by_category = cached_query("stock_by_category", BoundQuery("""
         SELECT 
             PRODUCT_CATEGORY,
             COUNT(DISTINCT PRODUCT_ID) AS PRODUCT_COUNT,
             SUM(CURRENT_STOCK_LEVEL) AS TOTAL_STOCK,
-            ROUND(AVG(CURRENT_STOCK_LEVEL), 0) AS AVG_STOCK
+            ROUND(SUM(CURRENT_STOCK_LEVEL) / COUNT(DISTINCT PRODUCT_ID), 0) AS AVG_STOCK
         FROM PRODUCTION.INVENTORY_CURRENT
         GROUP BY PRODUCT_CATEGORY
         ORDER BY TOTAL_STOCK DESC
-    """).to_pandas()
+    """))
     
     if not stock_by_category.empty:
         st.bar_chart(
@@ -356,20 +406,13 @@ st.markdown("---")
 # ============================================
 st.header("🔄 Recent Inventory Movements")
 
-recent_movements = session.sql(f"""
-    SELECT 
-        ADJUSTMENT_DATE,
-        PRODUCT_NAME,
-        PRODUCT_CATEGORY,
-        ADJUSTMENT_TYPE,
-        QUANTITY_CHANGE,
-        WAREHOUSE_LOCATION,
-        REASON
-    FROM PRODUCTION.INVENTORY_HISTORY
-    WHERE ADJUSTMENT_TIMESTAMP >= {time_filter}
-    ORDER BY ADJUSTMENT_DATE DESC
-    LIMIT 20
-""").to_pandas()
+if live_mode:
+    recent_movements = live_tail(
+        "live_movements", lambda: LiveMovements(run_query, start), (start,), refresh_requested
+    ).movements
+else:
+    recent_movements = cached_query("recent_movements", movements_query(start), (start,))
+recent_movements = recent_movements.drop(columns=['ADJUSTMENT_ID', 'ADJUSTMENT_TIMESTAMP'])
 
 if not recent_movements.empty:
     st.dataframe(
@@ -393,9 +436,28 @@ with col1:
 
 with col2:
     st.caption("⚡ Powered by **Snowflake + Streamlit**")
-    st.caption("Data updated in real-time")
+    st.caption("Data updated in real-time" if not live_mode else
+               f"🔴 Live: +{live_orders.last_tick_rows} order(s) at last refresh")
 
 with col3:
     st.caption(f"📊 Analysis period: **{time_range}**")
     if selected_categories:
         st.caption(f"🏷️ Categories: {len(selected_categories)} selected")
+
+# Query cache indicator (rendered last so it counts this rerun's panels)
+with st.sidebar:
+    st.markdown("---")
+    st.markdown("### ⚡ Query Cache")
+    st.metric(
+        label="Hit rate",
+        value=f"{query_cache.hit_rate():.0%}",
+        delta=f"{query_cache.hits:,} hits / {query_cache.misses:,} misses",
+        delta_color="off"
+    )
+    if query_cache.data_version is not None:
+        st.caption(f"🔁 Last task DAG run: {query_cache.data_version}")
+
+# Live mode: wait, then rerun the script (cached panels are reused, sales and movements get one tick)
+if live_mode:
+    time.sleep(live_interval)
+    st.rerun()
@@ -0,0 +1,260 @@
+# 🍷 Les Caves d'Albert - Data access for the BI dashboard
+
+import pandas as pd
+from query_builder import BoundQuery, where_clause
+
+# GROUPING_ID(PRODUCT_NAME, ORDER_DATE, CUSTOMER_ID): bit set = column aggregated away
+GROUPING_SETS = {
+    3: "product",   # (PRODUCT_NAME, PRODUCT_CATEGORY)
+    5: "day",       # (ORDER_DATE)
+    6: "customer",  # (CUSTOMER_ID)
+    7: "total",     # ()
+}
+TOP_N = 10
+DAILY_DAYS = 30
+
+
+def orders_panels_query(start, categories=()):
+    """
+    One scan of PRODUCTION.ORDERS for the KPI, top products, category, daily revenue
+    and top customers panels. Each grouping set answers one panel (categories are
+    rolled up from the product set locally); QUALIFY keeps only the rows the day and
+    customer panels display, so the result stays small whatever the period.
+    """
+    where, params = where_clause("ORDER_TIMESTAMP", start, categories)
+    return BoundQuery(f"""
+        SELECT
+            CASE GROUPING_ID(PRODUCT_NAME, ORDER_DATE, CUSTOMER_ID)
+                WHEN 3 THEN 'product' WHEN 5 THEN 'day' WHEN 6 THEN 'customer' ELSE 'total'
+            END AS GROUPING_SET,
+            PRODUCT_NAME,
+            PRODUCT_CATEGORY,
+            ORDER_DATE,
+            CUSTOMER_ID,
+            COUNT(*) AS ORDER_COUNT,
+            COUNT(DISTINCT ORDER_ID) AS DISTINCT_ORDERS,
+            COUNT(DISTINCT CUSTOMER_ID) AS DISTINCT_CUSTOMERS,
+            SUM(QUANTITY) AS TOTAL_QUANTITY,
+            SUM(TOTAL_AMOUNT) AS TOTAL_REVENUE,
+            AVG(TOTAL_AMOUNT) AS AVG_ORDER_VALUE
+        FROM PRODUCTION.ORDERS
+        {where}
+        GROUP BY GROUPING SETS (
+            (PRODUCT_NAME, PRODUCT_CATEGORY),
+            (ORDER_DATE),
+            (CUSTOMER_ID),
+            ()
+        )
+        QUALIFY GROUPING_ID(PRODUCT_NAME, ORDER_DATE, CUSTOMER_ID) IN (3, 7)
+            OR (GROUPING_ID(PRODUCT_NAME, ORDER_DATE, CUSTOMER_ID) = 5
+                AND ROW_NUMBER() OVER (
+                    PARTITION BY GROUPING_ID(PRODUCT_NAME, ORDER_DATE, CUSTOMER_ID)
+                    ORDER BY ORDER_DATE DESC) <= {DAILY_DAYS})
+            OR (GROUPING_ID(PRODUCT_NAME, ORDER_DATE, CUSTOMER_ID) = 6
+                AND ROW_NUMBER() OVER (
+                    PARTITION BY GROUPING_ID(PRODUCT_NAME, ORDER_DATE, CUSTOMER_ID)
+                    ORDER BY SUM(TOTAL_AMOUNT) DESC) <= {TOP_N})
+    """, params)
+
+
+def rollup_panels_query(start, categories=()):
+    """
+    Same result shape as orders_panels_query(), read from the daily rollup tables
+    maintained by the task DAG instead of PRODUCTION.ORDERS: its cost follows the
+    number of days × products / customers, not the number of orders. The period is
+    applied on whole days (ORDER_DATE).
+    """
+    product_where, product_params = where_clause(
+        "ORDER_DATE", start, categories, start_as_date=True, conditions=["ORDER_COUNT > 0"])
+    customer_where, customer_params = where_clause("ORDER_DATE", start, categories, start_as_date=True)
+    return BoundQuery(f"""
+        WITH products AS (
+            SELECT * FROM PRODUCTION.DAILY_SALES_BY_PRODUCT
+            {product_where}
+        ),
+        customers AS (
+            SELECT
+                CUSTOMER_ID,
+                SUM(ORDER_COUNT) AS ORDER_COUNT,
+                SUM(TOTAL_QUANTITY) AS TOTAL_QUANTITY,
+                SUM(TOTAL_REVENUE) AS TOTAL_REVENUE
+            FROM PRODUCTION.DAILY_SALES_BY_CUSTOMER
+            {customer_where}
+            GROUP BY CUSTOMER_ID
+            HAVING SUM(ORDER_COUNT) > 0
+        ),
+        customer_count AS (
+            SELECT COUNT(*) AS DISTINCT_CUSTOMERS FROM customers
+        )
+        SELECT
+            CASE GROUPING_ID(PRODUCT_NAME, ORDER_DATE)
+                WHEN 1 THEN 'product' WHEN 2 THEN 'day' ELSE 'total'
+            END AS GROUPING_SET,
+            PRODUCT_NAME,
+            PRODUCT_CATEGORY,
+            ORDER_DATE,
+            NULL AS CUSTOMER_ID,
+            SUM(ORDER_COUNT) AS ORDER_COUNT,
+            SUM(ORDER_COUNT) AS DISTINCT_ORDERS,  -- one ORDERS row per ORDER_ID
+            MAX(DISTINCT_CUSTOMERS) AS DISTINCT_CUSTOMERS,
+            SUM(TOTAL_QUANTITY) AS TOTAL_QUANTITY,
+            SUM(TOTAL_REVENUE) AS TOTAL_REVENUE,
+            SUM(TOTAL_REVENUE) / NULLIF(SUM(ORDER_COUNT), 0) AS AVG_ORDER_VALUE
+        FROM products CROSS JOIN customer_count
+        GROUP BY GROUPING SETS (
+            (PRODUCT_NAME, PRODUCT_CATEGORY),
+            (ORDER_DATE),
+            ()
+        )
+        QUALIFY GROUPING_ID(PRODUCT_NAME, ORDER_DATE) <> 2
+            OR ROW_NUMBER() OVER (
+                PARTITION BY GROUPING_ID(PRODUCT_NAME, ORDER_DATE)
+                ORDER BY ORDER_DATE DESC) <= {DAILY_DAYS}
+        UNION ALL
+        SELECT
+            'customer', NULL, NULL, NULL, CUSTOMER_ID,
+            ORDER_COUNT, ORDER_COUNT, NULL, TOTAL_QUANTITY, TOTAL_REVENUE,
+            TOTAL_REVENUE / ORDER_COUNT
+        FROM customers
+        QUALIFY ROW_NUMBER() OVER (ORDER BY TOTAL_REVENUE DESC) <= {TOP_N}
+    """, product_params + customer_params)
+
+
+def live_orders_baseline_query(start, categories, before):
+    """
+    Starting point of the live mode: per product, day and customer totals of the orders
+    timestamped before `before` (every customer, no top-N cut, so that tail rows can be
+    added to them). `before` is bound as TIMESTAMP_NTZ, like ORDER_TIMESTAMP; None = all orders.
+    """
+    conditions, params = [], ()
+    if before is not None:
+        conditions, params = ["ORDER_TIMESTAMP < ?::TIMESTAMP_NTZ"], (before,)
+    where, filter_params = where_clause("ORDER_TIMESTAMP", start, categories, conditions=conditions)
+    return BoundQuery(f"""
+        SELECT
+            CASE GROUPING_ID(PRODUCT_NAME, ORDER_DATE, CUSTOMER_ID)
+                WHEN 3 THEN 'product' WHEN 5 THEN 'day' ELSE 'customer'
+            END AS GROUPING_SET,
+            PRODUCT_NAME,
+            PRODUCT_CATEGORY,
+            ORDER_DATE,
+            CUSTOMER_ID,
+            COUNT(*) AS ORDER_COUNT,
+            SUM(QUANTITY) AS TOTAL_QUANTITY,
+            SUM(TOTAL_AMOUNT) AS TOTAL_REVENUE
+        FROM PRODUCTION.ORDERS
+        {where}
+        GROUP BY GROUPING SETS (
+            (PRODUCT_NAME, PRODUCT_CATEGORY),
+            (ORDER_DATE),
+            (CUSTOMER_ID)
+        )
+    """, params + filter_params)
+
+
+def live_orders_tail_query(start, categories, since):
+    """Orders timestamped at or after `since` (TIMESTAMP_NTZ): the rows a live tick adds."""
+    where, filter_params = where_clause(
+        "ORDER_TIMESTAMP", start, categories, conditions=["ORDER_TIMESTAMP >= ?::TIMESTAMP_NTZ"])
+    return BoundQuery(f"""
+        SELECT
+            ORDER_ID,
+            ORDER_TIMESTAMP,
+            ORDER_DATE,
+            CUSTOMER_ID,
+            PRODUCT_NAME,
+            PRODUCT_CATEGORY,
+            QUANTITY,
+            TOTAL_AMOUNT
+        FROM PRODUCTION.ORDERS
+        {where}
+    """, (since,) + filter_params)
+
+
+def latest_order_timestamp_query():
+    return BoundQuery("SELECT MAX(ORDER_TIMESTAMP) AS LATEST FROM PRODUCTION.ORDERS")
+
+
+def movements_query(start, since=None, limit=20):
+    """
+    Latest inventory movements of the period, newest first. With `since` (TIMESTAMP_NTZ),
+    only the movements adjusted at or after it (live tick).
+    """
+    conditions, params = [], ()
+    if since is not None:
+        conditions, params = ["ADJUSTMENT_TIMESTAMP >= ?::TIMESTAMP_NTZ"], (since,)
+    where, filter_params = where_clause("ADJUSTMENT_TIMESTAMP", start, (), conditions=conditions)
+    return BoundQuery(f"""
+        SELECT 
+            ADJUSTMENT_ID,
+            ADJUSTMENT_TIMESTAMP,
+            ADJUSTMENT_DATE,
+            PRODUCT_NAME,
+            PRODUCT_CATEGORY,
+            ADJUSTMENT_TYPE,
+            QUANTITY_CHANGE,
+            WAREHOUSE_LOCATION,
+            REASON
+        FROM PRODUCTION.INVENTORY_HISTORY
+        {where}
+        ORDER BY ADJUSTMENT_TIMESTAMP DESC
+        LIMIT {int(limit)}
+    """, params + filter_params)
+
+
+def split_orders_panels(rows):
+    """
+    Derives every ORDERS panel from the orders_panels_query() / rollup_panels_query() result.
+    Returns a dict: kpis (Series), top_products, category_sales, daily_sales, top_customers.
+    """
+    by_set = {name: rows[rows['GROUPING_SET'] == name] for name in GROUPING_SETS.values()}
+
+    total = by_set['total']
+    kpis = pd.Series({
+        'TOTAL_ORDERS': total['DISTINCT_ORDERS'].sum(),
+        'TOTAL_CUSTOMERS': total['DISTINCT_CUSTOMERS'].sum(),
+        'TOTAL_REVENUE': round(float(total['TOTAL_REVENUE'].fillna(0).sum()), 2),
+        'AVG_ORDER_VALUE': round(float(total['AVG_ORDER_VALUE'].fillna(0).sum()), 2),
+        'TOTAL_ITEMS_SOLD': total['TOTAL_QUANTITY'].fillna(0).sum(),
+    })
+
+    products = by_set['product']
+    top_products = (
+        products.nlargest(TOP_N, 'TOTAL_REVENUE')
+        [['PRODUCT_NAME', 'PRODUCT_CATEGORY', 'ORDER_COUNT', 'TOTAL_QUANTITY', 'TOTAL_REVENUE']]
+        .round({'TOTAL_REVENUE': 2})
+        .reset_index(drop=True)
+    )
+
+    # Additive measures: the category panel is a roll-up of the product grouping set
+    category_sales = (
+        products.groupby('PRODUCT_CATEGORY', dropna=False, sort=False)[['ORDER_COUNT', 'TOTAL_REVENUE']]
+        .sum()
+        .sort_values('TOTAL_REVENUE', ascending=False)
+        .round({'TOTAL_REVENUE': 2})
+        .reset_index()
+    )
+
+    daily_sales = (
+        by_set['day'][['ORDER_DATE', 'ORDER_COUNT', 'TOTAL_REVENUE']]
+        .rename(columns={'TOTAL_REVENUE': 'DAILY_REVENUE'})
+        .sort_values('ORDER_DATE')
+        .round({'DAILY_REVENUE': 2})
+        .reset_index(drop=True)
+    )
+
+    top_customers = (
+        by_set['customer'].nlargest(TOP_N, 'TOTAL_REVENUE')
+        [['CUSTOMER_ID', 'ORDER_COUNT', 'TOTAL_QUANTITY', 'TOTAL_REVENUE']]
+        .rename(columns={'TOTAL_QUANTITY': 'TOTAL_ITEMS', 'TOTAL_REVENUE': 'TOTAL_SPENT'})
+        .round({'TOTAL_SPENT': 2})
+        .reset_index(drop=True)
+    )
+
+    return {
+        'kpis': kpis,
+        'top_products': top_products,
+        'category_sales': category_sales,
+        'daily_sales': daily_sales,
+        'top_customers': top_customers,
+    }
@@ -0,0 +1,166 @@
+# 🍷 Les Caves d'Albert - Live-tail mode of the BI dashboard
+
+import time
+import pandas as pd
+from dashboard_data import (DAILY_DAYS, latest_order_timestamp_query, live_orders_baseline_query,
+                            live_orders_tail_query, movements_query)
+
+# Rows reach PRODUCTION.* through the task DAG after their event timestamp: each tick
+# re-reads this much before the high-water mark and skips the IDs it already merged
+LATE_ARRIVAL_SECONDS = 300
+# Full recompute at least this often (picks up updated orders and very late rows)
+REBASELINE_SECONDS = 900
+MEASURES = ('ORDER_COUNT', 'TOTAL_QUANTITY', 'TOTAL_REVENUE')
+
+
+def ntz(timestamp):
+    """Binds a TIMESTAMP_NTZ value read from Snowflake back as a parameter."""
+    return pd.Timestamp(timestamp).isoformat(sep=' ')
+
+
+def _add(totals, key, order_count, quantity, revenue):
+    current = totals.get(key, (0, 0, 0.0))
+    totals[key] = (current[0] + order_count, current[1] + quantity, current[2] + revenue)
+
+
+def _value(value):
+    return 0 if pd.isna(value) else value
+
+
+def _key(value):
+    return None if pd.isna(value) else value
+
+
+class LiveOrders:
+    """
+    Sales aggregates of one filter state, kept in st.session_state between reruns.
+
+    baseline() runs one full aggregate over the orders timestamped before the
+    tail start (the latest ORDER_TIMESTAMP minus LATE_ARRIVAL_SECONDS); each tick()
+    then only reads the orders at or after the high-water mark (minus the same
+    margin) and adds the ones it has not seen yet to the per product / day /
+    customer totals. rows() rebuilds the grouping-set result split_orders_panels()
+    expects, so live and regular modes share the panel code.
+
+    Orders updated after being merged (MATCHED branch of the ORDERS task) or landing
+    more than LATE_ARRIVAL_SECONDS behind the mark are only picked up by the next baseline.
+    """
+
+    def __init__(self, run, start, categories):
+        self.run = run  # callable(BoundQuery) -> DataFrame
+        self.start = start
+        self.categories = categories
+        self.products, self.days, self.customers = {}, {}, {}
+        self.high_water_mark = None
+        self._seen = {}  # ORDER_ID -> ORDER_TIMESTAMP of merged tail rows still inside the margin
+        self.baseline_at = None
+        self.last_tick_rows = 0
+
+    def baseline(self):
+        self.products, self.days, self.customers, self._seen = {}, {}, {}, {}
+        self.baseline_at = time.time()
+        self.last_tick_rows = 0
+        latest = self.run(latest_order_timestamp_query())['LATEST'].iloc[0]
+        if pd.isna(latest):
+            self.high_water_mark = None  # no order yet: tick() retries the baseline
+            return
+        latest = pd.Timestamp(latest)
+        before = latest - pd.Timedelta(seconds=LATE_ARRIVAL_SECONDS)
+        rows = self.run(live_orders_baseline_query(self.start, self.categories, ntz(before)))
+        for row in rows.itertuples(index=False):
+            totals = (_value(row.ORDER_COUNT), _value(row.TOTAL_QUANTITY), float(_value(row.TOTAL_REVENUE)))
+            if row.GROUPING_SET == 'product':
+                self.products[(_key(row.PRODUCT_NAME), _key(row.PRODUCT_CATEGORY))] = totals
+            elif row.GROUPING_SET == 'day':
+                self.days[_key(row.ORDER_DATE)] = totals
+            else:
+                self.customers[_key(row.CUSTOMER_ID)] = totals
+        # The tail (mark minus margin) starts exactly where the baseline stops
+        self.high_water_mark = latest
+        self.tick()
+
+    def tick(self):
+        """Merges the orders that appeared since the last tick. Returns how many were added."""
+        if self.high_water_mark is None:
+            self.baseline()
+            return self.last_tick_rows
+        since = self.high_water_mark - pd.Timedelta(seconds=LATE_ARRIVAL_SECONDS)
+        rows = self.run(live_orders_tail_query(self.start, self.categories, ntz(since)))
+        added = 0
+        for row in rows.itertuples(index=False):
+            if row.ORDER_ID in self._seen:
+                continue
+            timestamp = pd.Timestamp(row.ORDER_TIMESTAMP)
+            self._seen[row.ORDER_ID] = timestamp
+            quantity, revenue = _value(row.QUANTITY), float(_value(row.TOTAL_AMOUNT))
+            _add(self.products, (_key(row.PRODUCT_NAME), _key(row.PRODUCT_CATEGORY)), 1, quantity, revenue)
+            _add(self.days, _key(row.ORDER_DATE), 1, quantity, revenue)
+            _add(self.customers, _key(row.CUSTOMER_ID), 1, quantity, revenue)
+            self.high_water_mark = max(self.high_water_mark, timestamp)
+            added += 1
+        cutoff = self.high_water_mark - pd.Timedelta(seconds=LATE_ARRIVAL_SECONDS)
+        self._seen = {order_id: ts for order_id, ts in self._seen.items() if ts >= cutoff}
+        self.last_tick_rows = added
+        return added
+
+    def is_stale(self):
+        return self.baseline_at is None or time.time() - self.baseline_at >= REBASELINE_SECONDS
+
+    def rows(self):
+        """The aggregates in the orders_panels_query() result shape."""
+        order_count = sum(totals[0] for totals in self.customers.values())
+        quantity = sum(totals[1] for totals in self.customers.values())
+        revenue = sum(totals[2] for totals in self.customers.values())
+        records = [{
+            'GROUPING_SET': 'total', 'ORDER_COUNT': order_count, 'DISTINCT_ORDERS': order_count,
+            'DISTINCT_CUSTOMERS': sum(1 for customer_id, totals in self.customers.items()
+                                      if customer_id is not None and totals[0] > 0),
+            'TOTAL_QUANTITY': quantity, 'TOTAL_REVENUE': revenue,
+            'AVG_ORDER_VALUE': revenue / order_count if order_count else None,
+        }]
+        for (name, category), totals in self.products.items():
+            records.append(dict(zip(MEASURES, totals), GROUPING_SET='product',
+                                PRODUCT_NAME=name, PRODUCT_CATEGORY=category))
+        for day, totals in sorted(self.days.items(), key=lambda item: str(item[0]))[-DAILY_DAYS:]:
+            records.append(dict(zip(MEASURES, totals), GROUPING_SET='day', ORDER_DATE=day))
+        for customer_id, totals in self.customers.items():
+            records.append(dict(zip(MEASURES, totals), GROUPING_SET='customer', CUSTOMER_ID=customer_id))
+        return pd.DataFrame.from_records(records, columns=[
+            'GROUPING_SET', 'PRODUCT_NAME', 'PRODUCT_CATEGORY', 'ORDER_DATE', 'CUSTOMER_ID',
+            'ORDER_COUNT', 'DISTINCT_ORDERS', 'DISTINCT_CUSTOMERS', 'TOTAL_QUANTITY', 'TOTAL_REVENUE',
+            'AVG_ORDER_VALUE'])
+
+
+class LiveMovements:
+    """Latest inventory movements, extended at each tick with the ones adjusted since the high-water mark."""
+
+    def __init__(self, run, start, limit=20):
+        self.run = run
+        self.start = start
+        self.limit = limit
+        self.movements = None
+        self.baseline_at = None
+
+    def baseline(self):
+        self.movements = self.run(movements_query(self.start, limit=self.limit))
+        self.baseline_at = time.time()
+
+    def tick(self):
+        if self.movements.empty:
+            self.baseline()
+            return len(self.movements)
+        high_water_mark = pd.Timestamp(self.movements['ADJUSTMENT_TIMESTAMP'].max())
+        since = high_water_mark - pd.Timedelta(seconds=LATE_ARRIVAL_SECONDS)
+        new = self.run(movements_query(self.start, ntz(since), self.limit))
+        new = new[~new['ADJUSTMENT_ID'].isin(self.movements['ADJUSTMENT_ID'])]
+        if not new.empty:
+            self.movements = (
+                pd.concat([new, self.movements], ignore_index=True)
+                .sort_values('ADJUSTMENT_TIMESTAMP', ascending=False)
+                .head(self.limit)
+                .reset_index(drop=True)
+            )
+        return len(new)
+
+    def is_stale(self):
+        return self.baseline_at is None or time.time() - self.baseline_at >= REBASELINE_SECONDS
@@ -0,0 +1,59 @@
+# 🍷 Les Caves d'Albert - Stable, parameterized SQL for the BI dashboard
+
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple
+
+# Analysis period -> (length, rounding of its start). None = no lower bound.
+PERIODS = {
+    "Last 24 hours": (timedelta(days=1), timedelta(minutes=5)),
+    "Last 7 days": (timedelta(days=7), timedelta(hours=1)),
+    "Last 30 days": (timedelta(days=30), timedelta(hours=1)),
+    "All time": None,
+}
+
+
+class BoundQuery(NamedTuple):
+    """SQL text with qmark placeholders and the values bound to them."""
+    sql: str
+    params: tuple = ()
+
+
+def period_start(time_range, now=None):
+    """
+    Start of the analysis period, rounded down so that every rerun within the same
+    window binds the same value (and can reuse Snowflake's persisted result).
+    Returns an ISO-8601 UTC string, or None for "All time".
+    """
+    period = PERIODS[time_range]
+    if period is None:
+        return None
+    length, rounding = period
+    now = now or datetime.now(timezone.utc)
+    start = now - length
+    epoch = datetime(1970, 1, 1, tzinfo=timezone.utc)
+    start = epoch + (start - epoch) // rounding * rounding
+    return start.isoformat()
+
+
+def canonical_categories(categories):
+    """Sorted, de-duplicated category list: the same selection always yields the same parameters."""
+    return tuple(sorted(set(categories)))
+
+
+def where_clause(timestamp_column, start, categories, start_as_date=False, conditions=()):
+    """
+    Builds "WHERE ..." for the period start and the category filter (plus any fixed
+    `conditions`). Values are bound (no quoting issues); only the number of
+    categories changes the text.
+    """
+    conditions, params = list(conditions), []
+    if start is not None:
+        bound = "?::TIMESTAMP_LTZ"
+        conditions.append(f"{timestamp_column} >= {'DATE(' + bound + ')' if start_as_date else bound}")
+        params.append(start)
+    if categories:
+        conditions.append(f"PRODUCT_CATEGORY IN ({', '.join('?' * len(categories))})")
+        params.extend(categories)
+    if not conditions:
+        return "", ()
+    return "WHERE " + " AND ".join(conditions), tuple(params)
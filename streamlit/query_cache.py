@@ -0,0 +1,56 @@
+# 🍷 Les Caves d'Albert - Query result cache for the BI dashboard
+
+import time
+import threading
+
+
+class QueryCache:
+    """
+    Results of dashboard queries (pandas DataFrames), shared by every session of the app.
+
+    Entries are keyed by panel and filter state and expire after a per-panel TTL.
+    The whole cache is dropped when the data version changes, i.e. when the task
+    DAG has completed a new run since the results were fetched.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}  # key -> (expires_at, result)
+        self.data_version = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, ttl_seconds, load):
+        """Returns the cached result for `key`, or calls `load()` and caches it for `ttl_seconds`."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            # Filter states are numerous (period start changes every few minutes): drop expired entries
+            for expired in [k for k, (expires_at, _) in self._entries.items() if expires_at <= now]:
+                del self._entries[expired]
+        result = load()
+        with self._lock:
+            self._entries[key] = (now + ttl_seconds, result)
+        return result
+
+    def set_data_version(self, version):
+        """Drops every entry if `version` differs from the one the entries were fetched under."""
+        with self._lock:
+            if version == self.data_version:
+                return False
+            self.data_version = version
+            self._entries.clear()
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def hit_rate(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return self.hits / total if total else 0.0